@@ -8,14 +8,92 @@ class Settings(BaseSettings):
     ssh_timeout: int = 10
     proxy_host: str = "10.10.0.1"
     proxy_ssh_target: str = ""  # Docker: host.docker.internal
+    ssh_keepalive_interval: int = 30
+    ssh_keepalive_count_max: int = 3
+    ssh_pool_max_channels: int = 8  # sshd MaxSessions ist standardmäßig 10
+    ssh_pool_idle_timeout: int = 300
+    ssh_max_inflight: int = 48  # Gleichzeitige SSH-Befehle insgesamt
+    ssh_max_inflight_per_host: int = 8
+    ssh_breaker_threshold: int = 3  # Verbindungsfehler in Folge bis "offline"
+    ssh_breaker_backoff: int = 10  # Sekunden bis zur ersten Probe
+    ssh_breaker_backoff_max: int = 300
 
     # Pfade
     vps_hosts_file: str = "/etc/vps-hosts"
+    hosts_check_interval: float = 2.0  # Sekunden zwischen stat()-Prüfungen
     traefik_conf_dir: str = "/opt/traefik/conf.d"
     traefik_compose_dir: str = "/opt/traefik"
     templates_dir: str = "/opt/vps/templates"
+    templates_check_interval: float = 5.0  # Sekunden zwischen Prüfungen auf geänderte Templates
     authelia_config_dir: str = "/opt/authelia/config"
     vps_cli_config_dir: str = "/home/master/.config/vps-cli"
+    data_dir: str = "/home/master/.config/vps-cli/dashboard"  # Persistente Backend-Daten
+
+    # Fleet-Status (Hintergrund-Aktualisierung)
+    fleet_refresh_interval: int = 60  # Sekunden, 0 = deaktiviert
+    fleet_refresh_concurrency: int = 8
+    fleet_stale_after: int = 120  # Sekunden bis ein Eintrag als veraltet gilt
+    inventory_history_days: int = 30  # Aufbewahrung der Status-Historie
+
+    # Docker-Status (docker events pro Host)
+    docker_events_debounce: float = 0.3  # Sekunden, Events bis zum Neuabgleich sammeln
+    docker_state_resync: int = 300  # Sekunden, Abgleich auch ohne Events (Status-Texte)
+    docker_state_retry_max: int = 60  # Sekunden, maximaler Abstand zwischen Reconnects
+
+    docker_stream_idle: int = 30  # Sekunden, bis ein unbeobachteter Stats-/Log-Stream beendet wird
+    docker_log_backlog: int = 1000  # Zeilen pro Container für neue Zuschauer
+    docker_log_buffer: int = 2000  # Zeilen pro Zuschauer, darüber wird verworfen
+    docker_bulk_parallelism: int = 8  # Gleichzeitige Container-Aktionen bei Bulk-Operationen
+
+    # Task-Scheduler
+    task_max_workers: int = 6  # Gleichzeitig laufende Tasks insgesamt
+    task_type_limits: dict[str, int] = {
+        "update": 3,
+        "backup": 2,
+        "restore": 1,
+        "rollout": 1,
+        "docker_install": 2,
+        "netcup_install": 2,
+        "scan": 1,
+    }
+    task_exclusive_types: list[str] = [
+        "update", "deploy", "rollout", "restore", "backup", "docker_install",
+    ]  # Höchstens einer davon gleichzeitig pro Host
+    task_priorities: dict[str, int] = {  # Kleiner = früher
+        "upload": 0,
+        "docker_bulk": 0,
+        "deploy": 1,
+        "rollout": 1,
+        "restore": 1,
+        "docker_install": 2,
+        "netcup_install": 2,
+        "forget": 4,
+        "scan": 5,
+    }
+    task_default_priority: int = 3
+
+    # Task-Output (begrenzter Ring im Speicher, vollständig als gzip in data_dir/tasks)
+    task_output_ring_lines: int = 1000  # Zeilen pro Task im Speicher
+    task_output_ring_bytes: int = 256 * 1024  # Bytes pro Task im Speicher
+    task_log_flush_interval: float = 2.0  # Sekunden, höchstens so lange hinkt das gzip-Log hinterher
+    task_log_flush_bytes: int = 64 * 1024  # Ungeschriebene Bytes, ab denen sofort geflusht wird
+    task_ws_flush_interval: float = 0.05  # Sekunden, neue Zeilen bis zum Senden sammeln
+    task_ws_batch_lines: int = 500  # Zeilen pro WebSocket-Frame höchstens
+    task_subscriber_buffer: int = 5000  # Zeilen pro Live-Zuschauer, darüber greift die Policy
+    task_subscriber_overflow: str = "drop-oldest"  # oder "drop-newest", "disconnect": trennen
+    task_retention_hours: int = 24 * 7  # Abgeschlossene Tasks samt Log danach entfernen
+    task_sweep_interval: int = 600  # Sekunden zwischen Aufräumläufen, 0 = deaktiviert
+
+    # Image-Verteilung (einmal auf dem Proxy bauen/pullen, per SSH an die Hosts streamen)
+    image_distribution: bool = True
+    image_build_dir: str = "/opt/vps/build"  # Build-Kontexte auf dem Proxy
+    image_cache_dir: str = "/opt/vps/image-cache"  # docker save | gzip pro Image-ID auf dem Proxy
+    image_cache_days: int = 7
+    image_transfer_timeout: int = 1800
+
+    # Netzwerk-Scan
+    scan_interval: int = 0  # Sekunden zwischen inkrementellen Scans, 0 = deaktiviert
+    scan_remove_after: int = 3  # Verpasste Scans, bis ein vom Scan entdeckter Host entfernt wird
 
     # Netcup API
     netcup_base_url: str = "https://www.servercontrolpanel.de/scp-core"
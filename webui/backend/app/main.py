@@ -1,8 +1,39 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import settings
-from .routers import vps, docker, traefik, routes, deploy, netcup, backup, authelia, tasks, terminal, system
+from .routers import vps, docker, docker_stats, docker_logs, traefik, routes, deploy, netcup, backup, authelia, tasks, terminal, system
+from .services.docker_logs import docker_logs as docker_logs_hub
+from .services.docker_state import docker_state
+from .services.docker_stats import docker_stats as docker_stats_hub
+from .services.fleet_status import fleet_status
+from .services.inventory import inventory
+from .services.network_scan import scan_scheduler
+from .services.ssh_pool import ssh_pool
+from .services.task_manager import task_manager
+from .services.template_parser import template_catalog
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    template_catalog.load()
+    fleet_status.start()
+    scan_scheduler.start()
+    docker_state.start()
+    task_manager.start()
+    yield
+    task_manager.stop()
+    docker_state.stop()
+    docker_stats_hub.stop()
+    docker_logs_hub.stop()
+    scan_scheduler.stop()
+    await fleet_status.stop()
+    inventory.close()
+    # Gepoolte SSH-Verbindungen sauber schließen
+    await ssh_pool.close_all()
+
 
 app = FastAPI(
     title="VPS Dashboard API",
@@ -10,6 +41,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS für Entwicklung (Frontend auf anderem Port)
@@ -24,6 +56,8 @@ app.add_middleware(
 # Router einbinden
 app.include_router(vps.router, prefix=settings.api_prefix)
 app.include_router(docker.router, prefix=settings.api_prefix)
+app.include_router(docker_stats.router, prefix=settings.api_prefix)
+app.include_router(docker_logs.router, prefix=settings.api_prefix)
 app.include_router(traefik.router, prefix=settings.api_prefix)
 app.include_router(routes.router, prefix=settings.api_prefix)
 app.include_router(deploy.router, prefix=settings.api_prefix)
@@ -9,12 +9,32 @@ class TemplateVariable(BaseModel):
     condition: str = ""  # z.B. "ENABLE_AI=j"
 
 
+class TemplateProfile(BaseModel):
+    variable: str
+    value: str
+    profile: str  # aktiv, wenn variable == value
+
+
+class TemplateRoute(BaseModel):
+    domain_var: str  # Variable mit der Domain, z.B. AI_DOMAIN
+    port: int
+
+
 class Template(BaseModel):
     name: str
+    directory: str = ""  # Verzeichnisname unter templates_dir
     description: str = ""
+    deploy_dir: str = ""
+    requires_docker: bool = False
+    requires_route: bool = False
+    route_port: int | None = None
+    additional_routes: list[TemplateRoute] = []
     variables: list[TemplateVariable] = []
     has_authelia: bool = False
     profiles: list[str] = []
+    profile_rules: list[TemplateProfile] = []
+    defaults: dict[str, str] = {}  # TEMPLATE_DEFAULTS
+    authelia_vars: dict[str, str] = {}  # AUTHELIA_TEMPLATE_VARS aus authelia.conf
 
 
 class DeployRequest(BaseModel):
@@ -24,9 +44,56 @@ class DeployRequest(BaseModel):
     auth: bool = False
 
 
+class HostSelector(BaseModel):
+    name: str = ""  # Glob auf den Hostnamen, z.B. "web-*"
+    labels: dict[str, str] = {}  # alle Labels müssen passen
+
+
+class RolloutRequest(BaseModel):
+    template: str
+    hosts: list[str] = []  # Name oder IP; leer = selector
+    selector: HostSelector | None = None  # Auswahl aus den managed Hosts
+    vars: dict[str, str] = {}
+    host_vars: dict[str, dict[str, str]] = {}  # pro Host, überschreibt vars
+    auth: bool = False
+    canary: int = 1  # Hosts, die zuerst allein laufen
+    max_parallel: int = 4
+    max_failures: int = 0  # mehr Fehler halten den Rollout an
+    health_timeout: int = 180  # 0 = kein Health-Gate
+
+
+class ServiceChange(BaseModel):
+    service: str
+    action: str  # create, recreate, remove, unchanged
+    reason: str = ""  # neu, config, dateien, fehlt, entfernt
+
+
+class DeployPlan(BaseModel):
+    host: str
+    template: str
+    deploy_dir: str
+    bundle: str  # Inhalts-Hash des gerenderten Templates
+    first_deploy: bool = False  # kein Manifest auf dem Host
+    transfer: bool = True  # Dateien müssen übertragen werden
+    unchanged: bool = False  # nichts zu tun
+    profiles: list[str] = []
+    services: list[ServiceChange] = []
+
+
+class DeploymentService(BaseModel):
+    name: str
+    container: str = ""
+    image: str = ""
+    state: str = ""  # running, exited, ...
+    status: str = ""  # z.B. "Up 2 hours (healthy)"
+    health: str = ""  # healthy, unhealthy, starting oder leer
+
+
 class Deployment(BaseModel):
     app: str
     host: str
     template: str = ""
     status: str = ""
-    containers: int = 0
+    containers: int = 0  # laufende Container
+    deploy_dir: str = ""
+    services: list[DeploymentService] = []
@@ -1,3 +1,5 @@
+from enum import Enum
+
 from pydantic import BaseModel
 
 
@@ -9,6 +11,7 @@ class Container(BaseModel):
     state: str
     ports: str = ""
     created: str = ""
+    project: str = ""  # Compose-Projekt (Label com.docker.compose.project)
 
 
 class DockerOverview(BaseModel):
@@ -18,3 +21,47 @@ class DockerOverview(BaseModel):
     containers: list[Container] = []
     running: int = 0
     stopped: int = 0
+
+
+class ContainerStats(BaseModel):
+    """Ressourcen eines Containers, gemittelt über ein Zeitfenster (resolution Sekunden)."""
+    host: str
+    container: str
+    time: float  # Beginn des Fensters (Unix-Zeit)
+    resolution: int
+    cpu_percent: float = 0.0
+    memory_used: int = 0  # Bytes
+    memory_limit: int = 0
+    memory_percent: float = 0.0
+    net_rx: int = 0  # Bytes seit Containerstart
+    net_tx: int = 0
+    block_read: int = 0
+    block_write: int = 0
+    pids: int = 0
+
+
+class ContainerSelector(BaseModel):
+    hosts: list[str] = []  # leer = alle managed Hosts
+    project: str = ""  # Compose-Projekt
+    name: str = ""  # Glob, z.B. "app-*"
+    image: str = ""  # Glob, z.B. "nginx:*"
+
+
+class BulkAction(str, Enum):
+    start = "start"
+    stop = "stop"
+    restart = "restart"
+    pull = "pull"
+    remove = "remove"
+
+
+class BulkRequest(BaseModel):
+    selector: ContainerSelector
+    action: BulkAction
+
+
+class BulkTarget(BaseModel):
+    host: str
+    container: str
+    image: str = ""
+    state: str = ""
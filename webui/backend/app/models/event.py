@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class Event(BaseModel):
+    id: int
+    type: str
+    time: str
+    data: dict = {}
@@ -7,6 +7,7 @@ class TaskStatus(str, Enum):
     running = "running"
     completed = "completed"
     failed = "failed"
+    interrupted = "interrupted"  # Backend wurde während des Tasks neu gestartet
 
 
 class TaskInfo(BaseModel):
@@ -19,6 +20,7 @@ class TaskInfo(BaseModel):
     finished_at: str = ""
     exit_code: int | None = None
     output_lines: int = 0
+    queue_position: int | None = None  # Nur für wartende Tasks
 
 
 class TaskCreate(BaseModel):
@@ -7,6 +7,25 @@ class VPS(BaseModel):
     ip: str
     description: str = ""
     managed: bool = True
+    netcup_id: str = ""
+    labels: dict[str, str] = {}
+    last_seen: str = ""
+    source: str = "manual"  # manual = von Hand/Netcup angelegt, scan = vom Scan entdeckt
+
+
+class HostFacts(BaseModel):
+    """Rohwerte eines Hosts aus einem einzigen Probe-Aufruf."""
+    hostname: str = ""
+    kernel: str = ""
+    cpus: int = 0
+    uptime_seconds: int = 0
+    load: list[float] = []  # 1, 5, 15 Minuten
+    memory_used: int = 0  # Bytes
+    memory_total: int = 0
+    disk_used: int = 0
+    disk_total: int = 0
+    updates_available: int = 0
+    reboot_required: bool = False
 
 
 class VPSStatus(BaseModel):
@@ -21,6 +40,54 @@ class VPSStatus(BaseModel):
     memory_total: str = ""
     disk_used: str = ""
     disk_total: str = ""
+    facts: HostFacts | None = None
+    error: str = ""  # z.B. "offline (zuletzt gesehen ...)"
+
+
+class FleetHostStatus(BaseModel):
+    status: VPSStatus
+    updated_at: str = ""
+    age_seconds: float | None = None  # None = noch nie abgefragt
+    stale: bool = True
+    refreshing: bool = False
+
+
+class FleetStatus(BaseModel):
+    generated_at: str
+    refresh_interval: int
+    hosts: list[FleetHostStatus] = []
+
+
+class StatusHistoryEntry(BaseModel):
+    time: str
+    online: bool
+    load: float | None = None
+    memory_used: int | None = None
+    memory_total: int | None = None
+    disk_used: int | None = None
+    disk_total: int | None = None
+    updates_available: int | None = None
+    error: str = ""
+
+
+class ScanChange(BaseModel):
+    ip: str
+    name: str
+    managed: bool = True
+    old_name: str = ""
+    old_ip: str = ""
+    missed_scans: int = 0
+    applied: bool = True  # False = nur gemeldet (manueller Eintrag oder noch nicht oft genug verpasst)
+
+
+class ScanDiff(BaseModel):
+    mode: str  # full | incremental
+    started_at: str
+    finished_at: str = ""
+    added: list[ScanChange] = []
+    removed: list[ScanChange] = []
+    renamed: list[ScanChange] = []
+    unchanged: int = 0
 
 
 class ExecRequest(BaseModel):
@@ -1,20 +1,27 @@
-import os
 import json
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from ..config import settings
 from ..dependencies import get_current_user
-from ..models.deploy import Template, DeployRequest, Deployment
+from ..models.deploy import Template, DeployPlan, DeployRequest, Deployment, RolloutRequest
 from ..models.task import TaskCreate
-from ..services.hosts import resolve_host
-from ..services.ssh import run_ssh, run_ssh_stream
+from ..services.deployer import deploy_host, plan_deploy
+from ..services.deployments import deployment_cache
+from ..services.hosts import host_registry, resolve_host
+from ..services.rollout import host_values, resolve_targets, run_rollout
+from ..services.ssh import run_ssh
 from ..services.task_manager import task_manager
-from ..services.template_parser import list_templates, parse_template_conf
+from ..services.template_engine import TemplateError, template_engine
+from ..services.template_parser import list_templates, template_catalog
 
 router = APIRouter(prefix="/deploy", tags=["Deploy"])
 
 
+def _invalidate_deployments(host: str) -> None:
+    vps = host_registry.find(host)
+    deployment_cache.invalidate(vps.name if vps else host)
+
+
 @router.get("/templates", response_model=list[Template])
 async def get_templates(user: str = Depends(get_current_user)):
     """Verfügbare Templates auflisten."""
@@ -24,14 +31,8 @@ async def get_templates(user: str = Depends(get_current_user)):
 @router.get("/templates/{name}", response_model=Template)
 async def get_template(name: str, user: str = Depends(get_current_user)):
     """Template-Details abrufen."""
-    # Erst direkt nach Verzeichnisname suchen
-    template_dir = os.path.join(settings.templates_dir, name)
-    template = parse_template_conf(template_dir)
+    template = template_catalog.find(name)
     if not template:
-        # Fallback: case-insensitive nach Verzeichnis- oder Template-Name suchen
-        for t in list_templates():
-            if t.name.lower() == name.lower():
-                return t
         raise HTTPException(status_code=404, detail=f"Template '{name}' nicht gefunden")
     return template
 
@@ -43,41 +44,30 @@ async def list_deployments(host: str, user: str = Depends(get_current_user)):
     if not ip:
         raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
 
-    # Suche nach Docker-Compose-Projekten in /opt/
-    code, stdout, _ = await run_ssh(
-        ip,
-        "for d in /opt/*/docker-compose.yml; do [ -f \"$d\" ] && dirname \"$d\"; done 2>/dev/null",
-        timeout=10,
-    )
+    # Ein Aufruf für alle Compose-Projekte in /opt/ inkl. Service-Status
+    vps = host_registry.find(host)
+    deployments = await deployment_cache.list(vps.name if vps else host, ip)
+    return [d.model_copy(update={"host": host}) for d in deployments]
 
-    deployments = []
-    if code == 0 and stdout:
-        for deploy_dir in stdout.strip().split("\n"):
-            if not deploy_dir.strip():
-                continue
-            app_name = os.path.basename(deploy_dir)
-
-            # Container-Anzahl prüfen
-            rc, count_str, _ = await run_ssh(
-                ip,
-                f"cd {deploy_dir} && sudo docker compose ps -q 2>/dev/null | wc -l",
-                timeout=10,
-            )
-            try:
-                container_count = int(count_str.strip()) if rc == 0 else 0
-            except ValueError:
-                container_count = 0
-
-            deployments.append(
-                Deployment(
-                    app=app_name,
-                    host=host,
-                    status="running" if container_count > 0 else "stopped",
-                    containers=container_count,
-                )
-            )
 
-    return deployments
+@router.post("/plan", response_model=DeployPlan)
+async def plan_template(req: DeployRequest, user: str = Depends(get_current_user)):
+    """Zeigt, welche Services ein Deploy neu erstellen würde (ohne etwas zu ändern)."""
+    ip = resolve_host(req.host)
+    if not ip:
+        raise HTTPException(status_code=404, detail=f"Host '{req.host}' nicht gefunden")
+
+    template = template_catalog.find(req.template)
+    if not template:
+        raise HTTPException(status_code=404, detail=f"Template '{req.template}' nicht gefunden")
+
+    try:
+        plan, _, _, _ = await plan_deploy(req.host, ip, template, req.vars, req.auth)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return plan
 
 
 @router.post("/", response_model=TaskCreate)
@@ -87,123 +77,26 @@ async def deploy_template(req: DeployRequest, user: str = Depends(get_current_us
     if not ip:
         raise HTTPException(status_code=404, detail=f"Host '{req.host}' nicht gefunden")
 
-    template_dir = os.path.join(settings.templates_dir, req.template)
-    template = parse_template_conf(template_dir)
-    if not template:
-        # Fallback: case-insensitive nach Verzeichnis- oder Template-Name suchen
-        for entry in os.listdir(settings.templates_dir):
-            entry_dir = os.path.join(settings.templates_dir, entry)
-            if entry.lower() == req.template.lower():
-                template_dir = entry_dir
-                template = parse_template_conf(template_dir)
-                break
-            t = parse_template_conf(entry_dir)
-            if t and t.name.lower() == req.template.lower():
-                template_dir = entry_dir
-                template = t
-                break
+    template = template_catalog.find(req.template)
     if not template:
         raise HTTPException(status_code=404, detail=f"Template '{req.template}' nicht gefunden")
 
+    # Vor dem Start rendern: fehlende Werte/Platzhalter brechen ohne SSH ab
+    try:
+        template_engine.render(template_catalog.path(template), template, req.vars, ip, req.auth)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     async def do_deploy(task_id: str):
         await task_manager.push_output(
             task_id, f"Deploye {req.template} auf {req.host} ({ip})..."
         )
 
-        # Deploy-Verzeichnis aus template.conf lesen
-        conf_path = os.path.join(template_dir, "template.conf")
-        deploy_dir = f"/opt/{req.template}"
-        with open(conf_path, "r") as f:
-            for line in f:
-                if line.startswith("TEMPLATE_DEPLOY_DIR="):
-                    deploy_dir = line.split("=", 1)[1].strip().strip('"')
-                    break
-
-        # Verzeichnis erstellen
-        await task_manager.push_output(task_id, f"Erstelle Verzeichnis {deploy_dir}...")
-        await run_ssh(ip, f"sudo mkdir -p {deploy_dir} && sudo chown master:master {deploy_dir}")
-
-        # docker-compose.yml übertragen
-        compose_src = os.path.join(template_dir, "docker-compose.yml")
-        if os.path.exists(compose_src):
-            with open(compose_src, "r") as f:
-                compose_content = f.read()
-
-            # Variablen ersetzen
-            for key, value in req.vars.items():
-                compose_content = compose_content.replace(f"{{{{{key}}}}}", value)
-
-            await task_manager.push_output(task_id, "Übertrage docker-compose.yml...")
-            # .env-Datei mit Variablen erstellen
-            env_lines = [f"{k}={v}" for k, v in req.vars.items()]
-            env_content = "\n".join(env_lines) + "\n"
-
-            await run_ssh(ip, f"cat > {deploy_dir}/.env << 'ENVEOF'\n{env_content}ENVEOF")
-            await run_ssh(ip, f"cat > {deploy_dir}/docker-compose.yml << 'COMPEOF'\n{compose_content}COMPEOF")
-
-        # Docker Compose starten
-        await task_manager.push_output(task_id, "Starte Container...")
-        async for line in run_ssh_stream(ip, f"cd {deploy_dir} && sudo docker compose up -d"):
+        async def emit(line: str) -> None:
             await task_manager.push_output(task_id, line)
 
-        # Route erstellen wenn benötigt
-        domain = req.vars.get("DOMAIN", "")
-        if domain:
-            await task_manager.push_output(task_id, f"Erstelle Route für {domain}...")
-            route_name = domain.replace(".", "-")
-            route_template = "route-auth.yml.template" if req.auth else "route.yml.template"
-            route_src = os.path.join(settings.templates_dir, "..", "templates", "traefik", route_template)
-
-            # Einfache Route direkt erstellen
-            port = "8000"
-            with open(conf_path, "r") as f:
-                for line in f:
-                    if line.startswith("TEMPLATE_ROUTE_PORT="):
-                        port = line.split("=", 1)[1].strip().strip('"')
-                        break
-
-            if req.auth:
-                route_content = f"""http:
-  routers:
-    {route_name}:
-      rule: "Host(`{domain}`)"
-      entryPoints:
-        - websecure
-      service: {route_name}
-      middlewares:
-        - authelia
-      tls:
-        certResolver: letsencrypt
-
-  services:
-    {route_name}:
-      loadBalancer:
-        servers:
-          - url: "http://{ip}:{port}"
-"""
-            else:
-                route_content = f"""http:
-  routers:
-    {route_name}:
-      rule: "Host(`{domain}`)"
-      entryPoints:
-        - websecure
-      service: {route_name}
-      tls:
-        certResolver: letsencrypt
-
-  services:
-    {route_name}:
-      loadBalancer:
-        servers:
-          - url: "http://{ip}:{port}"
-"""
-
-            route_file = os.path.join(settings.traefik_conf_dir, f"{route_name}.yml")
-            with open(route_file, "w") as f:
-                f.write(route_content)
-            await task_manager.push_output(task_id, f"Route {domain} erstellt.")
-
+        await deploy_host(req.host, ip, template, req.vars, req.auth, emit)
+        _invalidate_deployments(req.host)
         await task_manager.push_output(task_id, "Deployment abgeschlossen.")
 
     task_id = task_manager.create_task(
@@ -215,6 +108,52 @@ async def deploy_template(req: DeployRequest, user: str = Depends(get_current_us
     return TaskCreate(task_id=task_id)
 
 
+@router.post("/rollout", response_model=TaskCreate)
+async def rollout_template(req: RolloutRequest, user: str = Depends(get_current_user)):
+    """Template auf mehrere Hosts deployen (Canary, dann parallel im Fenster)."""
+    template = template_catalog.find(req.template)
+    if not template:
+        raise HTTPException(status_code=404, detail=f"Template '{req.template}' nicht gefunden")
+    if req.canary < 0 or req.max_parallel < 1 or req.max_failures < 0 or req.health_timeout < 0:
+        raise HTTPException(status_code=400, detail="Ungültige Rollout-Parameter")
+
+    if not req.hosts and not (req.selector and (req.selector.name or req.selector.labels)):
+        raise HTTPException(status_code=400, detail="hosts oder selector (name/labels) angeben")
+    targets, unknown = resolve_targets(req)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Hosts nicht gefunden: {', '.join(unknown)}")
+    if not targets:
+        raise HTTPException(status_code=400, detail="Keine Hosts ausgewählt")
+
+    # Alle Hosts vorab rendern, damit fehlende Werte vor dem ersten Deploy auffallen
+    domains: dict[str, str] = {}
+    for host, ip in targets:
+        try:
+            rendered = template_engine.render(
+                template_catalog.path(template), template, host_values(req, host), ip, req.auth
+            )
+        except TemplateError as e:
+            raise HTTPException(status_code=400, detail=f"{host}: {e}")
+        domain = rendered.values.get("DOMAIN", "")
+        if domain and domain in domains:
+            raise HTTPException(
+                status_code=400,
+                detail=f"DOMAIN {domain} für {domains[domain]} und {host} — per host_vars trennen",
+            )
+        domains[domain] = host
+
+    async def do_rollout(task_id: str):
+        await run_rollout(task_id, req, template, targets)
+
+    task_id = task_manager.create_task(
+        "rollout",
+        f"{req.template} auf {len(targets)} Hosts",
+        coro_factory=do_rollout,
+        hosts=[host for host, _ in targets],
+    )
+    return TaskCreate(task_id=task_id)
+
+
 @router.delete("/{host}/{app}")
 async def remove_deployment(
     host: str, app: str, user: str = Depends(get_current_user)
@@ -232,5 +171,6 @@ async def remove_deployment(
 
     # Verzeichnis entfernen
     await run_ssh(ip, f"sudo rm -rf {deploy_dir}")
+    _invalidate_deployments(host)
 
     return {"message": f"Deployment {app} auf {host} entfernt"}
@@ -1,77 +1,60 @@
-import asyncio
-import json
-
 from fastapi import APIRouter, Depends, HTTPException
 
 from ..dependencies import get_current_user
-from ..models.docker import Container, DockerOverview
+from ..models.docker import BulkRequest, BulkTarget, Container, ContainerSelector, DockerOverview
 from ..models.task import TaskCreate
-from ..services.hosts import parse_hosts_file, resolve_host
-from ..services.ssh import run_ssh, run_ssh_stream, check_host_online
+from ..services.docker_bulk import run_bulk, select_containers
+from ..services.docker_state import docker_state, parse_containers
+from ..services.hosts import host_registry, resolve_host
+from ..services.ssh import run_ssh, run_ssh_stream
 from ..services.task_manager import task_manager
 
 router = APIRouter(prefix="/docker", tags=["Docker"])
 
 
+def _refresh_state(host: str) -> None:
+    """Abgleich anstoßen, falls der Event-Stream gerade nicht verbunden ist."""
+    vps = host_registry.find(host)
+    if vps:
+        docker_state.refresh(vps.name)
+
+
 @router.get("/", response_model=list[DockerOverview])
 async def docker_overview(user: str = Depends(get_current_user)):
-    """Docker-Übersicht aller VPS."""
-    hosts = parse_hosts_file()
-    results = []
+    """Docker-Übersicht aller VPS (aus dem Speicher, aktuell gehalten über docker events)."""
+    return await docker_state.overview()
 
-    async def check_docker(vps):
-        online = await check_host_online(vps.ip)
-        if not online:
-            return DockerOverview(host=vps.name, online=False)
 
-        code, _, _ = await run_ssh(vps.ip, "command -v docker", timeout=5)
-        if code != 0:
-            return DockerOverview(host=vps.name, online=True, docker_installed=False)
-
-        code, stdout, _ = await run_ssh(
-            vps.ip, "sudo docker ps -a --format json", timeout=10
-        )
-        containers = []
-        running = 0
-        stopped = 0
-        if code == 0 and stdout:
-            for line in stdout.strip().split("\n"):
-                if not line.strip():
-                    continue
-                try:
-                    c = json.loads(line)
-                    state = c.get("State", "")
-                    if state == "running":
-                        running += 1
-                    else:
-                        stopped += 1
-                    containers.append(
-                        Container(
-                            id=c.get("ID", ""),
-                            name=c.get("Names", ""),
-                            image=c.get("Image", ""),
-                            status=c.get("Status", ""),
-                            state=state,
-                            ports=c.get("Ports", ""),
-                            created=c.get("CreatedAt", ""),
-                        )
-                    )
-                except json.JSONDecodeError:
-                    continue
-
-        return DockerOverview(
-            host=vps.name,
-            online=True,
-            docker_installed=True,
-            containers=containers,
-            running=running,
-            stopped=stopped,
-        )
-
-    tasks = [check_docker(vps) for vps in hosts]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    return [r for r in results if isinstance(r, DockerOverview)]
+def _select(selector: ContainerSelector):
+    if not (selector.hosts or selector.project or selector.name or selector.image):
+        raise HTTPException(status_code=400, detail="Selector darf nicht leer sein")
+    return select_containers(selector)
+
+
+@router.post("/bulk/preview", response_model=list[BulkTarget])
+async def bulk_preview(selector: ContainerSelector, user: str = Depends(get_current_user)):
+    """Zeigt, welche Container ein Selector trifft (ohne Aktion)."""
+    return [target for _, _, target in _select(selector)]
+
+
+@router.post("/bulk", response_model=TaskCreate)
+async def bulk_action(req: BulkRequest, user: str = Depends(get_current_user)):
+    """Aktion auf allen passenden Containern ausführen (Background-Task)."""
+    targets = _select(req.selector)
+    if not targets:
+        raise HTTPException(status_code=400, detail="Keine passenden Container gefunden")
+
+    async def do_bulk(task_id: str):
+        await run_bulk(task_id, req.action, targets)
+
+    hosts = sorted({host for host, _, _ in targets})
+    task_id = task_manager.create_task(
+        "docker_bulk",
+        f"Container {req.action.value} ({len(targets)} auf {len(hosts)} Host(s))",
+        host=hosts[0] if len(hosts) == 1 else "",
+        coro_factory=do_bulk,
+    )
+    return TaskCreate(task_id=task_id)
 
 
 @router.get("/{host}", response_model=list[Container])
@@ -81,32 +64,19 @@ async def list_containers(host: str, user: str = Depends(get_current_user)):
     if not ip:
         raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
 
-    code, stdout, _ = await run_ssh(ip, "sudo docker ps -a --format json", timeout=10)
-    if code != 0:
-        raise HTTPException(status_code=500, detail="Docker nicht verfügbar")
+    vps = host_registry.find(host)
+    state = docker_state.get(vps.name) if vps else None
+    if state is None:
+        # Nicht überwachter Host (z.B. Proxy): direkt abfragen
+        code, stdout, _ = await run_ssh(ip, "sudo docker ps -a --format json", timeout=10)
+        if code != 0:
+            raise HTTPException(status_code=500, detail="Docker nicht verfügbar")
+        return parse_containers(stdout)
 
-    containers = []
-    if stdout:
-        for line in stdout.strip().split("\n"):
-            if not line.strip():
-                continue
-            try:
-                c = json.loads(line)
-                containers.append(
-                    Container(
-                        id=c.get("ID", ""),
-                        name=c.get("Names", ""),
-                        image=c.get("Image", ""),
-                        status=c.get("Status", ""),
-                        state=c.get("State", ""),
-                        ports=c.get("Ports", ""),
-                        created=c.get("CreatedAt", ""),
-                    )
-                )
-            except json.JSONDecodeError:
-                continue
-
-    return containers
+    await docker_state.wait_ready([state.name])
+    if not state.online or not state.docker_installed:
+        raise HTTPException(status_code=500, detail="Docker nicht verfügbar")
+    return state.containers
 
 
 @router.post("/{host}/install", response_model=TaskCreate)
@@ -115,6 +85,7 @@ async def install_docker(host: str, user: str = Depends(get_current_user)):
     ip = resolve_host(host)
     if not ip:
         raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
+    vps = host_registry.find(host)
 
     install_script = """
 set -e
@@ -145,6 +116,8 @@ docker compose version
         async for line in run_ssh_stream(ip, install_script):
             await task_manager.push_output(task_id, line)
         await task_manager.push_output(task_id, "Docker-Installation abgeschlossen.")
+        if vps:
+            docker_state.restart(vps.name)
 
     task_id = task_manager.create_task(
         "docker_install",
@@ -167,6 +140,7 @@ async def start_container(
     code, stdout, stderr = await run_ssh(ip, f"sudo docker start {container}")
     if code != 0:
         raise HTTPException(status_code=500, detail=stderr or "Fehler beim Starten")
+    _refresh_state(host)
     return {"message": f"Container '{container}' gestartet"}
 
 
@@ -182,4 +156,5 @@ async def stop_container(
     code, stdout, stderr = await run_ssh(ip, f"sudo docker stop {container}")
     if code != 0:
         raise HTTPException(status_code=500, detail=stderr or "Fehler beim Stoppen")
+    _refresh_state(host)
     return {"message": f"Container '{container}' gestoppt"}
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+
+from ..config import settings
+from ..dependencies import get_current_user
+from ..services.docker_logs import LogFilter, LogSubscriber, docker_logs, parse_since, read_logs
+from ..services.hosts import host_registry, resolve_host
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/docker", tags=["Docker"])
+
+
+@router.get("/{host}/{container}/logs")
+async def container_logs(
+    host: str,
+    container: str,
+    tail: int = Query(default=200, ge=0, le=5000),
+    since: str = Query(default="", description="z.B. 10m oder 2024-01-01T12:00:00Z"),
+    until: str = Query(default="", description="wie since"),
+    grep: str = Query(default="", description="Regex"),
+    level: str = Query(default="", description="Mindest-Level: trace, debug, info, warn, error, fatal"),
+    user: str = Depends(get_current_user),
+):
+    """Container-Logs lesen (ohne Follow), serverseitig gefiltert."""
+    ip = resolve_host(host)
+    if not ip:
+        raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
+    try:
+        log_filter = LogFilter(grep, level, since)
+        until_time = parse_since(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    code, entries, error = await read_logs(ip, container, log_filter, tail, until_time)
+    if code != 0:
+        raise HTTPException(status_code=500, detail=error or "Logs nicht lesbar")
+    return {"host": host, "container": container, "lines": entries}
+
+
+@router.websocket("/logs/ws/{host}/{container}")
+async def container_logs_websocket(websocket: WebSocket, host: str, container: str):
+    """WebSocket für Live-Logs eines Containers (Follow).
+
+    Query-Params: tail, since, grep, level. Alle Zuschauer eines Containers
+    teilen sich einen `docker logs -f`. Kommt ein Zuschauer nicht hinterher,
+    werden Zeilen verworfen und als {"type": "dropped"} gemeldet.
+    """
+    await websocket.accept()
+
+    remote_user = websocket.headers.get("remote-user", "")
+    if not remote_user:
+        logger.debug("Kein Remote-User Header — Dev-Modus")
+
+    ip = resolve_host(host)
+    if not ip:
+        await websocket.send_json({"type": "error", "message": f"Unbekannter Host: {host}"})
+        await websocket.close()
+        return
+
+    params = websocket.query_params
+    try:
+        tail = max(0, int(params.get("tail", "100")))
+        log_filter = LogFilter(params.get("grep", ""), params.get("level", ""), params.get("since", ""))
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close()
+        return
+
+    vps = host_registry.find(host)
+    stream = docker_logs.stream(vps.name if vps else host, ip, container)
+    subscriber = LogSubscriber(log_filter, settings.docker_log_buffer)
+    await stream.subscribe(subscriber, tail)
+
+    receiver = asyncio.create_task(websocket.receive_text())
+    getter = asyncio.create_task(subscriber.next_batch())
+    try:
+        while True:
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # Eingehende Nachrichten werden ignoriert, nur das Schließen zählt
+                receiver.result()
+                receiver = asyncio.create_task(websocket.receive_text())
+            if getter in done:
+                _, lines, dropped = getter.result()
+                if dropped:
+                    await websocket.send_json({"type": "dropped", "count": dropped})
+                if lines:
+                    await websocket.send_json({"type": "lines", "data": lines})
+                if subscriber.closed:
+                    await websocket.send_json({"type": "status", "status": "closed"})
+                    await websocket.close()
+                    break
+                getter = asyncio.create_task(subscriber.next_batch())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        stream.unsubscribe(subscriber)
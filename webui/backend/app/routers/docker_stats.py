@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from ..services.docker_stats import RESOLUTIONS, docker_stats
+from ..services.hosts import host_registry, parse_hosts_file, resolve_host
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/docker", tags=["Docker"])
+
+
+@router.websocket("/stats/ws")
+async def docker_stats_websocket(websocket: WebSocket):
+    """WebSocket für Container-Ressourcen (CPU, RAM, Netz, Block-IO).
+
+    Query-Params: host (leer = alle managed Hosts), resolution (1, 10 oder 60 Sekunden).
+    Zuerst kommt die vorhandene Historie, danach jedes abgeschlossene Zeitfenster.
+    """
+    await websocket.accept()
+
+    remote_user = websocket.headers.get("remote-user", "")
+    if not remote_user:
+        logger.debug("Kein Remote-User Header — Dev-Modus")
+
+    try:
+        resolution = int(websocket.query_params.get("resolution", "10"))
+    except ValueError:
+        resolution = 0
+    if resolution not in RESOLUTIONS:
+        await websocket.send_json({
+            "type": "error",
+            "message": f"Ungültige Auflösung, erlaubt: {', '.join(map(str, RESOLUTIONS))}",
+        })
+        await websocket.close()
+        return
+
+    host = websocket.query_params.get("host", "")
+    if host:
+        ip = resolve_host(host)
+        if not ip:
+            await websocket.send_json({"type": "error", "message": f"Unbekannter Host: {host}"})
+            await websocket.close()
+            return
+        vps = host_registry.find(host)
+        targets = [(vps.name if vps else host, ip)]
+    else:
+        targets = [(h.name, h.ip) for h in parse_hosts_file() if h.managed]
+
+    # Eine Queue für alle Hosts; jeder Stream liefert Batches abgeschlossener Fenster
+    queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+    streams = [docker_stats.stream(name, ip) for name, ip in targets]
+    try:
+        history = [p.model_dump() for s in streams for p in s.history(resolution)]
+        await websocket.send_json({"type": "history", "resolution": resolution, "data": history})
+        for stream in streams:
+            stream.subscribe(queue, resolution)
+
+        # Eingehende Nachrichten werden nur gelesen, um das Schließen zu erkennen
+        receiver = asyncio.create_task(websocket.receive_text())
+        getter = asyncio.create_task(queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {getter, receiver}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if receiver in done:
+                    receiver.result()
+                    receiver = asyncio.create_task(websocket.receive_text())
+                if getter in done:
+                    await websocket.send_json({
+                        "type": "samples",
+                        "resolution": resolution,
+                        "data": [p.model_dump() for p in getter.result()],
+                    })
+                    getter = asyncio.create_task(queue.get())
+        finally:
+            receiver.cancel()
+            getter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for stream in streams:
+            stream.unsubscribe(queue)
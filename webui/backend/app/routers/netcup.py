@@ -8,6 +8,8 @@ from ..config import settings
 from ..dependencies import get_current_user
 from ..models.netcup import DeviceCodeResponse, LoginStatus, Server, InstallRequest
 from ..models.task import TaskCreate
+from ..services.hosts import host_registry, write_hosts_file
+from ..services.inventory import inventory
 from ..services.netcup_api import netcup_api
 from ..services.ssh import run_ssh
 from ..services.task_manager import task_manager
@@ -49,26 +51,19 @@ async def list_servers(user: str = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
-    # vps-hosts direkt lesen (im Container gemountet)
-    vlan_map = {}
-    try:
-        with open(settings.vps_hosts_file) as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                parts = line.split(None, 1)
-                if len(parts) == 2:
-                    vlan_map[parts[1]] = parts[0]
-    except FileNotFoundError:
-        logger.warning("vps-hosts nicht gefunden: %s", settings.vps_hosts_file)
-
-    # Jeden Server mit vlanIp anreichern (Match über nickname oder hostname)
+    # Jeden Server mit vlanIp anreichern: erst über die gespeicherte
+    # Netcup-ID, sonst über nickname/hostname (Zuordnung wird gemerkt)
     for server in servers:
-        nickname = server.get("nickname", "")
-        hostname = server.get("hostname", "")
-        vlan_ip = vlan_map.get(nickname) or vlan_map.get(hostname) or ""
-        server["vlanIp"] = vlan_ip
+        server_id = str(server.get("id", ""))
+        entry = inventory.by_netcup_id(server_id) if server_id else None
+        if entry is None:
+            entry = (
+                host_registry.by_name(server.get("nickname", ""))
+                or host_registry.by_name(server.get("hostname", ""))
+            )
+            if entry and server_id:
+                inventory.set_netcup_id(entry.name, server_id)
+        server["vlanIp"] = entry.ip if entry else ""
 
     return servers
 
@@ -104,22 +99,20 @@ async def change_server_state(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _used_vlan_octets() -> set[int]:
+    """Belegte letzte Oktette im CloudVLAN 10.10.0.0/24 (Proxy = .1)."""
+    used_octets = {1}
+    for h in host_registry.hosts():
+        m = re.match(r"^10\.10\.0\.(\d+)$", h.ip)
+        if m:
+            used_octets.add(int(m.group(1)))
+    return used_octets
+
+
 @router.get("/vlan/next-ip")
 async def next_vlan_ip(user: str = Depends(get_current_user)):
     """Nächste freie CloudVLAN-IP ermitteln."""
-    used_octets = {1}
-    try:
-        with open(settings.vps_hosts_file) as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                ip = line.split()[0] if line.split() else ""
-                m = re.match(r"^10\.10\.0\.(\d+)$", ip)
-                if m:
-                    used_octets.add(int(m.group(1)))
-    except FileNotFoundError:
-        pass
+    used_octets = _used_vlan_octets()
 
     for i in range(2, 255):
         if i not in used_octets:
@@ -238,23 +231,11 @@ async def install_server(
                     vlan_ip = req.vlan_ip
                 else:
                     # Nächste freie IP aus /etc/vps-hosts ermitteln
-                    used_octets = {1}  # Proxy ist immer .1
-                    try:
-                        with open(settings.vps_hosts_file) as f:
-                            for line in f:
-                                line = line.strip()
-                                if not line or line.startswith("#"):
-                                    continue
-                                ip = line.split()[0] if line.split() else ""
-                                m = re.match(r"^10\.10\.0\.(\d+)$", ip)
-                                if m:
-                                    used_octets.add(int(m.group(1)))
-                                # Prüfe ob Hostname schon einen Eintrag hat
-                                parts = line.split(None, 1)
-                                if len(parts) == 2 and parts[1] == req.hostname:
-                                    vlan_ip = parts[0]
-                    except FileNotFoundError:
-                        pass
+                    used_octets = _used_vlan_octets()
+                    # Prüfe ob Hostname schon einen Eintrag hat
+                    existing = host_registry.by_name(req.hostname)
+                    if existing:
+                        vlan_ip = existing.ip
 
                     if not vlan_ip:
                         for i in range(2, 255):
@@ -414,25 +395,10 @@ async def install_server(
             if req.setup_vlan:
                 await out(task_id, "Trage in /etc/vps-hosts ein...")
                 try:
-                    # Bestehende Einträge lesen und filtern
-                    lines = []
-                    try:
-                        with open(settings.vps_hosts_file) as f:
-                            for line in f:
-                                stripped = line.strip()
-                                if not stripped or stripped.startswith("#"):
-                                    lines.append(line.rstrip("\n"))
-                                    continue
-                                parts = stripped.split(None, 1)
-                                # Alten Eintrag für diesen Hostname oder IP entfernen
-                                if len(parts) == 2 and (parts[1] == req.hostname or parts[0] == vlan_ip):
-                                    continue
-                                lines.append(line.rstrip("\n"))
-                    except FileNotFoundError:
-                        pass
-                    lines.append(f"{vlan_ip} {req.hostname}")
-                    with open(settings.vps_hosts_file, "w") as f:
-                        f.write("\n".join(lines) + "\n")
+                    # Alten Eintrag für diesen Hostname oder IP ersetzen
+                    inventory.upsert_host(req.hostname, vlan_ip)
+                    inventory.set_netcup_id(req.hostname, server_id)
+                    await write_hosts_file()
                     await out(task_id, f"  {vlan_ip} {req.hostname} eingetragen.")
                 except Exception as e:
                     await out(task_id, f"  WARNUNG: vps-hosts Eintrag fehlgeschlagen: {e}")
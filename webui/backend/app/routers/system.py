@@ -1,11 +1,23 @@
 import asyncio
+import logging
 import os
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 
 from ..config import settings
 from ..dependencies import get_current_user
+from ..models.event import Event
+from ..services.docker_logs import docker_logs
+from ..services.docker_state import docker_state
+from ..services.docker_stats import docker_stats
+from ..services.events import event_bus
+from ..services.hosts import get_host_name, resolve_host
+from ..services.ssh import resolve_ssh_target, ssh_breakers, ssh_scheduler
+from ..services.ssh_pool import ssh_pool
+from ..services.template_parser import template_catalog
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/system", tags=["System"])
 
@@ -56,9 +68,89 @@ async def update_templates(user: str = Depends(get_current_user)):
 
     new_templates = sorted(templates_after - templates_before)
     updated = proc.returncode == 0 and "Already up to date" not in output
+    if updated:
+        template_catalog.invalidate()
 
     return UpdateResult(
         updated=updated,
         output=output,
         new_templates=new_templates,
     )
+
+
+@router.get("/ssh")
+async def ssh_status(user: str = Depends(get_current_user)):
+    """Auslastung des SSH-Schedulers (aktive Befehle, Warteschlange) und des Verbindungspools."""
+    return {
+        "scheduler": ssh_scheduler.stats(),
+        "pool": ssh_pool.stats(),
+        "breakers": _breaker_list(),
+        "docker_streams": docker_state.stats(),
+        "docker_stats_streams": docker_stats.stats(),
+        "docker_log_streams": docker_logs.stats(),
+    }
+
+
+def _breaker_list() -> list[dict]:
+    return [
+        {**b.info(), "name": get_host_name(b.host)}
+        for b in ssh_breakers.all()
+    ]
+
+
+@router.get("/ssh/breakers")
+async def list_breakers(user: str = Depends(get_current_user)):
+    """Circuit-Breaker-Zustand pro Host inkl. der letzten Zustandswechsel."""
+    return _breaker_list()
+
+
+@router.post("/ssh/breakers/{host}/reset")
+async def reset_breaker(host: str, user: str = Depends(get_current_user)):
+    """Schließt den Circuit Breaker eines Hosts manuell (Name, IP oder 'proxy')."""
+    # Breaker sind nach SSH-Ziel (IP) geführt; unbekannte Namen direkt probieren
+    breaker = ssh_breakers.find(resolve_ssh_target(resolve_host(host) or host))
+    if not breaker:
+        raise HTTPException(status_code=404, detail=f"Kein Breaker für '{host}'")
+    breaker.reset()
+    return breaker.info()
+
+
+@router.get("/events", response_model=list[Event])
+async def list_events(
+    since: int = Query(default=0, ge=0, description="Nur Ereignisse mit id > since"),
+    type: str | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=500),
+    user: str = Depends(get_current_user),
+):
+    """Letzte Backend-Ereignisse (z.B. Scan-Änderungen), älteste zuerst."""
+    return event_bus.recent(since=since, event_type=type, limit=limit)
+
+
+@router.websocket("/events/ws")
+async def events_websocket(websocket: WebSocket):
+    """WebSocket für Live-Ereignisse."""
+    remote_user = websocket.headers.get("remote-user", "")
+    if not remote_user:
+        logger.debug("Kein Remote-User Header — Dev-Modus")
+
+    await websocket.accept()
+    queue = event_bus.subscribe()
+    # Ohne Lesen bemerkt der Server ein Schließen erst beim nächsten Ereignis
+    receiver = asyncio.create_task(websocket.receive_text())
+    getter = asyncio.create_task(queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # Eingehende Nachrichten werden ignoriert, nur das Schließen zählt
+                receiver.result()
+                receiver = asyncio.create_task(websocket.receive_text())
+            if getter in done:
+                await websocket.send_json(getter.result().model_dump())
+                getter = asyncio.create_task(queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        event_bus.unsubscribe(queue)
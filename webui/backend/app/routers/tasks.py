@@ -1,9 +1,13 @@
+import asyncio
 import json
 import logging
+from datetime import datetime, timezone
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Query, Response, WebSocket, WebSocketDisconnect
 
-from ..models.task import TaskInfo
+from ..config import settings
+from ..models.task import TaskInfo, TaskStatus
+from ..services.subscriber import OVERFLOW_POLICIES
 from ..services.task_manager import task_manager
 
 logger = logging.getLogger(__name__)
@@ -11,10 +15,31 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
 
+def _timestamp(value: datetime | None) -> float | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
 @router.get("/", response_model=list[TaskInfo])
-async def list_tasks():
-    """Alle Tasks auflisten."""
-    return task_manager.list_tasks()
+async def list_tasks(
+    response: Response,
+    host: str | None = Query(default=None),
+    type: str | None = Query(default=None),
+    status: TaskStatus | None = Query(default=None),
+    since: datetime | None = Query(default=None, description="Gestartet ab (ISO 8601)"),
+    until: datetime | None = Query(default=None, description="Gestartet vor (ISO 8601)"),
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+):
+    """Tasks auflisten, neueste zuerst; Gesamtanzahl im Header X-Total-Count."""
+    tasks, total = task_manager.list_tasks(
+        host, type, status.value if status else None, _timestamp(since), _timestamp(until), limit, offset
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return tasks
 
 
 @router.get("/{task_id}", response_model=TaskInfo)
@@ -27,20 +52,37 @@ async def get_task(task_id: str):
 
 
 @router.get("/{task_id}/output")
-async def get_task_output(task_id: str):
-    """Kompletter Output eines Tasks."""
-    output = task_manager.get_output(task_id)
+async def get_task_output(
+    task_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1),
+):
+    """Output eines Tasks, optional ab Zeile offset und höchstens limit Zeilen."""
+    output = await task_manager.get_output(task_id, offset, limit)
     task = task_manager.get_task(task_id)
     return {
         "task_id": task_id,
         "status": task.status if task else "unknown",
+        "offset": offset,
+        "total": task.output_lines if task else 0,
         "lines": output,
     }
 
 
 @router.websocket("/ws/{task_id}")
 async def task_websocket(websocket: WebSocket, task_id: str):
-    """WebSocket für Live-Output eines Tasks."""
+    """WebSocket für Live-Output eines Tasks.
+
+    Zeilen werden gesammelt und als {"type": "lines", "from": n, "data": [...]}
+    gesendet, n ist die Nummer der ersten Zeile. Mit ?since=n setzt ein
+    Client nach einem Reconnect dort fort, statt alles erneut zu bekommen.
+    Zum Schluss kommt {"type": "status"}.
+
+    Kommt der Client nicht hinterher, gilt ?overflow= (Default aus den
+    Settings): "drop-oldest" bzw. "drop-newest" verwerfen Zeilen und melden
+    {"type": "dropped", "count": n}, "disconnect" schließt mit Code 1013,
+    der Client setzt dann per since neu an.
+    """
     # Auth-Check: Remote-User Header (von Authelia via Traefik)
     remote_user = websocket.headers.get("remote-user", "")
     if not remote_user:
@@ -49,43 +91,81 @@ async def task_websocket(websocket: WebSocket, task_id: str):
 
     await websocket.accept()
 
-    task = task_manager.get_task(task_id)
-    if not task:
-        await websocket.send_json({"type": "error", "message": "Task nicht gefunden"})
+    try:
+        since = max(0, int(websocket.query_params.get("since", "0")))
+    except ValueError:
+        await websocket.send_json({"type": "error", "message": "since muss eine Zahl sein"})
+        await websocket.close()
+        return
+    policy = websocket.query_params.get("overflow") or None
+    if policy not in (None, *OVERFLOW_POLICIES):
+        await websocket.send_json(
+            {"type": "error", "message": f"overflow muss eins von {', '.join(OVERFLOW_POLICIES)} sein"}
+        )
         await websocket.close()
         return
 
-    # Sende bisherigen Output
-    existing_output = task_manager.get_output(task_id)
-    for line in existing_output:
-        await websocket.send_json({"type": "output", "data": line})
-
-    # Wenn Task schon fertig, sende Status und schließe
-    if task.status in ("completed", "failed"):
-        await websocket.send_json({
-            "type": "status",
-            "status": task.status,
-            "exit_code": task.exit_code,
-        })
+    task = task_manager.get_task(task_id)
+    if not task:
+        await websocket.send_json({"type": "error", "message": "Task nicht gefunden"})
         await websocket.close()
         return
 
-    # Subscriben für Live-Updates
-    queue = task_manager.subscribe(task_id)
+    # Erst abonnieren, dann nachliefern: ab subscriber.position kommt alles live
+    subscriber = task_manager.subscribe(task_id, policy)
+    position = subscriber.position
+    receiver = asyncio.create_task(websocket.receive_text())
+    getter: asyncio.Task | None = None
     try:
+        cursor = since
+        while cursor < position:
+            lines = await task_manager.get_output(
+                task_id, cursor, min(settings.task_ws_batch_lines, position - cursor)
+            )
+            if not lines:
+                break  # Log nicht mehr lesbar
+            await websocket.send_json({"type": "lines", "from": cursor, "data": lines})
+            cursor += len(lines)
+
+        def next_batch() -> asyncio.Task:
+            return asyncio.create_task(
+                subscriber.next_batch(settings.task_ws_batch_lines, settings.task_ws_flush_interval)
+            )
+
+        getter = next_batch()
         while True:
-            line = await queue.get()
-            if line is None:
-                # Task beendet
-                task = task_manager.get_task(task_id)
-                await websocket.send_json({
-                    "type": "status",
-                    "status": task.status if task else "unknown",
-                    "exit_code": task.exit_code if task else -1,
-                })
-                break
-            await websocket.send_json({"type": "output", "data": line})
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # Eingehende Nachrichten werden ignoriert, nur das Schließen zählt
+                receiver.result()
+                receiver = asyncio.create_task(websocket.receive_text())
+            if getter in done:
+                start, lines, dropped = getter.result()
+                if subscriber.overflowed:
+                    await websocket.close(code=1013, reason="Client zu langsam, bitte mit since neu verbinden")
+                    break
+                if dropped:
+                    await websocket.send_json({"type": "dropped", "count": dropped, "from": start})
+                # Zeilen, die der Client schon hat (since > position), überspringen
+                skip = max(since - start, 0)
+                if len(lines) > skip:
+                    await websocket.send_json(
+                        {"type": "lines", "from": start + skip, "data": lines[skip:]}
+                    )
+                if subscriber.finished and not subscriber.pending:
+                    task = task_manager.get_task(task_id)
+                    await websocket.send_json({
+                        "type": "status",
+                        "status": task.status if task else "unknown",
+                        "exit_code": task.exit_code if task else -1,
+                    })
+                    await websocket.close()
+                    break
+                getter = next_batch()
     except WebSocketDisconnect:
         pass
     finally:
-        task_manager.unsubscribe(task_id, queue)
+        receiver.cancel()
+        if getter is not None:
+            getter.cancel()
+        task_manager.unsubscribe(task_id, subscriber)
@@ -1,194 +1,153 @@
-import asyncio
 import os
 import shlex
+import time
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
 from fastapi.responses import FileResponse
 
 from ..config import settings
 from ..dependencies import get_current_user
-from ..models.vps import VPS, VPSStatus, ExecRequest
+from ..models.vps import VPS, VPSStatus, FleetStatus, StatusHistoryEntry, ScanDiff, ExecRequest
 from ..models.task import TaskCreate
-from ..services.hosts import parse_hosts_file, resolve_host
-from ..services.ssh import run_ssh, run_ssh_stream, check_host_online, scp_upload, scp_download
+from ..services.fleet_status import fleet_status
+from ..services.hosts import host_registry, parse_hosts_file, resolve_host
+from ..services.inventory import inventory
+from ..services.network_scan import scan_scheduler
+from ..services.probe import collect_status
+from ..services.ssh import run_ssh, run_ssh_stream, scp_upload, scp_download
 from ..services.task_manager import task_manager
 
 router = APIRouter(prefix="/vps", tags=["VPS"])
 
 
 @router.get("/", response_model=list[VPS])
-async def list_vps(user: str = Depends(get_current_user)):
-    """Liste aller VPS aus /etc/vps-hosts (inkl. Proxy)."""
+async def list_vps(
+    label: str | None = Query(default=None, description="Filter key=value"),
+    user: str = Depends(get_current_user),
+):
+    """Liste aller VPS aus dem Inventar (inkl. Proxy)."""
     hosts = parse_hosts_file()
+    if label:
+        key, _, value = label.partition("=")
+        return inventory.list_hosts(label=(key, value))
     proxy = VPS(name="proxy", host="proxy", ip=settings.proxy_host)
     return [proxy] + hosts
 
 
-@router.post("/scan", response_model=TaskCreate)
-async def scan_network(user: str = Depends(get_current_user)):
-    """Startet einen Netzwerk-Scan (Background-Task)."""
-
-    async def do_scan(task_id: str):
-        await task_manager.push_output(task_id, "Scanne Netzwerk 10.10.0.2-254...")
-        found = []
-        tasks = []
-
-        async def check_ip(ip: str):
-            # Erst Ping prüfen (via Proxy)
-            ping_ok = await check_host_ping(ip)
-            if ping_ok:
-                # SSH-Hostname versuchen
-                code, hostname, _ = await run_ssh(ip, "hostname", timeout=5)
-                if code == 0 and hostname:
-                    found.append((ip, hostname, "managed"))
-                    await task_manager.push_output(task_id, f"  Gefunden: {ip} → {hostname}")
-                else:
-                    # NetBIOS-Name versuchen (via Proxy)
-                    nb_code, nb_out, _ = await run_ssh(
-                        "proxy",
-                        f"nmblookup -A {shlex.quote(ip)} 2>/dev/null | grep '<00>' | grep -v '<GROUP>' | head -1 | awk '{{print $1}}'",
-                        timeout=10,
-                    )
-                    nbname = nb_out.strip().lower() if nb_code == 0 and nb_out.strip() else ip
-                    found.append((ip, nbname, "unmanaged"))
-                    await task_manager.push_output(task_id, f"  Gefunden: {ip} → {nbname} (unmanaged)")
-
-        for i in range(2, 255):
-            ip = f"10.10.0.{i}"
-            tasks.append(check_ip(ip))
-
-        # Batchweise ausführen (max 50 parallel)
-        batch_size = 50
-        for i in range(0, len(tasks), batch_size):
-            batch = tasks[i : i + batch_size]
-            await asyncio.gather(*batch, return_exceptions=True)
-
-        # Sortieren und speichern
-        found.sort(key=lambda x: int(x[0].split(".")[-1]))
-        lines = [
-            f"# VPS Hosts - generiert vom Dashboard",
-            "# IP          Hostname",
-        ]
-        for ip, hostname, marker in found:
-            if marker == "unmanaged":
-                lines.append(f"{ip} {hostname} unmanaged")
-            else:
-                lines.append(f"{ip} {hostname}")
+@router.get("/status", response_model=FleetStatus)
+async def get_fleet_status(user: str = Depends(get_current_user)):
+    """Letzter bekannter Status aller VPS (sofort, ohne SSH).
 
-        content = "\n".join(lines) + "\n"
-        code, _, err = await run_ssh(
-            "proxy",
-            f"echo {repr(content)} | sudo tee /etc/vps-hosts > /dev/null",
-        )
-        await task_manager.push_output(
-            task_id, f"Scan abgeschlossen. {len(found)} VPS gefunden."
-        )
+    Veraltete Einträge werden im Hintergrund aktualisiert.
+    """
+    return fleet_status.snapshot()
 
-    task_id = task_manager.create_task(
-        "scan", "Netzwerk-Scan", coro_factory=do_scan
-    )
+
+@router.post("/scan", response_model=TaskCreate)
+async def scan_network(
+    mode: str = Query(default="full", pattern="^(full|incremental)$"),
+    user: str = Depends(get_current_user),
+):
+    """Startet einen Netzwerk-Scan (Background-Task).
+
+    full: Ergebnis ersetzt das Inventar. incremental: nur Änderungen gegenüber
+    dem Inventar übernehmen, manuelle Einträge bleiben unangetastet.
+    """
+    task_id = scan_scheduler.start_scan(mode)
+    if task_id is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Es läuft bereits ein Scan (Task {scan_scheduler.running_task})",
+        )
     return TaskCreate(task_id=task_id)
 
 
-async def check_host_ping(ip: str) -> bool:
-    """Prüft ob ein Host per Ping erreichbar ist (via Proxy)."""
-    code, _, _ = await run_ssh("proxy", f"ping -c 1 -W 2 {shlex.quote(ip)}", timeout=10)
-    return code == 0
+@router.get("/scan/last", response_model=ScanDiff | None)
+async def last_scan(user: str = Depends(get_current_user)):
+    """Änderungen des letzten Scans seit Start des Backends."""
+    return scan_scheduler.last_diff
 
 
 def _find_host(name_or_ip: str) -> VPS | None:
     """Findet ein VPS-Objekt aus der Hosts-Datei."""
-    for h in parse_hosts_file():
-        if h.name == name_or_ip or h.ip == name_or_ip:
-            return h
-    return None
+    return host_registry.find(name_or_ip)
 
 
 @router.get("/{host}/status", response_model=VPSStatus)
 async def get_vps_status(host: str, user: str = Depends(get_current_user)):
-    """Status eines einzelnen VPS."""
+    """Status eines einzelnen VPS (ein Probe-Aufruf pro Host)."""
     ip = resolve_host(host)
     if not ip:
         raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
 
-    # Prüfe ob der Host unmanaged ist
     vps_entry = _find_host(host)
-    if vps_entry and not vps_entry.managed:
-        ping_ok = await check_host_ping(ip)
-        return VPSStatus(host=host, online=ping_ok)
-
-    online = await check_host_online(ip)
-    if not online:
-        return VPSStatus(host=host, online=False)
-
-    # Parallel Status-Informationen sammeln
-    cmds = {
-        "updates": "LC_ALL=C apt list --upgradable 2>/dev/null | grep -c upgradable; true",
-        "reboot": "[ -f /var/run/reboot-required ] && echo ja || echo nein",
-        "load": "uptime | awk -F'load average:' '{print $2}' | awk -F, '{print $1}' | tr -d ' '",
-        "uptime": "awk '{d=int($1/86400);h=int($1%86400/3600);m=int($1%3600/60);printf \"%dd:%dh:%dm\",d,h,m}' /proc/uptime",
-        "kernel": "uname -r",
-        "memory": "LC_ALL=C free -h | awk '/^Mem:/{print $3\"|\"$2}'",
-        "disk": "LC_ALL=C df -h / | awk 'NR==2{print $3\"|\"$2}'",
-    }
-
-    results = {}
-    async_tasks = []
-    for key, cmd in cmds.items():
-
-        async def _run(k=key, c=cmd):
-            code, stdout, _ = await run_ssh(ip, c, timeout=10)
-            results[k] = stdout if code == 0 else ""
-
-        async_tasks.append(_run())
-
-    await asyncio.gather(*async_tasks, return_exceptions=True)
-
-    # Memory/Disk parsen (Fallback bei leerem Ergebnis)
-    memory_raw = results.get("memory", "")
-    memory_parts = memory_raw.split("|") if "|" in memory_raw else []
-    disk_raw = results.get("disk", "")
-    disk_parts = disk_raw.split("|") if "|" in disk_raw else []
-
-    updates_str = results.get("updates", "0").strip()
-    try:
-        updates_count = int(updates_str)
-    except ValueError:
-        updates_count = 0
-
-    return VPSStatus(
-        host=host,
-        online=True,
-        load=results.get("load", "").strip(),
-        uptime=results.get("uptime", "").strip(),
-        updates_available=updates_count,
-        reboot_required=results.get("reboot", "nein").strip() == "ja",
-        kernel=results.get("kernel", "").strip(),
-        memory_used=memory_parts[0].strip() if len(memory_parts) >= 2 else "",
-        memory_total=memory_parts[1].strip() if len(memory_parts) >= 2 else "",
-        disk_used=disk_parts[0].strip() if len(disk_parts) >= 2 else "",
-        disk_total=disk_parts[1].strip() if len(disk_parts) >= 2 else "",
-    )
+    managed = vps_entry.managed if vps_entry else True
+    status = await collect_status(host, ip, managed=managed)
+    fleet_status.update(vps_entry.name if vps_entry else host, status)
+    return status
 
 
-@router.post("/{host}/update", response_model=TaskCreate)
-async def update_vps(host: str, user: str = Depends(get_current_user)):
-    """Startet ein System-Update (Background-Task)."""
-    ip = resolve_host(host)
-    if not ip:
+@router.get("/{host}/history", response_model=list[StatusHistoryEntry])
+async def get_vps_history(
+    host: str,
+    hours: int = Query(default=24, ge=1, le=24 * 90),
+    limit: int = Query(default=500, ge=1, le=10000),
+    user: str = Depends(get_current_user),
+):
+    """Status-Historie eines VPS (neueste zuerst)."""
+    vps_entry = _find_host(host)
+    name = vps_entry.name if vps_entry else host
+    return inventory.history(name, since=time.time() - hours * 3600, limit=limit)
+
+
+@router.put("/{host}/labels", response_model=VPS)
+async def set_vps_labels(
+    host: str, labels: dict[str, str], user: str = Depends(get_current_user)
+):
+    """Labels eines VPS setzen (ersetzt alle bisherigen Labels)."""
+    vps_entry = _find_host(host)
+    if not vps_entry:
         raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
+    inventory.set_labels(vps_entry.name, labels)
+    host_registry.reload()
+    return inventory.get_host(vps_entry.name)
+
 
+def _start_update(host: str, ip: str) -> str:
     async def do_update(task_id: str):
         await task_manager.push_output(task_id, f"Starte Update auf {host} ({ip})...")
         async for line in run_ssh_stream(ip, "sudo apt update && sudo apt upgrade -y"):
             await task_manager.push_output(task_id, line)
         await task_manager.push_output(task_id, "Update abgeschlossen.")
 
-    task_id = task_manager.create_task(
+    return task_manager.create_task(
         "update", f"System-Update auf {host}", host=host, coro_factory=do_update
     )
-    return TaskCreate(task_id=task_id)
+
+
+@router.post("/update-all", response_model=list[TaskCreate])
+async def update_all_vps(user: str = Depends(get_current_user)):
+    """Startet System-Updates auf allen managed VPS.
+
+    Die Tasks laufen über den Task-Scheduler, also höchstens
+    task_type_limits["update"] gleichzeitig und nie parallel zu Deploy,
+    Restore oder Backup auf demselben Host.
+    """
+    return [
+        TaskCreate(task_id=_start_update(vps.name, vps.ip))
+        for vps in host_registry.hosts()
+        if vps.managed
+    ]
+
+
+@router.post("/{host}/update", response_model=TaskCreate)
+async def update_vps(host: str, user: str = Depends(get_current_user)):
+    """Startet ein System-Update (Background-Task)."""
+    ip = resolve_host(host)
+    if not ip:
+        raise HTTPException(status_code=404, detail=f"Host '{host}' nicht gefunden")
+    return TaskCreate(task_id=_start_update(host, ip))
 
 
 @router.post("/{host}/reboot")
@@ -0,0 +1,480 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import shlex
+import tarfile
+from typing import AsyncIterator, Awaitable, Callable
+
+import asyncssh
+import yaml
+
+from ..config import settings
+from ..models.deploy import DeployPlan, ServiceChange, Template
+from .ssh import run_ssh, run_ssh_stream, ssh_session
+from .template_engine import RenderedTemplate, template_engine
+from .template_parser import template_catalog
+
+HASH_FILE = ".bundle-hash"
+MANIFEST_FILE = ".deploy-manifest.json"
+COMPOSE_FILE = "docker-compose.yml"
+# Letzte Zeile von apply_command, nur wenn alle Schritte erfolgreich waren
+APPLY_DONE = "DEPLOY-APPLIED"
+
+# Der Host meldet zuerst, ob das Archiv gebraucht wird ("send") oder der
+# Stand schon vorliegt ("unchanged"); erst dann wird gesendet.
+RECEIVE_SCRIPT = """\
+dir={dir}
+if [ "$(cat "$dir/{hash_file}" 2>/dev/null)" = {hash} ]; then
+    echo unchanged
+    exit 0
+fi
+sudo mkdir -p "$dir" && sudo chown {owner} "$dir" || exit 1
+echo send
+tar xzmf - -C "$dir" --no-same-owner || exit 1
+echo {hash} > "$dir/{hash_file}"
+"""
+
+
+class Bundle:
+    """Gerendertes Template als tar.gz mit Inhalts-Hash."""
+
+    def __init__(self, data: bytes, digest: str, files: list[str]):
+        self.data = data
+        self.digest = digest
+        self.files = files
+
+
+def build_bundle(rendered: RenderedTemplate, env: bool = True) -> Bundle:
+    """Packt ein gerendertes Template plus .env (außer env=False) in ein Archiv.
+
+    Das Archiv ist reproduzierbar (feste Zeitstempel und Besitzer), damit
+    gleicher Inhalt denselben Hash ergibt. Dateirechte (z.B. das
+    Ausführbar-Bit von entrypoint.sh) bleiben erhalten.
+    """
+    tar_buffer = io.BytesIO()
+    files = [rel_path for rel_path, _, _ in rendered.files] + ([".env"] if env else [])
+    with tarfile.open(fileobj=tar_buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+
+        def add(name: str, data: bytes, mode: int) -> None:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = mode
+            info.mtime = 0
+            tar.addfile(info, io.BytesIO(data))
+
+        for rel_path, data, mode in rendered.files:
+            add(rel_path, data, mode)
+        if env:
+            add(".env", rendered.env_file(), 0o600)
+
+    raw_tar = tar_buffer.getvalue()
+    return Bundle(
+        data=gzip.compress(raw_tar, mtime=0),
+        digest=hashlib.sha256(raw_tar).hexdigest(),
+        files=files,
+    )
+
+
+async def transfer_bundle(ip: str, deploy_dir: str, bundle: Bundle, timeout: int = 120) -> bool:
+    """Überträgt ein Bundle über einen SSH-Channel nach deploy_dir.
+
+    Gibt False zurück, wenn auf dem Host bereits derselbe Stand liegt
+    (nichts übertragen), sonst True. Fehler lösen RuntimeError aus.
+    """
+    command = RECEIVE_SCRIPT.format(
+        dir=shlex.quote(deploy_dir),
+        hash_file=HASH_FILE,
+        hash=shlex.quote(bundle.digest),
+        owner=shlex.quote(f"{settings.ssh_user}:{settings.ssh_user}"),
+    )
+
+    async def _transfer() -> bool:
+        async with ssh_session(ip, command, encoding=None) as proc:
+            answer = (await proc.stdout.readline()).strip()
+            if answer == b"unchanged":
+                await proc.wait()
+                return False
+            if answer == b"send":
+                proc.stdin.write(bundle.data)
+                proc.stdin.write_eof()
+            result = await proc.wait()
+            if answer != b"send" or result.returncode != 0:
+                stderr = (result.stderr or b"").decode("utf-8", "replace").strip()
+                raise RuntimeError(
+                    f"Übertragung nach {deploy_dir} fehlgeschlagen: {stderr or f'rc={result.returncode}'}"
+                )
+            return True
+
+    try:
+        return await asyncio.wait_for(_transfer(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"Übertragung nach {deploy_dir}: Timeout") from None
+    except (OSError, asyncssh.Error) as e:
+        raise RuntimeError(f"Übertragung nach {deploy_dir}: {e}") from e
+
+
+# Ein Aufruf liefert Manifest, bisherige .env und die Services mit Container
+STATE_SCRIPT = """\
+dir={dir}
+cat "$dir/{manifest}" 2>/dev/null
+echo
+echo ---ENV---
+cat "$dir/.env" 2>/dev/null
+echo
+echo ---PS---
+if command -v docker >/dev/null 2>&1; then
+    sudo docker ps -a --filter label=com.docker.compose.project.working_dir="$dir" \\
+        --format '{{{{.Label "com.docker.compose.service"}}}}' 2>/dev/null
+fi
+true
+"""
+
+
+class HostDeployState:
+    """Stand eines Deployments auf dem Host (aus einem SSH-Aufruf)."""
+
+    def __init__(self, manifest: dict, env: dict[str, str], containers: set[str]):
+        self.manifest = manifest
+        self.env = env
+        self.containers = containers
+
+
+def parse_host_state(stdout: str) -> HostDeployState:
+    manifest_part, _, rest = stdout.partition("---ENV---")
+    env_part, _, ps_part = rest.partition("---PS---")
+    try:
+        manifest = json.loads(manifest_part.strip() or "{}")
+    except json.JSONDecodeError:
+        manifest = {}
+    env = {}
+    for line in env_part.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            env[key.strip()] = value
+    containers = {line.strip() for line in ps_part.splitlines() if line.strip()}
+    return HostDeployState(manifest if isinstance(manifest, dict) else {}, env, containers)
+
+
+async def read_host_state(ip: str, deploy_dir: str) -> HostDeployState:
+    code, stdout, stderr = await run_ssh(
+        ip, STATE_SCRIPT.format(dir=shlex.quote(deploy_dir), manifest=MANIFEST_FILE), timeout=30
+    )
+    if code != 0:
+        raise RuntimeError(f"Stand von {deploy_dir} nicht lesbar: {stderr or f'rc={code}'}")
+    return parse_host_state(stdout)
+
+
+def previous_generated(template: Template, given: dict[str, str], state: HostDeployState) -> dict[str, str]:
+    """Übernimmt generierte Werte aus der bisherigen .env (z.B. DB-Passwörter).
+
+    Sonst würde jeder Redeploy neue Secrets erzeugen, die nicht mehr zu
+    bestehenden Volumes passen.
+    """
+    values = dict(given)
+    for var in template.variables:
+        if var.type == "generate" and not values.get(var.name) and state.env.get(var.name):
+            values[var.name] = state.env[var.name]
+    return values
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _local_sources(service: dict) -> list[str]:
+    """Relative Pfade, die in einen Service einfließen (Build-Kontext, Bind-Mounts)."""
+    sources = []
+    build = service.get("build")
+    if isinstance(build, str):
+        sources.append(build)
+    elif isinstance(build, dict):
+        sources.append(build.get("context", "."))
+    for volume in service.get("volumes", []) or []:
+        if isinstance(volume, str):
+            source = volume.split(":", 1)[0]
+        elif isinstance(volume, dict) and volume.get("type") == "bind":
+            source = volume.get("source", "")
+        else:
+            continue
+        if source.startswith("."):
+            sources.append(source)
+    return [os.path.normpath(source) for source in sources]
+
+
+def service_hashes(rendered: RenderedTemplate) -> dict[str, dict]:
+    """Hash pro Compose-Service: Definition und referenzierte Dateien getrennt.
+
+    Services inaktiver Profile werden ausgelassen. Nutzt eine Definition
+    ${VAR} oder env_file, zählt die .env zur Definition.
+    """
+    files = {rel_path: data for rel_path, data, _ in rendered.files}
+    try:
+        compose = yaml.safe_load(files.get(COMPOSE_FILE, b"")) or {}
+    except yaml.YAMLError:
+        return {}
+    env = rendered.env_file()
+    active = set(rendered.profiles)
+
+    result = {}
+    for name, service in (compose.get("services") or {}).items():
+        service = service or {}
+        if service.get("profiles") and not active & set(service["profiles"]):
+            continue
+        definition = json.dumps(service, sort_keys=True, default=str).encode("utf-8")
+        if b"${" in definition or "env_file" in service:
+            definition += env
+
+        file_hash = hashlib.sha256()
+        for source in _local_sources(service):
+            for rel_path in sorted(files):
+                if rel_path == COMPOSE_FILE:
+                    continue
+                if source == "." or rel_path == source or rel_path.startswith(source + "/"):
+                    file_hash.update(rel_path.encode("utf-8") + b"\0" + files[rel_path])
+        result[name] = {
+            "config": _digest(definition),
+            "files": file_hash.hexdigest()[:16],
+            "build": bool(service.get("build")),
+        }
+    return result
+
+
+def make_plan(
+    host: str,
+    template: Template,
+    rendered: RenderedTemplate,
+    bundle: Bundle,
+    state: HostDeployState,
+) -> tuple[DeployPlan, dict[str, dict]]:
+    """Vergleicht den gerenderten Stand mit dem Manifest auf dem Host."""
+    hashes = service_hashes(rendered)
+    old = state.manifest.get("services", {})
+    first_deploy = not state.manifest
+
+    changes = []
+    for name, new in hashes.items():
+        previous = old.get(name)
+        if first_deploy or previous is None:
+            changes.append(ServiceChange(service=name, action="create", reason="neu"))
+        elif previous.get("config") != new["config"]:
+            changes.append(ServiceChange(service=name, action="recreate", reason="config"))
+        elif previous.get("files") != new["files"]:
+            changes.append(ServiceChange(service=name, action="recreate", reason="dateien"))
+        elif name not in state.containers:
+            changes.append(ServiceChange(service=name, action="create", reason="fehlt"))
+        else:
+            changes.append(ServiceChange(service=name, action="unchanged"))
+    for name in old:
+        if name not in hashes:
+            changes.append(ServiceChange(service=name, action="remove", reason="entfernt"))
+
+    transfer = state.manifest.get("bundle") != bundle.digest
+    plan = DeployPlan(
+        host=host,
+        template=template.directory,
+        deploy_dir=template.deploy_dir,
+        bundle=bundle.digest,
+        first_deploy=first_deploy,
+        transfer=transfer,
+        unchanged=not transfer and all(c.action == "unchanged" for c in changes),
+        profiles=rendered.profiles,
+        services=changes,
+    )
+    return plan, hashes
+
+
+async def plan_deploy(
+    host: str,
+    ip: str,
+    template: Template,
+    given: dict[str, str],
+    auth: bool = False,
+) -> tuple[DeployPlan, dict[str, dict], RenderedTemplate, Bundle]:
+    """Rendert das Template mit dem Stand des Hosts und erstellt den Plan (ein SSH-Aufruf).
+
+    TemplateError bei fehlenden Werten, RuntimeError wenn der Host nicht lesbar ist.
+    """
+    state = await read_host_state(ip, template.deploy_dir)
+    rendered = template_engine.render(
+        template_catalog.path(template), template, previous_generated(template, given, state), ip, auth
+    )
+    bundle = build_bundle(rendered)
+    plan, hashes = make_plan(host, template, rendered, bundle, state)
+    return plan, hashes, rendered, bundle
+
+
+def apply_command(plan: DeployPlan, hashes: dict[str, dict], build: bool = True) -> str:
+    """Compose-Aufrufe, die nur geänderte Services neu erstellen, danach das Manifest.
+
+    Geänderte Definitionen/Build-Kontexte übernimmt `up --build --no-deps`
+    (Compose erkennt selbst, was neu erstellt werden muss). Geänderte
+    Bind-Mount-Dateien sieht Compose nicht, daher --force-recreate.
+    Mit build=False liegen die Images schon auf dem Host (vom Proxy).
+    """
+    compose = "sudo docker compose" + "".join(f" --profile {shlex.quote(p)}" for p in plan.profiles)
+    build_flag = "--build" if build else "--no-build"
+    commands = []
+    if plan.first_deploy:
+        commands.append(f"{compose} up -d {build_flag} --remove-orphans")
+    else:
+        removed = any(c.action == "remove" for c in plan.services)
+        update = [
+            c.service for c in plan.services
+            if c.action == "create"
+            or c.reason == "config"
+            or (c.reason == "dateien" and hashes[c.service]["build"])
+        ]
+        force = [
+            c.service for c in plan.services
+            if c.reason == "dateien" and not hashes[c.service]["build"]
+        ]
+        if update or removed:
+            orphans = " --remove-orphans" if removed else ""
+            if update:
+                services = " ".join(shlex.quote(s) for s in update)
+                commands.append(f"{compose} up -d {build_flag} --no-deps{orphans} {services}")
+            else:
+                commands.append(f"{compose} up -d --no-recreate{orphans}")
+        if force:
+            services = " ".join(shlex.quote(s) for s in force)
+            commands.append(f"{compose} up -d --no-deps --force-recreate {services}")
+
+    manifest = json.dumps({"bundle": plan.bundle, "profiles": plan.profiles, "services": hashes})
+    commands.append(f"printf '%s\\n' {shlex.quote(manifest)} > {MANIFEST_FILE}")
+    commands.append(f"echo {APPLY_DONE}")
+    return f"cd {shlex.quote(plan.deploy_dir)} && " + " && ".join(commands)
+
+
+async def apply_plan(
+    ip: str,
+    plan: DeployPlan,
+    hashes: dict[str, dict],
+    build: bool = True,
+) -> AsyncIterator[str]:
+    """Führt den Plan aus und streamt die Compose-Ausgabe; RuntimeError bei Fehler."""
+    done = False
+    async for line in run_ssh_stream(ip, apply_command(plan, hashes, build)):
+        if line == APPLY_DONE:
+            done = True
+            continue
+        yield line
+    if not done:
+        raise RuntimeError("docker compose fehlgeschlagen, Manifest nicht aktualisiert")
+
+
+def write_route(domain: str, ip: str, port: int, auth: bool) -> str:
+    """Schreibt die Traefik-Route für ein Deployment; gibt den Dateipfad zurück."""
+    route_name = domain.replace(".", "-")
+    if auth:
+        route_content = f"""http:
+  routers:
+    {route_name}:
+      rule: "Host(`{domain}`)"
+      entryPoints:
+        - websecure
+      service: {route_name}
+      middlewares:
+        - authelia
+      tls:
+        certResolver: letsencrypt
+
+  services:
+    {route_name}:
+      loadBalancer:
+        servers:
+          - url: "http://{ip}:{port}"
+"""
+    else:
+        route_content = f"""http:
+  routers:
+    {route_name}:
+      rule: "Host(`{domain}`)"
+      entryPoints:
+        - websecure
+      service: {route_name}
+      tls:
+        certResolver: letsencrypt
+
+  services:
+    {route_name}:
+      loadBalancer:
+        servers:
+          - url: "http://{ip}:{port}"
+"""
+
+    route_file = os.path.join(settings.traefik_conf_dir, f"{route_name}.yml")
+    with open(route_file, "w") as f:
+        f.write(route_content)
+    return route_file
+
+
+async def _distribute_images(
+    ip: str,
+    template: Template,
+    rendered: RenderedTemplate,
+    plan: DeployPlan,
+    emit: Callable[[str], Awaitable[None]],
+) -> bool:
+    """Images über den Proxy bereitstellen; False, wenn der Host selbst bauen muss."""
+    # images importiert deployer, daher erst hier
+    from .images import image_distributor
+
+    if not settings.image_distribution or image_distributor.is_proxy(ip):
+        return False
+    services = [c.service for c in plan.services if c.action in ("create", "recreate")]
+    try:
+        await image_distributor.distribute(ip, template, rendered, services, emit)
+    except RuntimeError as e:
+        await emit(f"Image-Verteilung fehlgeschlagen, baue auf dem Host: {e}")
+        return False
+    return True
+
+
+async def deploy_host(
+    host: str,
+    ip: str,
+    template: Template,
+    given: dict[str, str],
+    auth: bool,
+    emit: Callable[[str], Awaitable[None]],
+) -> tuple[DeployPlan, dict[str, dict], RenderedTemplate]:
+    """Plan, Übertragung, Compose und Route für einen Host; Ausgabe über emit."""
+    deploy_dir = template.deploy_dir
+    plan, hashes, rendered, bundle = await plan_deploy(host, ip, template, given, auth)
+    if rendered.generated:
+        await emit(f"Automatisch generiert: {', '.join(rendered.generated)}")
+    if rendered.profiles:
+        await emit(f"Compose-Profile: {', '.join(rendered.profiles)}")
+    for change in plan.services:
+        if change.action != "unchanged":
+            await emit(f"  {change.action:<10} {change.service} ({change.reason})")
+
+    if plan.unchanged:
+        await emit("Keine Änderungen, Deployment ist aktuell.")
+    else:
+        # Alle Template-Dateien plus .env als ein Archiv übertragen
+        if plan.transfer:
+            await emit(
+                f"Übertrage {len(bundle.files)} Datei(en) nach {deploy_dir} "
+                f"({len(bundle.data) // 1024 + 1} KiB, {bundle.digest[:12]})..."
+            )
+            if await transfer_bundle(ip, deploy_dir, bundle):
+                await emit("Dateien übertragen.")
+            else:
+                await emit("Dateien unverändert, Übertragung übersprungen.")
+
+        build = not await _distribute_images(ip, template, rendered, plan, emit)
+        await emit("Aktualisiere Container...")
+        async for line in apply_plan(ip, plan, hashes, build):
+            await emit(line)
+
+    # Route erstellen wenn benötigt
+    domain = rendered.values.get("DOMAIN", "")
+    if domain:
+        await emit(f"Erstelle Route für {domain}...")
+        write_route(domain, ip, template.route_port or 8000, auth)
+        await emit(f"Route {domain} erstellt.")
+    return plan, hashes, rendered
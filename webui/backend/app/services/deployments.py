@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import re
+import time
+
+from ..config import settings
+from ..models.deploy import Deployment, DeploymentService
+from .docker_state import docker_state
+from .ssh import run_ssh
+
+# Ein Aufruf liefert alle Compose-Verzeichnisse unter /opt und alle
+# Compose-Container mit Labels (Projekt, Service, Arbeitsverzeichnis).
+LIST_SCRIPT = r"""
+for f in /opt/*/docker-compose.yml; do [ -f "$f" ] && printf '{"dir":"%s"}\n' "$(dirname "$f")"; done
+if command -v docker >/dev/null 2>&1; then
+    sudo docker ps -a --filter label=com.docker.compose.project --format '{{json .}}' 2>/dev/null
+fi
+true
+"""
+
+_HEALTH_RE = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+
+
+def _labels(value: str) -> dict[str, str]:
+    labels = {}
+    for label in value.split(","):
+        key, sep, val = label.partition("=")
+        if sep:
+            labels[key] = val
+    return labels
+
+
+def parse_deployments(host: str, stdout: str) -> list[Deployment]:
+    """Baut die Deployment-Liste aus der Ausgabe von LIST_SCRIPT."""
+    dirs: list[str] = []
+    services: dict[str, list[DeploymentService]] = {}
+    for line in stdout.splitlines():
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "dir" in data:
+            dirs.append(data["dir"])
+            continue
+        labels = _labels(data.get("Labels", ""))
+        working_dir = labels.get("com.docker.compose.project.working_dir", "")
+        status = data.get("Status", "")
+        health = _HEALTH_RE.search(status)
+        services.setdefault(working_dir.rstrip("/"), []).append(
+            DeploymentService(
+                name=labels.get("com.docker.compose.service", ""),
+                container=data.get("Names", ""),
+                image=data.get("Image", ""),
+                state=data.get("State", ""),
+                status=status,
+                health=health.group(1).replace("health: ", "") if health else "",
+            )
+        )
+
+    deployments = []
+    for deploy_dir in dirs:
+        app_services = sorted(services.get(deploy_dir, []), key=lambda s: s.name)
+        running = sum(1 for s in app_services if s.state == "running")
+        deployments.append(
+            Deployment(
+                app=os.path.basename(deploy_dir),
+                host=host,
+                status="running" if running > 0 else "stopped",
+                containers=running,
+                deploy_dir=deploy_dir,
+                services=app_services,
+            )
+        )
+    return deployments
+
+
+class DeploymentCache:
+    """Deployment-Listen pro Host mit einem SSH-Aufruf, gecacht wie der Docker-Status.
+
+    Ein Eintrag bleibt gültig, solange der docker-events-Stream des Hosts
+    verbunden ist und sich dessen Container-Stand (version) nicht geändert
+    hat, höchstens aber docker_state_resync Sekunden. Ohne Stream wird
+    immer neu gelesen. Gleichzeitige Anfragen teilen sich einen Aufruf.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[int, float, list[Deployment]]] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def _current_version(self, host: str) -> int | None:
+        state = docker_state.get(host)
+        return state.version if state and state.connected else None
+
+    async def list(self, host: str, ip: str) -> list[Deployment]:
+        version = self._current_version(host)
+        entry = self._entries.get(host)
+        if (
+            entry
+            and version is not None
+            and entry[0] == version
+            and time.time() - entry[1] < settings.docker_state_resync
+        ):
+            return entry[2]
+
+        inflight = self._inflight.get(host)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[host] = future
+        try:
+            code, stdout, _ = await run_ssh(ip, LIST_SCRIPT, timeout=15)
+            deployments = parse_deployments(host, stdout) if code == 0 else []
+            if code == 0 and version is not None:
+                self._entries[host] = (version, time.time(), deployments)
+            future.set_result(deployments)
+            return deployments
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # als abgerufen markieren
+            raise
+        finally:
+            del self._inflight[host]
+
+    def invalidate(self, host: str) -> None:
+        """Verwirft den Cache eines Hosts (nach Deploy/Entfernen)."""
+        self._entries.pop(host, None)
+
+
+# Globale Instanz
+deployment_cache = DeploymentCache()
@@ -0,0 +1,86 @@
+import asyncio
+import shlex
+from fnmatch import fnmatchcase
+
+from ..config import settings
+from ..models.docker import BulkAction, BulkTarget, ContainerSelector
+from .docker_state import docker_state
+from .ssh import run_ssh
+from .task_manager import task_manager
+
+_COMMANDS = {
+    BulkAction.start: "sudo docker start {container}",
+    BulkAction.stop: "sudo docker stop {container}",
+    BulkAction.restart: "sudo docker restart {container}",
+    BulkAction.pull: "sudo docker pull {image}",
+    # Ohne -f: laufende Container müssen vorher gestoppt werden
+    BulkAction.remove: "sudo docker rm {container}",
+}
+
+
+def select_containers(selector: ContainerSelector) -> list[tuple[str, str, BulkTarget]]:
+    """Wählt Container aus dem Docker-Status im Speicher aus (ohne SSH).
+
+    Gibt (host, ip, ziel) zurück, sortiert nach Host und Containername.
+    """
+    hosts = set(selector.hosts)
+    result = []
+    for state in docker_state.states():
+        if hosts and state.name not in hosts and state.ip not in hosts:
+            continue
+        for c in state.containers:
+            if selector.project and c.project != selector.project:
+                continue
+            if selector.name and not fnmatchcase(c.name, selector.name):
+                continue
+            if selector.image and not fnmatchcase(c.image, selector.image):
+                continue
+            result.append(
+                (state.name, state.ip, BulkTarget(host=state.name, container=c.name, image=c.image, state=c.state))
+            )
+    result.sort(key=lambda t: (t[0], t[2].container))
+    return result
+
+
+async def run_bulk(
+    task_id: str,
+    action: BulkAction,
+    targets: list[tuple[str, str, BulkTarget]],
+) -> None:
+    """Führt eine Aktion auf allen Zielen aus (begrenzt parallel) und meldet jedes Ergebnis."""
+    semaphore = asyncio.Semaphore(settings.docker_bulk_parallelism)
+    failed: list[str] = []
+
+    # pull wirkt pro Image, nicht pro Container
+    if action == BulkAction.pull:
+        unique = {(host, t.image): (host, ip, t) for host, ip, t in targets}
+        targets = list(unique.values())
+
+    async def apply(host: str, ip: str, target: BulkTarget):
+        label = f"{host}/{target.image}" if action == BulkAction.pull else f"{host}/{target.container}"
+        command = _COMMANDS[action].format(
+            container=shlex.quote(target.container), image=shlex.quote(target.image)
+        )
+        async with semaphore:
+            code, _, stderr = await run_ssh(ip, command, timeout=300 if action == BulkAction.pull else 60)
+        if code == 0:
+            await task_manager.push_output(task_id, f"  OK      {label}")
+        else:
+            failed.append(label)
+            await task_manager.push_output(task_id, f"  FEHLER  {label}: {stderr or f'rc={code}'}")
+
+    await task_manager.push_output(
+        task_id,
+        f"{action.value} für {len(targets)} Ziel(e), max. {settings.docker_bulk_parallelism} parallel...",
+    )
+    await asyncio.gather(*(apply(*t) for t in targets))
+
+    for host in {host for host, _, _ in targets}:
+        docker_state.refresh(host)
+
+    await task_manager.push_output(
+        task_id,
+        f"Fertig: {len(targets) - len(failed)} erfolgreich, {len(failed)} fehlgeschlagen.",
+    )
+    if failed:
+        raise RuntimeError(f"{len(failed)} von {len(targets)} Aktionen fehlgeschlagen")
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import re
+import shlex
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from ..config import settings
+from .ssh import run_ssh, ssh_watch
+from .subscriber import DROP_NEWEST, BoundedSubscriber
+
+logger = logging.getLogger(__name__)
+
+LEVELS = {"trace": 0, "debug": 1, "info": 2, "warn": 3, "error": 4, "fatal": 5}
+
+_LEVEL_RE = re.compile(
+    r"\b(?:level=)?(TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|ERR|CRIT|CRITICAL|FATAL|PANIC)\b",
+    re.IGNORECASE,
+)
+_LEVEL_ALIASES = {
+    "notice": "info",
+    "warning": "warn",
+    "err": "error",
+    "crit": "fatal",
+    "critical": "fatal",
+    "panic": "fatal",
+}
+
+
+def detect_level(text: str) -> str:
+    """Erkennt das Log-Level einer Zeile (ohne Treffer: info)."""
+    m = _LEVEL_RE.search(text[:200])
+    if not m:
+        return "info"
+    level = m.group(1).lower()
+    return _LEVEL_ALIASES.get(level, level)
+
+
+_TIMESTAMP_RE = re.compile(
+    r"(\d{4}-\d\d-\d\d)(?:[T ](\d\d:\d\d(?::\d\d)?)(?:\.(\d+))?)?(Z|[+-]\d\d:?\d\d)?$",
+    re.IGNORECASE,
+)
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h|d)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+# Ausgabe von `docker logs`, wenn der Container entfernt wurde
+_NO_SUCH_CONTAINER = "No such container"
+
+
+def parse_timestamp(ts: str) -> datetime | None:
+    """RFC3339-Zeitstempel (auch mit Nanosekunden wie von Docker) als UTC-datetime.
+
+    Ohne Zeitzone gilt UTC; None, wenn ts kein Zeitstempel ist.
+    """
+    m = _TIMESTAMP_RE.match(ts.strip())
+    if not m:
+        return None
+    date, time_part, fraction, tz = m.groups()
+    # fromisoformat kann vor 3.11 weder "Z" noch mehr als 6 Nachkommastellen
+    iso = f"{date}T{time_part or '00:00'}"
+    if fraction:
+        iso += "." + fraction[:6].ljust(6, "0")
+    if tz and tz.upper() != "Z":
+        iso += tz if ":" in tz else f"{tz[:3]}:{tz[3:]}"
+    try:
+        parsed = datetime.fromisoformat(iso)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def parse_since(value: str, now: datetime | None = None) -> datetime | None:
+    """Startzeit als absolute UTC-Zeit: relative Dauer (10m, 1h30m, 2d),
+    RFC3339 oder Unix-Zeitstempel. ValueError bei allem anderen."""
+    value = value.strip()
+    if not value:
+        return None
+    now = now or datetime.now(timezone.utc)
+    if _DURATION_RE.sub("", value) == "":
+        seconds = sum(float(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_RE.findall(value))
+        return now - timedelta(seconds=seconds)
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        raise ValueError(f"Ungültige Zeitangabe '{value}', erwartet z.B. 10m oder 2024-01-01T12:00:00Z")
+    return parsed
+
+
+def split_timestamp(line: str) -> tuple[str, str]:
+    """Trennt den Zeitstempel von `docker logs --timestamps` ab."""
+    ts, sep, text = line.partition(" ")
+    if sep and len(ts) >= 20 and ts[4] == "-" and ts[10] == "T":
+        return ts, text
+    return "", line
+
+
+class LogFilter:
+    """Serverseitiger Filter für Log-Zeilen (Regex, Mindest-Level, Startzeit)."""
+
+    def __init__(self, pattern: str = "", level: str = "", since: str = ""):
+        if level and level not in LEVELS:
+            raise ValueError(f"Unbekanntes Level '{level}', erlaubt: {', '.join(LEVELS)}")
+        try:
+            self.regex = re.compile(pattern) if pattern else None
+        except re.error as e:
+            raise ValueError(f"Ungültiger Regex: {e}") from e
+        self.min_level = LEVELS[level] if level else None
+        # Einmal absolut auflösen: "10m" bezieht sich auf den Verbindungsaufbau
+        self.since = parse_since(since)
+
+    def match(self, entry: dict) -> bool:
+        if self.since and entry["time"]:
+            # Docker kürzt Nachkommastellen, daher nicht als String vergleichen
+            time = parse_timestamp(entry["time"])
+            if time and time < self.since:
+                return False
+        if self.min_level is not None and LEVELS[entry["level"]] < self.min_level:
+            return False
+        if self.regex and not self.regex.search(entry["line"]):
+            return False
+        return True
+
+
+def make_entry(raw: str) -> dict:
+    ts, text = split_timestamp(raw.rstrip("\n"))
+    return {"time": ts, "level": detect_level(text), "line": text}
+
+
+def logs_command(
+    container: str,
+    tail: int | None = None,
+    since: str = "",
+    until: str = "",
+    follow: bool = False,
+) -> str:
+    args = ["sudo", "docker", "logs", "--timestamps"]
+    if follow:
+        args.append("--follow")
+    if tail is not None:
+        args += ["--tail", str(tail)]
+    if since:
+        args += ["--since", since]
+    if until:
+        args += ["--until", until]
+    args.append(container)
+    return " ".join(shlex.quote(a) for a in args) + " 2>&1"
+
+
+async def read_logs(
+    ip: str,
+    container: str,
+    log_filter: LogFilter,
+    tail: int = 200,
+    until: datetime | None = None,
+) -> tuple[int, list[dict], str]:
+    """Einmaliges Lesen (ohne Follow).
+
+    since (aus dem Filter) und until gehen als absolute RFC3339-Zeit an
+    Docker: relative Angaben gelten so für die Uhr des Backends, nicht des
+    Hosts, und Einheiten wie "d", die Docker nicht kennt, funktionieren.
+    """
+    command = logs_command(
+        container,
+        tail=tail,
+        since=log_filter.since.isoformat() if log_filter.since else "",
+        until=until.isoformat() if until else "",
+    )
+    code, stdout, stderr = await run_ssh(ip, command, timeout=30)
+    if code != 0:
+        return code, [], stdout or stderr
+    entries = [make_entry(line) for line in stdout.split("\n") if line]
+    return 0, [e for e in entries if log_filter.match(e)], ""
+
+
+class LogSubscriber(BoundedSubscriber[dict]):
+    """Puffer eines Log-Zuschauers mit eigenem Filter.
+
+    Ist der Puffer voll, werden neue Zeilen verworfen (drop-newest) und mit
+    dem nächsten Batch gemeldet; der geteilte Stream wird nie gebremst.
+    """
+
+    def __init__(self, log_filter: LogFilter, max_lines: int):
+        super().__init__(max_lines, DROP_NEWEST)
+        self.filter = log_filter
+
+    def push(self, entry: dict) -> None:
+        if self.filter.match(entry):
+            super().push(entry)
+
+
+class ContainerLogStream:
+    """Ein `docker logs -f` pro Container, geteilt von allen Zuschauern.
+
+    Die letzten Zeilen werden in einem Ringpuffer gehalten, damit neue
+    Zuschauer sofort Kontext bekommen. Endet der Stream (Container
+    gestoppt/neu gestartet), wird ab der letzten Zeile neu verbunden;
+    existiert der Container nicht mehr, endet der Stream mit Fehler.
+    """
+
+    def __init__(self, host: str, ip: str, container: str):
+        self.host = host
+        self.ip = ip
+        self.container = container
+        self.error = ""
+        self.running = False
+        self.backlog: deque[dict] = deque(maxlen=settings.docker_log_backlog)
+        self._subscribers: list[LogSubscriber] = []
+        self._task: asyncio.Task | None = None
+        self._stop_handle: asyncio.TimerHandle | None = None
+        self._ready = asyncio.Event()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self, subscriber: LogSubscriber, tail: int) -> None:
+        """Meldet einen Zuschauer an; er bekommt zuerst die letzten tail passenden Zeilen."""
+        if self._stop_handle:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        if self._task is None or self._task.done():
+            self._ready.clear()
+            self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=3)
+        except asyncio.TimeoutError:
+            pass
+        if tail:
+            for entry in [e for e in self.backlog if subscriber.filter.match(e)][-tail:]:
+                subscriber.push(entry)
+        self._subscribers.append(subscriber)
+        if self._task is None or self._task.done():
+            # Stream schon beendet (z.B. Container existiert nicht)
+            subscriber.finish()
+
+    def unsubscribe(self, subscriber: LogSubscriber) -> None:
+        try:
+            self._subscribers.remove(subscriber)
+        except ValueError:
+            pass
+        if not self._subscribers and self._task and not self._stop_handle:
+            self._stop_handle = asyncio.get_running_loop().call_later(
+                settings.docker_stream_idle, self.stop
+            )
+
+    def stop(self) -> None:
+        self._stop_handle = None
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for subscriber in self._subscribers:
+            subscriber.finish()
+
+    def _publish(self, entry: dict) -> None:
+        self.backlog.append(entry)
+        for subscriber in self._subscribers:
+            subscriber.push(entry)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        last_time = ""
+        while True:
+            if last_time:
+                # Nach Reconnect nur Neues lesen
+                command = logs_command(self.container, since=last_time, follow=True)
+            else:
+                command = logs_command(self.container, tail=settings.docker_log_backlog, follow=True)
+            resume = parse_timestamp(last_time) if last_time else None
+            gone = False
+            try:
+                async with ssh_watch(self.ip, command) as proc:
+                    self.running = True
+                    self.error = ""
+                    reader = asyncio.ensure_future(proc.stdout.readline())
+                    try:
+                        while True:
+                            done, _ = await asyncio.wait({reader}, timeout=0.2)
+                            if not done:
+                                # Backlog vollständig gelesen, ab jetzt live
+                                self._ready.set()
+                                continue
+                            line = reader.result()
+                            if not line:
+                                break
+                            entry = make_entry(line)
+                            time = parse_timestamp(entry["time"]) if entry["time"] else None
+                            if time is None:
+                                # Meldung von docker selbst, keine Log-Zeile des Containers
+                                gone = gone or _NO_SUCH_CONTAINER in entry["line"]
+                                self._publish(entry)
+                            elif resume is None or time > resume:
+                                self._publish(entry)
+                                last_time = entry["time"]
+                                resume = None
+                                # Erst eine echte Log-Zeile zeigt, dass der Stream wieder läuft
+                                backoff = 1.0
+                            reader = asyncio.ensure_future(proc.stdout.readline())
+                    finally:
+                        reader.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.error = str(e) or e.__class__.__name__
+                logger.info("docker logs %s/%s unterbrochen: %s", self.host, self.container, self.error)
+            finally:
+                self.running = False
+                self._ready.set()
+            if gone:
+                # Kein Reconnect: Zuschauer bekommen das Ende, der Stream bleibt als Fehler sichtbar
+                self.error = f"Container {self.container} existiert nicht"
+                logger.info("docker logs %s/%s beendet: %s", self.host, self.container, self.error)
+                for subscriber in self._subscribers:
+                    subscriber.finish()
+                return
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, settings.docker_state_retry_max)
+
+
+class DockerLogHub:
+    """Verwaltet die geteilten Log-Streams (host, container)."""
+
+    def __init__(self):
+        self._streams: dict[tuple[str, str], ContainerLogStream] = {}
+
+    def stream(self, host: str, ip: str, container: str) -> ContainerLogStream:
+        key = (host, container)
+        stream = self._streams.get(key)
+        if stream is None or stream.ip != ip:
+            if stream:
+                stream.stop()
+            stream = ContainerLogStream(host, ip, container)
+            self._streams[key] = stream
+        return stream
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "host": s.host,
+                "container": s.container,
+                "subscribers": s.subscribers,
+                "running": s.running,
+                "error": s.error,
+            }
+            for s in self._streams.values()
+            if s._task is not None
+        ]
+
+    def stop(self) -> None:
+        for stream in self._streams.values():
+            stream.stop()
+        self._streams.clear()
+
+
+# Globale Instanz
+docker_logs = DockerLogHub()
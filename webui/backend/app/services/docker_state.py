@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import time
+
+from ..config import settings
+from ..models.docker import Container, DockerOverview
+from ..models.vps import VPS
+from .hosts import parse_hosts_file
+from .ssh import SSHPriority, run_ssh, ssh_priority, ssh_watch
+
+logger = logging.getLogger(__name__)
+
+# rc 127 = Docker nicht installiert
+SNAPSHOT_COMMAND = (
+    "command -v docker >/dev/null 2>&1 || exit 127; sudo docker ps -a --format json"
+)
+EVENTS_COMMAND = (
+    "command -v docker >/dev/null 2>&1 || exit 127; "
+    "exec sudo docker events --format '{{json .}}' --filter type=container"
+)
+
+
+def _compose_project(labels: str) -> str:
+    """Liest das Compose-Projekt aus dem Labels-Feld von `docker ps` ("k=v,k=v")."""
+    for label in labels.split(","):
+        key, _, value = label.partition("=")
+        if key == "com.docker.compose.project":
+            return value
+    return ""
+
+
+def parse_containers(stdout: str) -> list[Container]:
+    """Parst die Ausgabe von `docker ps -a --format json` (ein JSON-Objekt pro Zeile)."""
+    containers = []
+    for line in stdout.strip().split("\n"):
+        if not line.strip():
+            continue
+        try:
+            c = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        containers.append(
+            Container(
+                id=c.get("ID", ""),
+                name=c.get("Names", ""),
+                image=c.get("Image", ""),
+                status=c.get("Status", ""),
+                state=c.get("State", ""),
+                ports=c.get("Ports", ""),
+                created=c.get("CreatedAt", ""),
+                project=_compose_project(c.get("Labels", "")),
+            )
+        )
+    return containers
+
+
+class HostDockerState:
+    """Zuletzt bekannter Container-Stand eines Hosts."""
+
+    def __init__(self, vps: VPS):
+        self.name = vps.name
+        self.ip = vps.ip
+        self.online = False
+        self.docker_installed = False
+        self.containers: list[Container] = []
+        self.synced_at: float | None = None
+        self.connected = False  # docker events läuft
+        self.version = 0
+        self.error = ""
+        self.ready = asyncio.Event()  # erster Abgleich erfolgt
+        self._dirty = False
+        self._resync_task: asyncio.Task | None = None
+
+    def overview(self) -> DockerOverview:
+        running = sum(1 for c in self.containers if c.state == "running")
+        return DockerOverview(
+            host=self.name,
+            online=self.online,
+            docker_installed=self.docker_installed,
+            containers=list(self.containers),
+            running=running,
+            stopped=len(self.containers) - running,
+        )
+
+
+class DockerStateManager:
+    """Hält den Container-Stand aller managed Hosts im Speicher.
+
+    Pro Host läuft ein langlebiger `docker events`-Stream; jedes Event löst
+    (gebündelt über docker_events_debounce) einen neuen `docker ps`-Abgleich
+    aus. Bricht der Stream ab, wird mit Backoff neu verbunden. Endpunkte
+    lesen nur aus dem Speicher und brauchen keine SSH-Aufrufe.
+    """
+
+    def __init__(self):
+        self._states: dict[str, HostDockerState] = {}
+        self._watchers: dict[str, asyncio.Task] = {}
+        self._started = False
+        self.version = 0  # Zählt jede Änderung über alle Hosts
+
+    def _sync_hosts(self) -> list[VPS]:
+        """Startet/stoppt Watcher passend zum Inventar und liefert alle Hosts."""
+        hosts = parse_hosts_file()
+        if not self._started:
+            return hosts
+        wanted = {h.name: h for h in hosts if h.managed}
+        for name in list(self._states):
+            state = self._states[name]
+            vps = wanted.get(name)
+            if vps is None or vps.ip != state.ip:
+                self._stop_watcher(name)
+        for name, vps in wanted.items():
+            if name not in self._states:
+                self._start_watcher(vps)
+        return hosts
+
+    def _start_watcher(self, vps: VPS) -> None:
+        state = HostDockerState(vps)
+        self._states[vps.name] = state
+        self._watchers[vps.name] = asyncio.create_task(self._watch(state))
+
+    def _stop_watcher(self, name: str) -> None:
+        state = self._states.pop(name, None)
+        task = self._watchers.pop(name, None)
+        if task:
+            task.cancel()
+        if state and state._resync_task:
+            state._resync_task.cancel()
+
+    async def _snapshot(self, state: HostDockerState) -> None:
+        code, stdout, stderr = await run_ssh(state.ip, SNAPSHOT_COMMAND, timeout=10)
+        if code == 127:
+            online, installed, containers = True, False, []
+        elif code == 0:
+            online, installed, containers = True, True, parse_containers(stdout)
+        else:
+            online, installed, containers = False, state.docker_installed, state.containers
+            state.error = stderr
+        if code in (0, 127):
+            state.error = ""
+        if (online, installed, containers) != (state.online, state.docker_installed, state.containers):
+            state.online, state.docker_installed, state.containers = online, installed, containers
+            state.version += 1
+            self.version += 1
+        state.synced_at = time.time()
+        state.ready.set()
+
+    def _schedule_resync(self, state: HostDockerState) -> None:
+        """Bündelt Events: ein Abgleich pro Debounce-Fenster, keiner geht verloren."""
+        state._dirty = True
+        if state._resync_task and not state._resync_task.done():
+            return
+
+        async def resync():
+            while state._dirty:
+                state._dirty = False
+                await asyncio.sleep(settings.docker_events_debounce)
+                await self._snapshot(state)
+
+        state._resync_task = asyncio.create_task(resync())
+
+    async def _read_events(self, state: HostDockerState, proc) -> None:
+        """Liest Events bis zum Ende des Streams; ohne Events wird periodisch abgeglichen."""
+        read = asyncio.ensure_future(proc.stdout.readline())
+        try:
+            while True:
+                done, _ = await asyncio.wait({read}, timeout=settings.docker_state_resync)
+                if not done:
+                    self._schedule_resync(state)
+                    continue
+                if not read.result():
+                    return
+                self._schedule_resync(state)
+                read = asyncio.ensure_future(proc.stdout.readline())
+        finally:
+            read.cancel()
+
+    async def _watch(self, state: HostDockerState) -> None:
+        backoff = 1.0
+        with ssh_priority(SSHPriority.background):
+            while True:
+                started = time.monotonic()
+                try:
+                    async with ssh_watch(state.ip, EVENTS_COMMAND) as proc:
+                        # Erst nach dem Start des Streams abgleichen, damit
+                        # dazwischen keine Änderung verloren geht
+                        await self._snapshot(state)
+                        state.connected = state.docker_installed
+                        await self._read_events(state, proc)
+                    if not state.docker_installed:
+                        # Ohne Docker nur selten neu prüfen
+                        backoff = settings.docker_state_retry_max
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    state.error = str(e) or e.__class__.__name__
+                    if state.online:
+                        state.online = False
+                        state.version += 1
+                        self.version += 1
+                    state.ready.set()
+                    logger.info("docker events auf %s unterbrochen: %s", state.name, state.error)
+                finally:
+                    state.connected = False
+                # Lief der Stream länger, sofort wieder schnell neu verbinden
+                if time.monotonic() - started > settings.docker_state_retry_max:
+                    backoff = 1.0
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, settings.docker_state_retry_max)
+
+    def start(self) -> None:
+        """Startet die Watcher für alle managed Hosts."""
+        self._started = True
+        self._sync_hosts()
+
+    def stop(self) -> None:
+        self._started = False
+        for name in list(self._states):
+            self._stop_watcher(name)
+
+    def states(self) -> list[HostDockerState]:
+        self._sync_hosts()
+        return list(self._states.values())
+
+    def get(self, name: str) -> HostDockerState | None:
+        self._sync_hosts()
+        return self._states.get(name)
+
+    async def wait_ready(self, names: list[str] | None = None, timeout: float = 10) -> None:
+        """Wartet (begrenzt) auf den ersten Abgleich, z.B. direkt nach dem Start."""
+        states = [
+            s for n, s in self._states.items()
+            if (names is None or n in names) and not s.ready.is_set()
+        ]
+        if states:
+            waiters = [asyncio.create_task(s.ready.wait()) for s in states]
+            _, pending = await asyncio.wait(waiters, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def refresh(self, name: str) -> None:
+        """Stößt einen Abgleich an (z.B. nach start/stop über die API)."""
+        state = self._states.get(name)
+        if state:
+            self._schedule_resync(state)
+
+    def restart(self, name: str) -> None:
+        """Verbindet den Watcher eines Hosts neu (z.B. nach Docker-Installation)."""
+        self._stop_watcher(name)
+        self._sync_hosts()
+
+    async def overview(self) -> list[DockerOverview]:
+        hosts = self._sync_hosts()
+        await self.wait_ready()
+        result = []
+        for vps in hosts:
+            state = self._states.get(vps.name)
+            result.append(state.overview() if state else DockerOverview(host=vps.name, online=False))
+        return result
+
+    def stats(self) -> list[dict]:
+        now = time.time()
+        return [
+            {
+                "host": s.name,
+                "online": s.online,
+                "docker_installed": s.docker_installed,
+                "connected": s.connected,
+                "containers": len(s.containers),
+                "age_seconds": round(now - s.synced_at, 1) if s.synced_at else None,
+                "error": s.error,
+            }
+            for s in self._states.values()
+        ]
+
+
+# Globale Instanz
+docker_state = DockerStateManager()
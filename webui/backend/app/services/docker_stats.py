@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+
+from ..config import settings
+from ..models.docker import ContainerStats
+from .ssh import ssh_watch
+
+logger = logging.getLogger(__name__)
+
+STATS_COMMAND = "exec sudo docker stats --format '{{json .}}'"
+
+# Auflösung (Sekunden) -> Anzahl gehaltener Punkte
+RESOLUTIONS = {1: 300, 10: 360, 60: 360}
+
+# Container ohne Messwert so lange behalten (z.B. kurz gestoppt)
+CONTAINER_EXPIRE = 300
+
+_UNITS = {
+    "b": 1,
+    "kb": 1000, "mb": 1000**2, "gb": 1000**3, "tb": 1000**4,
+    "kib": 1024, "mib": 1024**2, "gib": 1024**3, "tib": 1024**4,
+}
+_SIZE_RE = re.compile(r"^\s*([\d.]+)\s*([a-zA-Z]*)\s*$")
+
+
+def _parse_size(value: str) -> int:
+    """'12.5MiB' / '3kB' / '0B' -> Bytes."""
+    m = _SIZE_RE.match(value)
+    if not m:
+        return 0
+    return int(float(m.group(1)) * _UNITS.get(m.group(2).lower() or "b", 1))
+
+
+def _parse_pair(value: str) -> tuple[int, int]:
+    """'1.2kB / 3kB' -> (1200, 3000)."""
+    left, _, right = value.partition("/")
+    return _parse_size(left), _parse_size(right)
+
+
+def _parse_percent(value: str) -> float:
+    try:
+        return float(value.strip().rstrip("%"))
+    except ValueError:
+        return 0.0
+
+
+def parse_stats_line(line: str) -> dict | None:
+    """Parst eine Zeile aus `docker stats --format json` in Rohwerte.
+
+    docker stats schreibt vor jedem Durchlauf ANSI-Steuerzeichen zum
+    Bildschirm-Löschen, daher wird ab der ersten '{' gelesen.
+    """
+    start = line.find("{")
+    if start < 0:
+        return None
+    try:
+        data = json.loads(line[start:])
+    except json.JSONDecodeError:
+        return None
+    name = data.get("Name", "")
+    if not name or name == "--":
+        return None
+    memory_used, memory_limit = _parse_pair(data.get("MemUsage", ""))
+    net_rx, net_tx = _parse_pair(data.get("NetIO", ""))
+    block_read, block_write = _parse_pair(data.get("BlockIO", ""))
+    try:
+        pids = int(data.get("PIDs", "0"))
+    except ValueError:
+        pids = 0
+    return {
+        "container": name,
+        "cpu_percent": _parse_percent(data.get("CPUPerc", "")),
+        "memory_used": memory_used,
+        "memory_limit": memory_limit,
+        "memory_percent": _parse_percent(data.get("MemPerc", "")),
+        "net_rx": net_rx,
+        "net_tx": net_tx,
+        "block_read": block_read,
+        "block_write": block_write,
+        "pids": pids,
+    }
+
+
+class _Series:
+    """Downsampling eines Containers auf eine Auflösung.
+
+    CPU/RAM werden über das Fenster gemittelt, Zähler (Netz, Block-IO,
+    PIDs) nehmen den letzten Wert. Ein Fenster wird abgeschlossen, sobald
+    der erste Messwert des nächsten Fensters eintrifft.
+    """
+
+    def __init__(self, resolution: int, maxlen: int):
+        self.resolution = resolution
+        self.points: deque[ContainerStats] = deque(maxlen=maxlen)
+        self._bucket: float | None = None
+        self._count = 0
+        self._sums: dict[str, float] = {}
+        self._last: dict = {}
+
+    def add(self, host: str, ts: float, sample: dict) -> ContainerStats | None:
+        bucket = ts - ts % self.resolution
+        closed = None
+        if self._bucket is not None and bucket != self._bucket and self._count:
+            closed = self._flush(host)
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self._count = 0
+            self._sums = {"cpu_percent": 0.0, "memory_used": 0.0, "memory_percent": 0.0}
+        self._count += 1
+        for key in self._sums:
+            self._sums[key] += sample[key]
+        self._last = sample
+        return closed
+
+    def _flush(self, host: str) -> ContainerStats:
+        point = ContainerStats(
+            host=host,
+            container=self._last["container"],
+            time=self._bucket,
+            resolution=self.resolution,
+            cpu_percent=round(self._sums["cpu_percent"] / self._count, 2),
+            memory_used=int(self._sums["memory_used"] / self._count),
+            memory_limit=self._last["memory_limit"],
+            memory_percent=round(self._sums["memory_percent"] / self._count, 2),
+            net_rx=self._last["net_rx"],
+            net_tx=self._last["net_tx"],
+            block_read=self._last["block_read"],
+            block_write=self._last["block_write"],
+            pids=self._last["pids"],
+        )
+        self.points.append(point)
+        return point
+
+
+class HostStatsStream:
+    """Ein `docker stats`-Stream pro Host, geteilt von allen Abonnenten."""
+
+    def __init__(self, name: str, ip: str):
+        self.name = name
+        self.ip = ip
+        self.error = ""
+        self._series: dict[str, dict[int, _Series]] = {}
+        self._seen: dict[str, float] = {}
+        self._subscribers: dict[asyncio.Queue, int] = {}  # Queue -> Auflösung
+        self._task: asyncio.Task | None = None
+        self._stop_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def history(self, resolution: int) -> list[ContainerStats]:
+        points = [p for series in self._series.values() for p in series[resolution].points]
+        points.sort(key=lambda p: p.time)
+        return points
+
+    def subscribe(self, queue: asyncio.Queue, resolution: int) -> None:
+        if self._stop_handle:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        self._subscribers[queue] = resolution
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.pop(queue, None)
+        if not self._subscribers and self._task and not self._stop_handle:
+            # Kurz weiterlaufen lassen, damit ein Reload den Stream weiternutzt
+            self._stop_handle = asyncio.get_running_loop().call_later(
+                settings.docker_stream_idle, self.stop
+            )
+
+    def stop(self) -> None:
+        self._stop_handle = None
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, points: list[ContainerStats]) -> None:
+        for queue, resolution in self._subscribers.items():
+            batch = [p for p in points if p.resolution == resolution]
+            if not batch:
+                continue
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                pass  # Langsamer Client verliert Punkte, der Stream läuft weiter
+
+    def _add(self, sample: dict) -> None:
+        now = time.time()
+        name = sample["container"]
+        self._seen[name] = now
+        series = self._series.get(name)
+        if series is None:
+            series = {r: _Series(r, n) for r, n in RESOLUTIONS.items()}
+            self._series[name] = series
+        closed = [p for s in series.values() if (p := s.add(self.name, now, sample))]
+        if closed:
+            self._publish(closed)
+
+        for old, seen in list(self._seen.items()):
+            if now - seen > CONTAINER_EXPIRE:
+                del self._seen[old]
+                self._series.pop(old, None)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with ssh_watch(self.ip, STATS_COMMAND) as proc:
+                    self.error = ""
+                    while True:
+                        line = await proc.stdout.readline()
+                        if not line:
+                            break
+                        sample = parse_stats_line(line)
+                        if sample:
+                            backoff = 1.0
+                            self._add(sample)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.error = str(e) or e.__class__.__name__
+                logger.info("docker stats auf %s unterbrochen: %s", self.name, self.error)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, settings.docker_state_retry_max)
+
+
+class DockerStatsHub:
+    """Verwaltet die geteilten Stats-Streams (gestartet beim ersten Abonnenten)."""
+
+    def __init__(self):
+        self._streams: dict[str, HostStatsStream] = {}
+
+    def stream(self, name: str, ip: str) -> HostStatsStream:
+        stream = self._streams.get(name)
+        if stream is None or stream.ip != ip:
+            if stream:
+                stream.stop()
+            stream = HostStatsStream(name, ip)
+            self._streams[name] = stream
+        return stream
+
+    def stats(self) -> list[dict]:
+        return [
+            {"host": s.name, "subscribers": s.subscribers, "running": s._task is not None, "error": s.error}
+            for s in self._streams.values()
+        ]
+
+    def stop(self) -> None:
+        for stream in self._streams.values():
+            stream.stop()
+        self._streams.clear()
+
+
+# Globale Instanz
+docker_stats = DockerStatsHub()
@@ -0,0 +1,61 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+
+from ..models.event import Event
+
+
+class EventBus:
+    """Strukturierte Ereignisse des Backends (z.B. Ergebnis eines Netzwerk-Scans).
+
+    Die letzten Ereignisse bleiben zum Abruf per REST erhalten, Live-Abonnenten
+    bekommen neue Ereignisse über eine Queue. Volle Queues (hängender Client)
+    verlieren Ereignisse, statt den Publisher zu blockieren.
+    """
+
+    def __init__(self, max_events: int = 500, queue_size: int = 100):
+        self._events: deque[Event] = deque(maxlen=max_events)
+        self._next_id = 1
+        self._queue_size = queue_size
+        self._subscribers: list[asyncio.Queue] = []
+
+    def publish(self, event_type: str, data: dict) -> Event:
+        event = Event(
+            id=self._next_id,
+            type=event_type,
+            time=datetime.now(timezone.utc).isoformat(),
+            data=data,
+        )
+        self._next_id += 1
+        self._events.append(event)
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+        return event
+
+    def recent(
+        self, since: int = 0, event_type: str | None = None, limit: int = 100
+    ) -> list[Event]:
+        """Ereignisse mit id > since (älteste zuerst), optional nach Typ gefiltert."""
+        events = [
+            e for e in self._events
+            if e.id > since and (event_type is None or e.type == event_type)
+        ]
+        return events[-limit:]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        try:
+            self._subscribers.remove(queue)
+        except ValueError:
+            pass
+
+
+# Globale Instanz
+event_bus = EventBus()
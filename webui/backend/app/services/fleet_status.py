@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from pydantic import ValidationError
+
+from ..config import settings
+from ..models.vps import VPS, VPSStatus, FleetHostStatus, FleetStatus
+from .hosts import parse_hosts_file
+from .inventory import inventory
+from .probe import collect_status
+from .ssh import SSHPriority, ssh_priority
+
+logger = logging.getLogger(__name__)
+
+
+def _fleet_hosts() -> list[VPS]:
+    """Alle Hosts der Flotte inkl. Proxy (wie GET /vps/)."""
+    proxy = VPS(name="proxy", host="proxy", ip=settings.proxy_host)
+    return [proxy] + parse_hosts_file()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class FleetStatusCache:
+    """Hält den letzten Status aller Hosts und aktualisiert ihn im Hintergrund.
+
+    Abfragen liefern immer sofort den letzten Stand (stale-while-revalidate):
+    veraltete Einträge lösen eine asynchrone Aktualisierung aus, statt zu blockieren.
+    Der Stand wird auf Platte gesichert, damit nach einem Neustart sofort Daten da sind.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[VPSStatus, float]] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop_task: asyncio.Task | None = None
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(settings.data_dir, "fleet-status.json")
+
+    def load(self) -> None:
+        """Lädt den gespeicherten Snapshot von der Platte."""
+        try:
+            with open(self._snapshot_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Fleet-Snapshot nicht lesbar: %s", e)
+            return
+
+        for name, entry in data.items():
+            try:
+                self._entries[name] = (VPSStatus(**entry["status"]), float(entry["updated_at"]))
+            except (KeyError, TypeError, ValueError, ValidationError):
+                continue
+        logger.info("Fleet-Snapshot geladen: %d Hosts", len(self._entries))
+
+    def save(self) -> None:
+        """Schreibt den Snapshot atomar auf die Platte."""
+        data = {
+            name: {"status": status.model_dump(), "updated_at": updated_at}
+            for name, (status, updated_at) in self._entries.items()
+        }
+        try:
+            os.makedirs(settings.data_dir, exist_ok=True)
+            tmp_path = f"{self._snapshot_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._snapshot_path)
+        except OSError as e:
+            logger.warning("Fleet-Snapshot konnte nicht gespeichert werden: %s", e)
+
+    def update(self, name: str, status: VPSStatus) -> None:
+        """Übernimmt einen frisch ermittelten Status (z.B. aus GET /vps/{host}/status)."""
+        self._entries[name] = (status, time.time())
+
+    async def refresh_host(self, vps: VPS) -> VPSStatus:
+        """Fragt einen Host ab (begrenzt durch fleet_refresh_concurrency)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.fleet_refresh_concurrency)
+        async with self._semaphore:
+            with ssh_priority(SSHPriority.background):
+                status = await collect_status(vps.name, vps.ip, managed=vps.managed)
+        self.update(vps.name, status)
+        inventory.record_status(vps.name, status)
+        return status
+
+    def request_refresh(self, vps: VPS) -> None:
+        """Startet eine Aktualisierung im Hintergrund, falls nicht schon eine läuft."""
+        task = self._refreshing.get(vps.name)
+        if task and not task.done():
+            return
+        task = asyncio.create_task(self.refresh_host(vps))
+        self._refreshing[vps.name] = task
+        task.add_done_callback(lambda t, name=vps.name: self._refresh_done(name, t))
+
+    def _refresh_done(self, name: str, task: asyncio.Task) -> None:
+        if self._refreshing.get(name) is task:
+            del self._refreshing[name]
+        if not task.cancelled() and task.exception():
+            logger.warning("Status-Aktualisierung für %s fehlgeschlagen: %s", name, task.exception())
+
+    async def refresh_all(self) -> None:
+        """Aktualisiert alle Hosts und sichert den Snapshot."""
+        hosts = _fleet_hosts()
+        for vps in hosts:
+            self.request_refresh(vps)
+        pending = [self._refreshing[vps.name] for vps in hosts if vps.name in self._refreshing]
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        # Entfernte Hosts aus dem Snapshot werfen
+        names = {vps.name for vps in hosts}
+        for name in list(self._entries):
+            if name not in names:
+                del self._entries[name]
+        self.save()
+        inventory.prune_history()
+
+    def snapshot(self) -> FleetStatus:
+        """Liefert den aktuellen Stand sofort; veraltete Einträge werden im Hintergrund aktualisiert."""
+        now = time.time()
+        result = []
+        for vps in _fleet_hosts():
+            entry = self._entries.get(vps.name)
+            if entry is None:
+                status, age = VPSStatus(host=vps.name, online=False), None
+                updated_at = ""
+            else:
+                status, ts = entry
+                age = now - ts
+                updated_at = _iso(ts)
+            stale = age is None or age > settings.fleet_stale_after
+            if stale:
+                self.request_refresh(vps)
+            result.append(
+                FleetHostStatus(
+                    status=status,
+                    updated_at=updated_at,
+                    age_seconds=round(age, 1) if age is not None else None,
+                    stale=stale,
+                    refreshing=vps.name in self._refreshing,
+                )
+            )
+        return FleetStatus(
+            generated_at=_iso(now),
+            refresh_interval=settings.fleet_refresh_interval,
+            hosts=result,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.warning("Fleet-Aktualisierung fehlgeschlagen: %s", e)
+            await asyncio.sleep(settings.fleet_refresh_interval)
+
+    def start(self) -> None:
+        """Lädt den Snapshot und startet die periodische Aktualisierung."""
+        self.load()
+        if settings.fleet_refresh_interval > 0 and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self.save()
+
+
+# Globale Instanz
+fleet_status = FleetStatusCache()
@@ -1,33 +1,147 @@
+import os
+import shlex
+import time
+
 from ..config import settings
 from ..models.vps import VPS
+from .inventory import inventory
+from .ssh import run_ssh
 
 
-def parse_hosts_file() -> list[VPS]:
-    """Liest und parst /etc/vps-hosts.
+def _parse_hosts_lines(lines) -> list[VPS]:
+    """Parst Zeilen im Format von /etc/vps-hosts.
 
-    Format: IP HOSTNAME (pro Zeile, # = Kommentar)
+    Format: IP HOSTNAME [unmanaged] (pro Zeile, # = Kommentar)
     """
     hosts: list[VPS] = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) >= 3 and parts[2] == "unmanaged":
+            hosts.append(VPS(name=parts[1], host=parts[1], ip=parts[0], managed=False))
+        elif len(parts) >= 2:
+            ip, name = parts[0], parts[1]
+            hosts.append(VPS(name=name, host=name, ip=ip))
+        elif len(parts) == 1:
+            ip = parts[0]
+            hosts.append(VPS(name=ip, host=ip, ip=ip))
+    return hosts
+
+
+class HostRegistry:
+    """In-Memory-Index über das Host-Inventar.
+
+    Quelle ist die Inventar-DB. Externe Änderungen an /etc/vps-hosts
+    (z.B. durch vps-cli.sh) werden ins Inventar übernommen, sobald sich
+    Inode, mtime oder Größe der Datei ändern. Geprüft wird höchstens alle
+    hosts_check_interval Sekunden, dazwischen sind Lookups reine
+    Dict-Zugriffe ohne Syscall.
+    """
+
+    def __init__(self):
+        self._hosts: list[VPS] = []
+        self._by_name: dict[str, VPS] = {}
+        self._by_ip: dict[str, VPS] = {}
+        self._file_key: tuple | None = None
+        self._checked_at = 0.0
+        self._loaded = False
+
+    def _stat_key(self) -> tuple | None:
+        try:
+            st = os.stat(settings.vps_hosts_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> None:
+        try:
+            with open(settings.vps_hosts_file, "r") as f:
+                inventory.sync_hosts(_parse_hosts_lines(f))
+        except FileNotFoundError:
+            pass
+        self.reload()
+
+    def reload(self) -> None:
+        """Baut die Indizes aus dem Inventar neu auf (nach Änderungen in der DB)."""
+        hosts = inventory.list_hosts()
+        self._hosts = hosts
+        self._by_name = {}
+        self._by_ip = {}
+        for h in hosts:
+            # Erster Eintrag gewinnt (wie bei der bisherigen linearen Suche)
+            self._by_name.setdefault(h.name, h)
+            self._by_ip.setdefault(h.ip, h)
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < settings.hosts_check_interval:
+            return
+        self._checked_at = now
+        key = self._stat_key()
+        if not self._loaded or key != self._file_key:
+            self._file_key = key
+            self._load()
+            self._loaded = True
+
+    def invalidate(self) -> None:
+        """Erzwingt die Prüfung beim nächsten Zugriff (nach eigenem Schreiben)."""
+        self._checked_at = 0.0
+
+    def mark_synced(self) -> None:
+        """Übernimmt den aktuellen Datei-Stand als bekannt und lädt aus dem Inventar."""
+        self._file_key = self._stat_key()
+        self._checked_at = time.monotonic()
+        self._loaded = True
+        self.reload()
 
+    def hosts(self) -> list[VPS]:
+        self._refresh()
+        return list(self._hosts)
+
+    def by_name(self, name: str) -> VPS | None:
+        self._refresh()
+        return self._by_name.get(name)
+
+    def by_ip(self, ip: str) -> VPS | None:
+        self._refresh()
+        return self._by_ip.get(ip)
+
+    def find(self, name_or_ip: str) -> VPS | None:
+        """Sucht einen Host über Name oder IP."""
+        return self.by_name(name_or_ip) or self.by_ip(name_or_ip)
+
+
+# Globale Instanz
+host_registry = HostRegistry()
+
+
+async def write_hosts_file() -> None:
+    """Erzeugt /etc/vps-hosts aus dem Inventar.
+
+    Die Datei wird in-place geschrieben (im Container per Bind-Mount
+    eingehängt, ein rename würde den Mount aushebeln). Fehlen die Rechte,
+    wird über den Proxy mit sudo geschrieben.
+    """
+    content = inventory.render_hosts_file()
     try:
-        with open(settings.vps_hosts_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                parts = line.split()
-                if len(parts) >= 3 and parts[2] == "unmanaged":
-                    hosts.append(VPS(name=parts[1], host=parts[1], ip=parts[0], managed=False))
-                elif len(parts) >= 2:
-                    ip, name = parts[0], parts[1]
-                    hosts.append(VPS(name=name, host=name, ip=ip))
-                elif len(parts) == 1:
-                    ip = parts[0]
-                    hosts.append(VPS(name=ip, host=ip, ip=ip))
-    except FileNotFoundError:
-        pass
+        with open(settings.vps_hosts_file, "w") as f:
+            f.write(content)
+    except PermissionError:
+        code, _, err = await run_ssh(
+            "proxy",
+            f"printf %s {shlex.quote(content)} | sudo tee {shlex.quote(settings.vps_hosts_file)} > /dev/null",
+        )
+        if code != 0:
+            raise RuntimeError(f"{settings.vps_hosts_file} konnte nicht geschrieben werden: {err}")
+    # Eigene Änderung: Datei-Stand übernehmen, ohne sie erneut zu importieren
+    host_registry.mark_synced()
 
-    return hosts
+
+def parse_hosts_file() -> list[VPS]:
+    """Liefert alle Hosts aus /etc/vps-hosts (aus dem Registry-Cache)."""
+    return host_registry.hosts()
 
 
 def resolve_host(name_or_ip: str) -> str | None:
@@ -43,17 +157,11 @@ def resolve_host(name_or_ip: str) -> str | None:
     if len(parts) == 4 and all(p.isdigit() for p in parts):
         return name_or_ip
 
-    # Suche in Hosts-Datei
-    for host in parse_hosts_file():
-        if host.name == name_or_ip or host.host == name_or_ip:
-            return host.ip
-
-    return None
+    host = host_registry.by_name(name_or_ip)
+    return host.ip if host else None
 
 
 def get_host_name(ip: str) -> str:
     """Gibt den Hostnamen für eine IP zurück."""
-    for host in parse_hosts_file():
-        if host.ip == ip:
-            return host.name
-    return ip
+    host = host_registry.by_ip(ip)
+    return host.name if host else ip
@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shlex
+from typing import Awaitable, Callable
+
+import asyncssh
+import yaml
+
+from ..config import settings
+from ..models.deploy import Template
+from .deployer import COMPOSE_FILE, build_bundle, transfer_bundle
+from .ssh import resolve_ssh_target, run_ssh, run_ssh_stream, ssh_session, ssh_watch
+from .template_engine import RenderedTemplate
+
+logger = logging.getLogger(__name__)
+
+# Vorhandene Image-IDs auf einem Host, eine Zeile pro Image ("-" = fehlt)
+INSPECT_SCRIPT = (
+    "for i in {images}; do "
+    "sudo docker image inspect --format '{{{{.Id}}}}' \"$i\" 2>/dev/null || echo -; "
+    "done"
+)
+
+# Archiv pro Image-ID auf dem Proxy, wird für alle Hosts wiederverwendet
+SAVE_SCRIPT = """\
+dir={dir}
+sudo mkdir -p "$dir" && sudo chown {owner} "$dir" || exit 1
+find "$dir" -name '*.tar.gz' -mtime +{days} -delete 2>/dev/null
+f="$dir/{name}.tar.gz"
+if [ ! -s "$f" ]; then
+    sudo docker save {image} | gzip -1 > "$f.tmp" && mv "$f.tmp" "$f" || exit 1
+fi
+echo "$f"
+"""
+
+# Das Archiv enthält das Image ohne Tag (gespeichert per ID), daher danach taggen
+LOAD_SCRIPT = "gunzip | sudo docker load >/dev/null && sudo docker tag {image_id} {image}"
+
+_BUILD_ID_PREFIX = "IMAGE-ID "
+
+# ${VAR}, ${VAR:-default}, ${VAR-default}, $VAR und $$ wie in docker compose
+_VAR_RE = re.compile(r"\$(?:\$|\{([A-Za-z_]\w*)(?:(:?-)([^}]*))?\}|([A-Za-z_]\w*))")
+
+
+class ImageSpec:
+    """Image eines Compose-Services: gebaut (build) oder aus einer Registry."""
+
+    def __init__(self, service: str, image: str, build: dict | None):
+        self.service = service
+        self.image = image
+        self.build = build
+
+
+def compose_project(deploy_dir: str) -> str:
+    """Projektname wie docker compose ihn aus dem Verzeichnis ableitet."""
+    name = re.sub(r"[^a-z0-9_-]", "", os.path.basename(deploy_dir.rstrip("/")).lower())
+    return name.lstrip("_-")
+
+
+def service_images(rendered: RenderedTemplate, deploy_dir: str) -> list[ImageSpec]:
+    """Images aller aktiven Services aus der gerenderten docker-compose.yml."""
+    files = {rel_path: data for rel_path, data, _ in rendered.files}
+    try:
+        compose = yaml.safe_load(files.get(COMPOSE_FILE, b"")) or {}
+    except yaml.YAMLError:
+        return []
+    active = set(rendered.profiles)
+    project = compose_project(deploy_dir)
+
+    specs = []
+    for name, service in (compose.get("services") or {}).items():
+        service = service or {}
+        if service.get("profiles") and not active & set(service["profiles"]):
+            continue
+        build = service.get("build")
+        if isinstance(build, str):
+            build = {"context": build}
+        if build:
+            # Ohne image: benennt compose gebaute Images <projekt>-<service>
+            specs.append(ImageSpec(name, service.get("image") or f"{project}-{name}", build))
+        elif service.get("image"):
+            specs.append(ImageSpec(name, service["image"], None))
+    return specs
+
+
+def interpolate(value: str, values: dict[str, str]) -> str:
+    """Setzt Variablen aus der .env ein, wie compose es beim Build tut."""
+
+    def repl(m: re.Match) -> str:
+        if m.group(0) == "$$":
+            return "$"
+        name = m.group(1) or m.group(4)
+        value = values.get(name)
+        if m.group(2) == ":-" and not value or m.group(2) == "-" and value is None:
+            return m.group(3)
+        return value or ""
+
+    return _VAR_RE.sub(repl, value)
+
+
+def build_args(spec: ImageSpec, values: dict[str, str]) -> dict[str, str]:
+    """Build-Args des Services mit eingesetzten Variablen.
+
+    Args ohne Wert (Liste: "KEY", Mapping: KEY: null) kommen aus der .env
+    und entfallen, wenn sie dort fehlen.
+    """
+    raw = spec.build.get("args") or {}
+    if isinstance(raw, list):
+        raw = {k: v if sep else None for k, sep, v in (a.partition("=") for a in raw)}
+    args = {}
+    for key, value in raw.items():
+        if value is None:
+            if key in values:
+                args[key] = values[key]
+        else:
+            args[key] = interpolate(str(value), values)
+    return args
+
+
+def context_digest(rendered: RenderedTemplate, spec: ImageSpec, args: dict[str, str]) -> str:
+    """Hash über alles, was den Build bestimmt: Dateien unter build.context,
+    Dockerfile, Target und Build-Args; die .env des Hosts gehört nicht dazu."""
+    context = os.path.normpath(spec.build.get("context", "."))
+    dockerfile = os.path.normpath(os.path.join(context, spec.build.get("dockerfile", "Dockerfile")))
+    h = hashlib.sha256()
+    h.update(f"{context}\0{dockerfile}\0{spec.build.get('target', '')}\0".encode())
+    for key in sorted(args):
+        h.update(f"arg:{key}={args[key]}\0".encode())
+    for rel_path, data, mode in sorted(rendered.files):
+        path = os.path.normpath(rel_path)
+        if os.path.basename(path) == ".env":
+            continue
+        if path == dockerfile or context == "." or path.startswith(context + os.sep):
+            h.update(f"file:{path}:{mode:o}:{len(data)}\0".encode())
+            h.update(data)
+    return h.hexdigest()
+
+
+class ImageDistributor:
+    """Baut/pullt Images einmal auf dem Proxy und streamt sie an die Hosts.
+
+    Gleichzeitige Deploys (z.B. ein Rollout) teilen sich Build, Pull und
+    das Archiv eines Images. Ein Host bekommt ein Image nur, wenn er es
+    noch nicht mit derselben ID hat; vorhandene Layer werden dabei nicht
+    einzeln erkannt, übertragen wird immer das ganze Image.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._build_locks: dict[str, asyncio.Lock] = {}  # build_dir -> Lock
+
+    async def _once(self, key: str, factory: Callable[[], Awaitable]):
+        """Führt factory für gleichzeitige Aufrufe mit demselben Schlüssel nur einmal aus."""
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await factory()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # als abgerufen markieren
+            raise
+        finally:
+            del self._inflight[key]
+
+    @staticmethod
+    def is_proxy(ip: str) -> bool:
+        return resolve_ssh_target(ip) == resolve_ssh_target(settings.proxy_host)
+
+    async def _image_ids(self, host: str, images: list[str]) -> dict[str, str]:
+        command = INSPECT_SCRIPT.format(images=" ".join(shlex.quote(i) for i in images))
+        code, stdout, stderr = await run_ssh(host, command, timeout=30)
+        if code != 0:
+            raise RuntimeError(f"Images auf {host} nicht lesbar: {stderr or f'rc={code}'}")
+        ids = stdout.splitlines()
+        return {image: ids[i] for i, image in enumerate(images) if i < len(ids) and ids[i] != "-"}
+
+    async def _build(
+        self,
+        template: Template,
+        rendered: RenderedTemplate,
+        spec: ImageSpec,
+        args: dict[str, str],
+        emit: Callable[[str], Awaitable[None]],
+    ) -> str:
+        build_dir = os.path.join(settings.image_build_dir, template.directory)
+        context = os.path.normpath(os.path.join(build_dir, spec.build.get("context", ".")))
+        command = ["sudo", "docker", "build", "-t", spec.image]
+        if spec.build.get("dockerfile"):
+            command += ["-f", spec.build["dockerfile"]]
+        if spec.build.get("target"):
+            command += ["--target", spec.build["target"]]
+        for key, value in args.items():
+            command += ["--build-arg", f"{key}={value}"]
+        command.append(".")
+        script = (
+            f"cd {shlex.quote(context)} && {' '.join(shlex.quote(a) for a in command)} 2>&1"
+            f" && sudo docker image inspect --format '{_BUILD_ID_PREFIX}{{{{.Id}}}}' {shlex.quote(spec.image)}"
+        )
+
+        # Ein Build-Verzeichnis pro Template: Übertragen und Bauen verschiedener
+        # Stände dürfen sich nicht überschneiden
+        async with self._build_locks.setdefault(build_dir, asyncio.Lock()):
+            await transfer_bundle(settings.proxy_host, build_dir, build_bundle(rendered, env=False))
+            await emit(f"Baue {spec.image} auf dem Proxy...")
+            image_id = ""
+            async for line in run_ssh_stream(settings.proxy_host, script):
+                if line.startswith(_BUILD_ID_PREFIX):
+                    image_id = line[len(_BUILD_ID_PREFIX):].strip()
+                else:
+                    await emit(f"  {line}")
+        if not image_id:
+            raise RuntimeError(f"Build von {spec.image} auf dem Proxy fehlgeschlagen")
+        return image_id
+
+    async def _pull(self, image: str, emit: Callable[[str], Awaitable[None]]) -> str:
+        await emit(f"Pulle {image} auf dem Proxy...")
+        q = shlex.quote(image)
+        code, stdout, stderr = await run_ssh(
+            settings.proxy_host,
+            f"sudo docker pull -q {q} >/dev/null && sudo docker image inspect --format '{{{{.Id}}}}' {q}",
+            timeout=settings.image_transfer_timeout,
+        )
+        if code != 0 or not stdout:
+            raise RuntimeError(f"Pull von {image} auf dem Proxy fehlgeschlagen: {stderr or f'rc={code}'}")
+        return stdout.splitlines()[-1]
+
+    async def _save(self, image_id: str) -> str:
+        """Exportiert das Image per ID, nicht per Tag: der Tag kann inzwischen
+        auf ein neueres Image zeigen."""
+        code, stdout, stderr = await run_ssh(
+            settings.proxy_host,
+            SAVE_SCRIPT.format(
+                dir=shlex.quote(settings.image_cache_dir),
+                owner=shlex.quote(f"{settings.ssh_user}:{settings.ssh_user}"),
+                days=settings.image_cache_days,
+                name=image_id.split(":")[-1],
+                image=shlex.quote(image_id),
+            ),
+            timeout=settings.image_transfer_timeout,
+        )
+        if code != 0 or not stdout:
+            raise RuntimeError(f"docker save {image_id} fehlgeschlagen: {stderr or f'rc={code}'}")
+        return stdout.splitlines()[-1]
+
+    async def _stream(self, ip: str, archive: str, image: str, image_id: str) -> int:
+        """Leitet das Archiv vom Proxy in `docker load` auf dem Host; gibt die Bytes zurück."""
+        total = 0
+        load = LOAD_SCRIPT.format(image_id=shlex.quote(image_id), image=shlex.quote(image))
+        async with ssh_watch(settings.proxy_host, f"cat {shlex.quote(archive)}", encoding=None) as src, \
+                ssh_session(ip, load, encoding=None) as dst:
+            while True:
+                chunk = await src.stdout.read(1 << 20)
+                if not chunk:
+                    break
+                dst.stdin.write(chunk)
+                await dst.stdin.drain()
+                total += len(chunk)
+            dst.stdin.write_eof()
+            result = await dst.wait()
+            if result.returncode != 0:
+                stderr = (result.stderr or b"").decode("utf-8", "replace").strip()
+                raise RuntimeError(f"docker load fehlgeschlagen: {stderr or f'rc={result.returncode}'}")
+        return total
+
+    async def distribute(
+        self,
+        ip: str,
+        template: Template,
+        rendered: RenderedTemplate,
+        services: list[str],
+        emit: Callable[[str], Awaitable[None]],
+    ) -> None:
+        """Stellt die Images der angegebenen Services auf dem Host bereit.
+
+        Gebaute Images kommen immer vom Proxy; Registry-Images nur, wenn
+        der Host sie noch nicht hat (wie `docker compose up` ohne pull).
+        RuntimeError, wenn ein Schritt fehlschlägt.
+        """
+        specs: dict[str, ImageSpec] = {}
+        for spec in service_images(rendered, template.deploy_dir):
+            if spec.service in services:
+                specs.setdefault(spec.image, spec)
+        if not specs:
+            return
+
+        host_ids = await self._image_ids(ip, list(specs))
+        for image, spec in specs.items():
+            if spec.build:
+                args = build_args(spec, rendered.values)
+                digest = context_digest(rendered, spec, args)
+                image_id = await self._once(
+                    f"build:{template.directory}:{spec.image}:{digest}",
+                    lambda: self._build(template, rendered, spec, args, emit),
+                )
+            elif image in host_ids:
+                continue
+            else:
+                image_id = await self._once(f"pull:{image}", lambda: self._pull(image, emit))
+
+            if host_ids.get(image) == image_id:
+                await emit(f"Image {image} bereits aktuell.")
+                continue
+            archive = await self._once(f"save:{image_id}", lambda: self._save(image_id))
+            await emit(f"Übertrage {image} vom Proxy...")
+            try:
+                size = await asyncio.wait_for(
+                    self._stream(ip, archive, image, image_id), settings.image_transfer_timeout
+                )
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"Übertragung von {image}: Timeout") from None
+            except (OSError, asyncssh.Error) as e:
+                raise RuntimeError(f"Übertragung von {image}: {e}") from e
+            await emit(f"Image {image} geladen ({size // (1024 * 1024)} MiB komprimiert).")
+
+
+# Globale Instanz
+image_distributor = ImageDistributor()
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from ..config import settings
+from ..models.vps import VPS, VPSStatus, StatusHistoryEntry
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    name TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    managed INTEGER NOT NULL DEFAULT 1,
+    description TEXT NOT NULL DEFAULT '',
+    netcup_id TEXT NOT NULL DEFAULT '',
+    facts TEXT NOT NULL DEFAULT '{}',
+    first_seen REAL NOT NULL,
+    last_seen REAL,
+    source TEXT NOT NULL DEFAULT 'manual',
+    missed_scans INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_ip ON hosts(ip);
+CREATE INDEX IF NOT EXISTS idx_hosts_netcup_id ON hosts(netcup_id);
+
+CREATE TABLE IF NOT EXISTS host_labels (
+    host TEXT NOT NULL REFERENCES hosts(name) ON DELETE CASCADE ON UPDATE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (host, key)
+);
+CREATE INDEX IF NOT EXISTS idx_host_labels_kv ON host_labels(key, value);
+
+CREATE TABLE IF NOT EXISTS status_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    ts REAL NOT NULL,
+    online INTEGER NOT NULL,
+    load1 REAL,
+    memory_used INTEGER,
+    memory_total INTEGER,
+    disk_used INTEGER,
+    disk_total INTEGER,
+    updates_available INTEGER,
+    error TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_status_history_host_ts ON status_history(host, ts);
+CREATE INDEX IF NOT EXISTS idx_status_history_ts ON status_history(ts);
+"""
+
+# Spalten, die nach der ersten Version hinzugekommen sind (für bestehende DBs)
+MIGRATIONS = {
+    "hosts": [
+        ("source", "TEXT NOT NULL DEFAULT 'manual'"),
+        ("missed_scans", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+}
+
+
+def _iso(ts: float | None) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else ""
+
+
+def _ip_sort_key(ip: str) -> tuple:
+    parts = ip.split(".")
+    if len(parts) == 4 and all(p.isdigit() for p in parts):
+        return (0, *(int(p) for p in parts))
+    return (1, ip)
+
+
+class Inventory:
+    """Eingebettete SQLite-Datenbank für die VPS-Flotte.
+
+    Hält Hosts, Netcup-Server-Zuordnung, Labels, zuletzt ermittelte Fakten
+    und die Status-Historie. /etc/vps-hosts wird daraus erzeugt, damit
+    vps-cli.sh weiter funktioniert.
+    """
+
+    def __init__(self):
+        self._db: sqlite3.Connection | None = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        path = os.path.join(settings.data_dir, "inventory.db")
+        try:
+            os.makedirs(settings.data_dir, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error) as e:
+            # Entwicklung ohne beschreibbares data_dir: nur im Speicher
+            logger.warning("Inventar-DB %s nicht nutzbar (%s), verwende In-Memory-DB", path, e)
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA foreign_keys=ON")
+        self._migrate(db)
+        db.executescript(SCHEMA)
+        return db
+
+    def _migrate(self, db: sqlite3.Connection) -> None:
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue  # Tabelle wird gleich frisch angelegt
+            for column, definition in columns:
+                if column not in existing:
+                    db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # --- Hosts ---
+
+    def _row_to_vps(self, row: sqlite3.Row, labels: dict[str, str]) -> VPS:
+        return VPS(
+            name=row["name"],
+            host=row["name"],
+            ip=row["ip"],
+            description=row["description"],
+            managed=bool(row["managed"]),
+            netcup_id=row["netcup_id"],
+            labels=labels,
+            last_seen=_iso(row["last_seen"]),
+            source=row["source"],
+        )
+
+    def _labels_for(self, names: list[str] | None = None) -> dict[str, dict[str, str]]:
+        if names is None:
+            rows = self.db.execute("SELECT host, key, value FROM host_labels")
+        else:
+            placeholders = ",".join("?" * len(names))
+            rows = self.db.execute(
+                f"SELECT host, key, value FROM host_labels WHERE host IN ({placeholders})",
+                names,
+            )
+        labels: dict[str, dict[str, str]] = {}
+        for row in rows:
+            labels.setdefault(row["host"], {})[row["key"]] = row["value"]
+        return labels
+
+    def list_hosts(self, label: tuple[str, str] | None = None) -> list[VPS]:
+        """Alle Hosts, optional gefiltert nach einem Label (key, value)."""
+        if label:
+            rows = self.db.execute(
+                "SELECT h.* FROM hosts h JOIN host_labels l ON l.host = h.name "
+                "WHERE l.key = ? AND l.value = ?",
+                label,
+            ).fetchall()
+        else:
+            rows = self.db.execute("SELECT * FROM hosts").fetchall()
+        labels = self._labels_for([row["name"] for row in rows] if label else None)
+        hosts = [self._row_to_vps(row, labels.get(row["name"], {})) for row in rows]
+        hosts.sort(key=lambda h: _ip_sort_key(h.ip))
+        return hosts
+
+    def get_host(self, name: str) -> VPS | None:
+        row = self.db.execute("SELECT * FROM hosts WHERE name = ?", (name,)).fetchone()
+        if not row:
+            return None
+        return self._row_to_vps(row, self._labels_for([name]).get(name, {}))
+
+    def by_netcup_id(self, netcup_id: str) -> VPS | None:
+        row = self.db.execute(
+            "SELECT * FROM hosts WHERE netcup_id = ? LIMIT 1", (netcup_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return self._row_to_vps(row, self._labels_for([row["name"]]).get(row["name"], {}))
+
+    def upsert_host(
+        self, name: str, ip: str, managed: bool = True, source: str | None = None
+    ) -> None:
+        """Legt einen Host an oder aktualisiert IP/managed (Metadaten bleiben erhalten).
+
+        source ("manual" oder "scan") wird nur geändert, wenn es angegeben ist;
+        neue Hosts ohne Angabe gelten als manuell angelegt.
+        """
+        with self.db:
+            # Ein anderer Host mit derselben IP wird ersetzt (IP wurde neu vergeben)
+            self.db.execute("DELETE FROM hosts WHERE ip = ? AND name != ?", (ip, name))
+            self.db.execute(
+                "INSERT INTO hosts (name, ip, managed, first_seen, source) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET ip = excluded.ip, managed = excluded.managed, "
+                "source = COALESCE(?, source)",
+                (name, ip, int(managed), time.time(), source or "manual", source),
+            )
+
+    def rename_host(self, old_name: str, new_name: str) -> None:
+        with self.db:
+            self.db.execute("UPDATE hosts SET name = ? WHERE name = ?", (new_name, old_name))
+            self.db.execute("UPDATE status_history SET host = ? WHERE host = ?", (new_name, old_name))
+
+    def remove_host(self, name: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM hosts WHERE name = ?", (name,))
+
+    def sync_hosts(self, hosts: list[VPS], source: str | None = None) -> None:
+        """Gleicht die Host-Liste ab (z.B. nach externer Änderung von /etc/vps-hosts).
+
+        Fehlende Hosts werden entfernt, Metadaten vorhandener Hosts bleiben erhalten.
+        Bei source="scan" bleiben manuell angelegte Hosts unberührt: sie werden
+        weder entfernt noch umgeschrieben, und ihre IPs werden nicht neu vergeben.
+        """
+        names = {h.name for h in hosts}
+        rows = self.db.execute("SELECT name, ip, source FROM hosts").fetchall()
+        manual = {row["name"]: row["ip"] for row in rows if source == "scan" and row["source"] != "scan"}
+        manual_ips = set(manual.values())
+        with self.db:
+            for row in rows:
+                if row["name"] not in names and row["name"] not in manual:
+                    self.db.execute("DELETE FROM hosts WHERE name = ?", (row["name"],))
+        for h in hosts:
+            if h.name in manual or h.ip in manual_ips:
+                continue
+            self.upsert_host(h.name, h.ip, h.managed, source=source)
+
+    def mark_scanned(self, seen: list[str], missed: list[str]) -> dict[str, int]:
+        """Vermerkt ein Scan-Ergebnis und liefert die Fehlzählung der nicht gefundenen Hosts."""
+        with self.db:
+            self.db.executemany(
+                "UPDATE hosts SET missed_scans = 0 WHERE name = ?", [(n,) for n in seen]
+            )
+            self.db.executemany(
+                "UPDATE hosts SET missed_scans = missed_scans + 1 WHERE name = ?",
+                [(n,) for n in missed],
+            )
+        if not missed:
+            return {}
+        placeholders = ",".join("?" * len(missed))
+        rows = self.db.execute(
+            f"SELECT name, missed_scans FROM hosts WHERE name IN ({placeholders})", missed
+        )
+        return {row["name"]: row["missed_scans"] for row in rows}
+
+    def set_netcup_id(self, name: str, netcup_id: str) -> None:
+        with self.db:
+            self.db.execute("UPDATE hosts SET netcup_id = '' WHERE netcup_id = ?", (netcup_id,))
+            self.db.execute("UPDATE hosts SET netcup_id = ? WHERE name = ?", (netcup_id, name))
+
+    def set_labels(self, name: str, labels: dict[str, str]) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM host_labels WHERE host = ?", (name,))
+            self.db.executemany(
+                "INSERT INTO host_labels (host, key, value) VALUES (?, ?, ?)",
+                [(name, k, v) for k, v in labels.items()],
+            )
+
+    def get_facts(self, name: str) -> dict:
+        row = self.db.execute("SELECT facts FROM hosts WHERE name = ?", (name,)).fetchone()
+        return json.loads(row["facts"]) if row else {}
+
+    # --- Status-Historie ---
+
+    def record_status(self, name: str, status: VPSStatus) -> None:
+        """Speichert einen Status-Datenpunkt und aktualisiert last_seen/Fakten."""
+        now = time.time()
+        facts = status.facts
+        with self.db:
+            self.db.execute(
+                "INSERT INTO status_history (host, ts, online, load1, memory_used, memory_total, "
+                "disk_used, disk_total, updates_available, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    now,
+                    int(status.online),
+                    facts.load[0] if facts and facts.load else None,
+                    facts.memory_used if facts else None,
+                    facts.memory_total if facts else None,
+                    facts.disk_used if facts else None,
+                    facts.disk_total if facts else None,
+                    status.updates_available if status.online else None,
+                    status.error,
+                ),
+            )
+            if status.online:
+                self.db.execute(
+                    "UPDATE hosts SET last_seen = ?, facts = COALESCE(?, facts) WHERE name = ?",
+                    (now, facts.model_dump_json() if facts else None, name),
+                )
+
+    def history(
+        self,
+        name: str,
+        since: float | None = None,
+        limit: int = 500,
+    ) -> list[StatusHistoryEntry]:
+        rows = self.db.execute(
+            "SELECT * FROM status_history WHERE host = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+            (name, since or 0, limit),
+        ).fetchall()
+        return [
+            StatusHistoryEntry(
+                time=_iso(row["ts"]),
+                online=bool(row["online"]),
+                load=row["load1"],
+                memory_used=row["memory_used"],
+                memory_total=row["memory_total"],
+                disk_used=row["disk_used"],
+                disk_total=row["disk_total"],
+                updates_available=row["updates_available"],
+                error=row["error"],
+            )
+            for row in rows
+        ]
+
+    def prune_history(self) -> None:
+        """Entfernt Historie älter als inventory_history_days."""
+        cutoff = time.time() - settings.inventory_history_days * 86400
+        with self.db:
+            self.db.execute("DELETE FROM status_history WHERE ts < ?", (cutoff,))
+
+    # --- /etc/vps-hosts ---
+
+    def render_hosts_file(self) -> str:
+        lines = [
+            "# VPS Hosts - generiert vom Dashboard",
+            "# IP          Hostname",
+        ]
+        for h in self.list_hosts():
+            lines.append(f"{h.ip} {h.name}" if h.managed else f"{h.ip} {h.name} unmanaged")
+        return "\n".join(lines) + "\n"
+
+
+# Globale Instanz
+inventory = Inventory()
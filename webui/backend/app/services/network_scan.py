@@ -0,0 +1,426 @@
+import asyncio
+import logging
+import re
+import shlex
+import sqlite3
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable
+
+import asyncssh
+
+from ..config import settings
+from ..models.vps import VPS, ScanChange, ScanDiff
+from .events import event_bus
+from .hosts import host_registry, write_hosts_file
+from .inventory import inventory
+from .ssh import RECONNECT_ERRORS, SSHConnectError, run_ssh, ssh_session
+from .task_manager import task_manager
+
+logger = logging.getLogger(__name__)
+
+# CloudVLAN: Proxy ist .1, VPS liegen in .2-.254
+SCAN_PREFIX = "10.10.0"
+SCAN_FIRST = 2
+SCAN_LAST = 254
+
+_IP_RE = re.compile(rf"^{re.escape(SCAN_PREFIX)}\.(\d+)$")
+
+# Ein Sweep über das ganze Netz auf dem Proxy; erreichbare IPs werden
+# zeilenweise ausgegeben, sobald sie antworten. Danach werden Einträge aus
+# der ARP-Tabelle ergänzt (Hosts, die ICMP filtern, aber per ARP antworten).
+SWEEP_SCRIPT = f"""
+if command -v fping >/dev/null 2>&1; then
+    fping -a -q -r 0 -t 500 -g {SCAN_PREFIX}.{SCAN_FIRST} {SCAN_PREFIX}.{SCAN_LAST} 2>/dev/null
+else
+    for i in $(seq {SCAN_FIRST} {SCAN_LAST}); do
+        (ping -c 1 -W 2 {SCAN_PREFIX}.$i >/dev/null 2>&1 && echo {SCAN_PREFIX}.$i) &
+    done
+    wait
+fi
+ip -4 neigh show 2>/dev/null | awk '$1 ~ /^{re.escape(SCAN_PREFIX)}\\./ && /lladdr/ && !/FAILED|INCOMPLETE/ {{print $1}}'
+true
+"""
+
+
+def sweep_script(ips: list[str] | None = None) -> str:
+    """Sweep-Skript für das ganze Netz oder eine feste Liste von IPs."""
+    if ips is None:
+        return SWEEP_SCRIPT
+    targets = " ".join(shlex.quote(ip) for ip in ips)
+    return f"""
+if command -v fping >/dev/null 2>&1; then
+    fping -a -q -r 0 -t 500 {targets} 2>/dev/null
+else
+    for ip in {targets}; do
+        (ping -c 1 -W 2 "$ip" >/dev/null 2>&1 && echo "$ip") &
+    done
+    wait
+fi
+true
+"""
+
+
+async def sweep(ips: list[str] | None = None) -> list[str]:
+    """Liefert alle erreichbaren IPs mit einem einzigen Aufruf auf dem Proxy."""
+    found: list[str] = []
+    async for ip in stream_sweep(ips):
+        found.append(ip)
+    return found
+
+
+class SweepError(RuntimeError):
+    """Sweep auf dem Proxy fehlgeschlagen; das Ergebnis ist unvollständig."""
+
+
+async def stream_sweep(ips: list[str] | None = None):
+    """Streamt erreichbare IPs aus dem Sweep, sobald sie antworten (ohne Duplikate).
+
+    SweepError, wenn der Proxy nicht erreichbar ist oder das Skript nicht
+    sauber endet; ein Scan darf dann nichts aus dem Inventar entfernen.
+    """
+    seen: set[str] = set()
+    try:
+        async with ssh_session("proxy", sweep_script(ips), encoding="utf-8", errors="replace") as proc:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                ip = line.strip()
+                m = _IP_RE.match(ip)
+                if not m or not SCAN_FIRST <= int(m.group(1)) <= SCAN_LAST or ip in seen:
+                    continue
+                seen.add(ip)
+                yield ip
+            result = await proc.wait()
+    except (SSHConnectError, *RECONNECT_ERRORS, OSError, asyncssh.Error) as e:
+        raise SweepError(f"Sweep auf dem Proxy fehlgeschlagen: {e}") from e
+    if result.exit_status != 0:
+        raise SweepError(f"Sweep auf dem Proxy fehlgeschlagen (rc={result.exit_status})")
+
+
+async def probe_hostname(ip: str) -> str | None:
+    """Ermittelt den Hostnamen per SSH (None = kein SSH-Zugang, also unmanaged)."""
+    code, hostname, _ = await run_ssh(ip, "hostname", timeout=5)
+    return hostname.strip() if code == 0 and hostname.strip() else None
+
+
+async def netbios_names(ips: list[str]) -> dict[str, str]:
+    """NetBIOS-Namen mehrerer Hosts mit einem Aufruf auf dem Proxy."""
+    if not ips:
+        return {}
+    targets = " ".join(shlex.quote(ip) for ip in ips)
+    script = (
+        f"for ip in {targets}; do "
+        "(n=$(nmblookup -A \"$ip\" 2>/dev/null | grep '<00>' | grep -v '<GROUP>' | head -1 | awk '{print $1}'); "
+        "echo \"$ip $n\") & "
+        "done; wait"
+    )
+    code, stdout, _ = await run_ssh("proxy", script, timeout=30)
+    names: dict[str, str] = {}
+    if code == 0:
+        for line in stdout.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                names[parts[0]] = parts[1].lower()
+    return names
+
+
+async def identify(
+    ips: AsyncIterator[str],
+    on_found: Callable[[VPS], Awaitable[None]] | None = None,
+) -> list[VPS]:
+    """Ermittelt Namen für erreichbare IPs: parallele Hostname-Probes, danach ein NetBIOS-Batch.
+
+    Die Probes starten bereits, während der Sweep noch weitere IPs liefert.
+    Hosts ohne SSH-Zugang werden als unmanaged mit NetBIOS-Namen (Fallback: IP) geführt.
+    """
+    managed: list[VPS] = []
+    unmanaged_ips: list[str] = []
+
+    async def probe(ip: str):
+        hostname = await probe_hostname(ip)
+        if hostname:
+            vps = VPS(name=hostname, host=hostname, ip=ip)
+            managed.append(vps)
+            if on_found:
+                await on_found(vps)
+        else:
+            unmanaged_ips.append(ip)
+
+    probes: list[asyncio.Task] = []
+    try:
+        async for ip in ips:
+            probes.append(asyncio.create_task(probe(ip)))
+    except BaseException:
+        # Sweep fehlgeschlagen: angefangene Probes nicht weiterlaufen lassen
+        for task in probes:
+            task.cancel()
+        raise
+    await asyncio.gather(*probes, return_exceptions=True)
+
+    names = await netbios_names(unmanaged_ips)
+    unmanaged = []
+    for ip in unmanaged_ips:
+        name = names.get(ip) or ip
+        vps = VPS(name=name, host=name, ip=ip, managed=False)
+        unmanaged.append(vps)
+        if on_found:
+            await on_found(vps)
+
+    result = managed + unmanaged
+    result.sort(key=lambda h: int(h.ip.rsplit(".", 1)[-1]))
+    return result
+
+
+async def scan(
+    on_found: Callable[[VPS], Awaitable[None]] | None = None,
+    ips: list[str] | None = None,
+) -> list[VPS]:
+    """Scannt das CloudVLAN: ein Sweep, danach Probes nur für Antwortende."""
+    return await identify(stream_sweep(ips), on_found)
+
+
+def diff_hosts(known: list[VPS], found: list[VPS], diff: ScanDiff) -> ScanDiff:
+    """Vergleicht das Scan-Ergebnis mit dem Inventar (primär über die IP).
+
+    Ein bekannter Name an einer neuen IP (alte IP antwortet nicht mehr) gilt
+    als umbenannt mit old_ip, nicht als entfernt + neu.
+    """
+    by_ip = {h.ip: h for h in known}
+    by_name = {h.name: h for h in known}
+    found_ips = {h.ip for h in found}
+    matched: set[str] = set()
+
+    for h in found:
+        old = by_ip.get(h.ip)
+        if old and old.name == h.name:
+            matched.add(old.name)
+            diff.unchanged += 1
+        elif old:
+            matched.add(old.name)
+            diff.renamed.append(
+                ScanChange(ip=h.ip, name=h.name, managed=h.managed, old_name=old.name)
+            )
+        elif h.name in by_name and by_name[h.name].ip not in found_ips:
+            old = by_name[h.name]
+            matched.add(old.name)
+            diff.renamed.append(
+                ScanChange(ip=h.ip, name=h.name, managed=h.managed, old_name=old.name, old_ip=old.ip)
+            )
+        else:
+            diff.added.append(ScanChange(ip=h.ip, name=h.name, managed=h.managed))
+
+    diff.removed = [
+        ScanChange(ip=h.ip, name=h.name, managed=h.managed)
+        for h in known
+        if h.name not in matched
+    ]
+    return diff
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def full_scan(on_found: Callable[[VPS], Awaitable[None]] | None = None) -> ScanDiff:
+    """Vollständiger Scan: das Ergebnis ersetzt die vom Scan geführten Hosts.
+
+    Manuell angelegte Hosts bleiben unverändert. Liefert der Sweep nichts,
+    wird abgebrochen statt das Inventar zu leeren.
+    """
+    diff = ScanDiff(mode="full", started_at=_now())
+    known = host_registry.hosts()
+    found = await scan(on_found=on_found)
+    if not found:
+        raise SweepError("Sweep hat keine Hosts gefunden, Inventar bleibt unverändert")
+    diff_hosts(known, found, diff)
+    manual = {h.name for h in known if h.source != "scan"}
+    manual_ips = {h.ip for h in known if h.source != "scan"}
+    for change in (*diff.added, *diff.renamed, *diff.removed):
+        # Wie sync_hosts: manuelle Einträge werden nur gemeldet
+        if {change.name, change.old_name} & manual or change.ip in manual_ips:
+            change.applied = False
+
+    inventory.sync_hosts(found, source="scan")
+    await write_hosts_file()
+    diff.finished_at = _now()
+    return diff
+
+
+async def incremental_scan(on_found: Callable[[VPS], Awaitable[None]] | None = None) -> ScanDiff:
+    """Differenzieller Scan gegen das Inventar.
+
+    Bekannte Hosts werden zuerst direkt neu geprüft (Hostname per SSH), danach
+    sucht ein Sweep nach neuen IPs; nur diese werden genauer untersucht.
+    Manuell angelegte Hosts werden nie geändert oder entfernt, sondern nur
+    gemeldet. Vom Scan entdeckte Hosts werden erst nach scan_remove_after
+    verpassten Scans entfernt. /etc/vps-hosts wird nur bei Änderungen geschrieben.
+    """
+    diff = ScanDiff(mode="incremental", started_at=_now())
+    known = host_registry.hosts()
+    known_by_ip = {h.ip: h for h in known}
+    known_by_name = {h.name: h for h in known}
+
+    # 1. Bekannte managed Hosts: Hostname erneut abfragen (gepoolte Verbindungen)
+    managed_known = [h for h in known if h.managed]
+    hostnames = await asyncio.gather(*(probe_hostname(h.ip) for h in managed_known))
+    found: dict[str, VPS] = {
+        h.ip: VPS(name=hostname, host=hostname, ip=h.ip)
+        for h, hostname in zip(managed_known, hostnames)
+        if hostname
+    }
+
+    # 2. Discovery: ein Sweep; bekannte IPs gelten nur als erreichbar
+    async def new_ips():
+        async for ip in stream_sweep():
+            if ip in found:
+                continue
+            if ip in known_by_ip:
+                found[ip] = known_by_ip[ip]
+            else:
+                yield ip
+
+    for vps in await identify(new_ips(), on_found):
+        found[vps.ip] = vps
+
+    diff_hosts(known, list(found.values()), diff)
+
+    # Verpasste Scans zählen, bevor Umbenennungen die Namen ändern
+    missing = {c.name for c in diff.removed}
+    missed = inventory.mark_scanned(
+        seen=[h.name for h in known if h.name not in missing],
+        missed=list(missing),
+    )
+
+    changed = False
+    for change in diff.added:
+        if change.name in known_by_name:
+            # Name gehört einem Host, dessen IP noch antwortet (z.B. Default-Hostname
+            # eines frischen Images): nicht umziehen, nur melden
+            change.applied = False
+            continue
+        inventory.upsert_host(change.name, change.ip, change.managed, source="scan")
+        changed = True
+    for change in diff.renamed:
+        old = known_by_name[change.old_name]
+        if old.source != "scan":
+            change.applied = False
+            continue
+        try:
+            if change.name != change.old_name:
+                inventory.rename_host(change.old_name, change.name)
+            inventory.upsert_host(change.name, change.ip, change.managed)
+            changed = True
+        except sqlite3.IntegrityError:
+            # Zielname ist bereits vergeben (z.B. getauschte Hosts)
+            change.applied = False
+    for change in diff.removed:
+        change.missed_scans = missed.get(change.name, 0)
+        old = known_by_name[change.name]
+        if old.source == "scan" and change.missed_scans >= settings.scan_remove_after:
+            inventory.remove_host(change.name)
+            changed = True
+        else:
+            change.applied = False
+
+    if changed:
+        await write_hosts_file()
+    diff.finished_at = _now()
+    return diff
+
+
+def format_diff(diff: ScanDiff) -> list[str]:
+    """Zusammenfassung eines Scan-Diffs als Task-Output."""
+    lines = [
+        f"Änderungen: {len(diff.added)} neu, {len(diff.removed)} fehlend, "
+        f"{len(diff.renamed)} umbenannt, {diff.unchanged} unverändert"
+    ]
+    for c in diff.added:
+        note = ("" if c.managed else " (unmanaged)") + ("" if c.applied else " (nicht übernommen)")
+        lines.append(f"  + {c.ip} {c.name}{note}")
+    for c in diff.renamed:
+        old = f"{c.old_ip} {c.old_name}" if c.old_ip else c.old_name
+        note = "" if c.applied else " (nicht übernommen)"
+        lines.append(f"  ~ {c.ip} {old} → {c.name}{note}")
+    for c in diff.removed:
+        if c.applied:
+            note = " (entfernt)"
+        elif c.missed_scans:
+            note = f" (nicht erreichbar, {c.missed_scans}x verpasst)"
+        else:
+            note = " (nicht erreichbar)"
+        lines.append(f"  - {c.ip} {c.name}{note}")
+    return lines
+
+
+class ScanScheduler:
+    """Startet Scans als Background-Task, manuell oder periodisch (inkrementell).
+
+    Es läuft immer höchstens ein Scan; das Ergebnis wird als Task-Output und
+    als Ereignis "scan" auf dem Event-Bus veröffentlicht.
+    """
+
+    def __init__(self):
+        self._current: str | None = None
+        self._loop_task: asyncio.Task | None = None
+        self.last_diff: ScanDiff | None = None
+
+    @property
+    def running_task(self) -> str | None:
+        """task_id des laufenden Scans (None = kein Scan aktiv)."""
+        return self._current
+
+    def start_scan(self, mode: str = "full") -> str | None:
+        """Startet einen Scan; gibt None zurück, wenn bereits einer läuft."""
+        if self._current is not None:
+            return None
+        description = "Netzwerk-Scan" if mode == "full" else "Netzwerk-Scan (inkrementell)"
+        task_id = task_manager.create_task(
+            "scan", description, coro_factory=lambda tid: self._run_scan(tid, mode)
+        )
+        self._current = task_id
+        return task_id
+
+    async def _run_scan(self, task_id: str, mode: str) -> None:
+        try:
+            await task_manager.push_output(
+                task_id, f"Scanne Netzwerk {SCAN_PREFIX}.{SCAN_FIRST}-{SCAN_LAST}..."
+            )
+
+            async def report(vps: VPS):
+                suffix = "" if vps.managed else " (unmanaged)"
+                await task_manager.push_output(task_id, f"  Gefunden: {vps.ip} → {vps.name}{suffix}")
+
+            if mode == "full":
+                diff = await full_scan(on_found=report)
+            else:
+                diff = await incremental_scan(on_found=report)
+
+            for line in format_diff(diff):
+                await task_manager.push_output(task_id, line)
+            await task_manager.push_output(
+                task_id, f"Scan abgeschlossen. {len(host_registry.hosts())} VPS im Inventar."
+            )
+            self.last_diff = diff
+            event_bus.publish("scan", {"task_id": task_id, **diff.model_dump()})
+        finally:
+            self._current = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.scan_interval)
+            if self.start_scan("incremental") is None:
+                logger.info("Geplanter Scan übersprungen, es läuft bereits ein Scan")
+
+    def start(self) -> None:
+        if settings.scan_interval > 0 and self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+
+
+# Globale Instanz
+scan_scheduler = ScanScheduler()
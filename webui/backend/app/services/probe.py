@@ -0,0 +1,91 @@
+import json
+import logging
+import shlex
+
+from pydantic import ValidationError
+
+from ..models.vps import HostFacts, VPSStatus
+from .ssh import run_ssh
+
+logger = logging.getLogger(__name__)
+
+# Sammelt alle Status-Fakten in einem Aufruf und gibt ein JSON-Dokument aus.
+# Zahlen sind Rohwerte (Bytes, Sekunden), damit nichts aus "free -h" geparst werden muss.
+PROBE_SCRIPT = r"""
+updates=$(LC_ALL=C apt list --upgradable 2>/dev/null | grep -c upgradable)
+[ -f /var/run/reboot-required ] && reboot=true || reboot=false
+read l1 l5 l15 _ < /proc/loadavg
+up=$(awk '{printf "%d", $1}' /proc/uptime)
+mem=$(awk '/^MemTotal:/{t=$2} /^MemAvailable:/{a=$2} END{printf "%.0f %.0f", (t-a)*1024, t*1024}' /proc/meminfo)
+disk=$(LC_ALL=C df -P -B1 / | awk 'NR==2{printf "%.0f %.0f", $3, $2}')
+set -- $mem $disk
+printf '{"hostname":"%s","kernel":"%s","cpus":%d,"uptime_seconds":%d,"load":[%s,%s,%s],"memory_used":%s,"memory_total":%s,"disk_used":%s,"disk_total":%s,"updates_available":%d,"reboot_required":%s}\n' \
+  "$(hostname)" "$(uname -r)" "$(nproc)" "${up:-0}" "$l1" "$l5" "$l15" \
+  "${1:-0}" "${2:-0}" "${3:-0}" "${4:-0}" "${updates:-0}" "$reboot"
+"""
+
+
+async def probe_host(ip: str, timeout: int = 15) -> tuple[HostFacts | None, str]:
+    """Liest alle Status-Fakten eines Hosts mit einem einzigen SSH-Aufruf.
+
+    Gibt (facts, fehler) zurück; facts ist None, wenn der Host nicht
+    erreichbar ist oder die Ausgabe nicht geparst werden kann.
+    """
+    code, stdout, stderr = await run_ssh(ip, PROBE_SCRIPT, timeout=timeout)
+    if code != 0 or not stdout:
+        return None, stderr
+
+    try:
+        return HostFacts(**json.loads(stdout.splitlines()[-1])), ""
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        logger.warning("Probe-Ausgabe von %s nicht lesbar: %s", ip, e)
+        return None, "Probe-Ausgabe nicht lesbar"
+
+
+async def check_host_ping(ip: str) -> bool:
+    """Prüft ob ein Host per Ping erreichbar ist (via Proxy)."""
+    code, _, _ = await run_ssh("proxy", f"ping -c 1 -W 2 {shlex.quote(ip)}", timeout=10)
+    return code == 0
+
+
+def _format_bytes(size: int) -> str:
+    """Kurzformat wie bei free -h / df -h (z.B. 1.2G)."""
+    value = float(size)
+    for unit in ["B", "K", "M", "G", "T"]:
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}P"
+
+
+def _format_uptime(seconds: int) -> str:
+    return f"{seconds // 86400}d:{seconds % 86400 // 3600}h:{seconds % 3600 // 60}m"
+
+
+def status_from_facts(host: str, facts: HostFacts) -> VPSStatus:
+    """Baut ein VPSStatus-Objekt aus den Probe-Fakten."""
+    return VPSStatus(
+        host=host,
+        online=True,
+        load=f"{facts.load[0]:.2f}" if facts.load else "",
+        uptime=_format_uptime(facts.uptime_seconds),
+        updates_available=facts.updates_available,
+        reboot_required=facts.reboot_required,
+        kernel=facts.kernel,
+        memory_used=_format_bytes(facts.memory_used) if facts.memory_total else "",
+        memory_total=_format_bytes(facts.memory_total) if facts.memory_total else "",
+        disk_used=_format_bytes(facts.disk_used) if facts.disk_total else "",
+        disk_total=_format_bytes(facts.disk_total) if facts.disk_total else "",
+        facts=facts,
+    )
+
+
+async def collect_status(host: str, ip: str, managed: bool = True) -> VPSStatus:
+    """Ermittelt den Status eines Hosts (ein Probe-Aufruf, bzw. Ping bei unmanaged)."""
+    if not managed:
+        return VPSStatus(host=host, online=await check_host_ping(ip))
+
+    facts, error = await probe_host(ip)
+    if facts is None:
+        return VPSStatus(host=host, online=False, error=error)
+    return status_from_facts(host, facts)
@@ -0,0 +1,200 @@
+import asyncio
+import shlex
+import time
+from fnmatch import fnmatchcase
+
+import httpx
+
+from ..models.deploy import HostSelector, RolloutRequest, Template
+from .deployer import deploy_host
+from .deployments import deployment_cache
+from .docker_state import docker_state
+from .hosts import host_registry, resolve_host
+from .ssh import run_ssh
+from .task_manager import task_manager
+
+HEALTH_INTERVAL = 5
+
+HEALTH_SCRIPT = (
+    "sudo docker ps -a --filter label=com.docker.compose.project.working_dir={dir} "
+    "--format '{{{{.Label \"com.docker.compose.service\"}}}}|{{{{.State}}}}|{{{{.Status}}}}'"
+)
+
+
+def select_hosts(selector: HostSelector) -> list[tuple[str, str]]:
+    """Wählt managed Hosts per Namens-Glob und Labels aus; gibt (name, ip) zurück."""
+    result = []
+    for vps in host_registry.hosts():
+        if not vps.managed:
+            continue
+        if selector.name and not fnmatchcase(vps.name, selector.name):
+            continue
+        if any(vps.labels.get(k) != v for k, v in selector.labels.items()):
+            continue
+        result.append((vps.name, vps.ip))
+    return result
+
+
+def resolve_targets(req: RolloutRequest) -> tuple[list[tuple[str, str]], list[str]]:
+    """Explizite Hosts oder Selector; gibt (ziele, unbekannte hosts) zurück.
+
+    Ohne Hosts und ohne nicht-leeren Selector gibt es keine Ziele (nie die
+    ganze Flotte aus Versehen).
+    """
+    if not req.hosts:
+        if not (req.selector and (req.selector.name or req.selector.labels)):
+            return [], []
+        return select_hosts(req.selector), []
+    targets, unknown = [], []
+    for host in req.hosts:
+        ip = resolve_host(host)
+        if ip:
+            vps = host_registry.find(host)
+            targets.append((vps.name if vps else host, ip))
+        else:
+            unknown.append(host)
+    return targets, unknown
+
+
+def host_values(req: RolloutRequest, host: str) -> dict[str, str]:
+    return {**req.vars, **req.host_vars.get(host, {})}
+
+
+def _service_health(line: str) -> tuple[str, bool, str]:
+    """'service|state|status' -> (service, gesund, beschreibung)."""
+    service, _, rest = line.partition("|")
+    state, _, status = rest.partition("|")
+    if state == "running":
+        healthy = "(unhealthy)" not in status and "(health: starting)" not in status
+    else:
+        # Einmal-Container (z.B. init/Build-Schritte) dürfen sauber beendet sein
+        healthy = state == "exited" and status.startswith("Exited (0)")
+    return service, healthy, status or state
+
+
+async def wait_healthy(
+    ip: str,
+    template: Template,
+    services: list[str],
+    timeout: int,
+) -> tuple[bool, str]:
+    """Wartet, bis alle Services laufen/gesund sind und die Route antwortet."""
+    deadline = time.monotonic() + timeout
+    detail = ""
+    command = HEALTH_SCRIPT.format(dir=shlex.quote(template.deploy_dir))
+    while True:
+        code, stdout, stderr = await run_ssh(ip, command, timeout=30)
+        if code == 0:
+            states = {}
+            for line in stdout.splitlines():
+                service, healthy, status = _service_health(line)
+                states[service] = (healthy, status)
+            pending = [
+                f"{s}: {states[s][1]}" if s in states else f"{s}: fehlt"
+                for s in services
+                if not states.get(s, (False, ""))[0]
+            ]
+            detail = ", ".join(pending)
+            if not pending:
+                if not template.route_port:
+                    return True, ""
+                url = f"http://{ip}:{template.route_port}/"
+                try:
+                    async with httpx.AsyncClient(timeout=5) as client:
+                        response = await client.get(url)
+                    if response.status_code < 500:
+                        return True, ""
+                    detail = f"{url} antwortet mit {response.status_code}"
+                except httpx.HTTPError as e:
+                    detail = f"{url} nicht erreichbar: {e.__class__.__name__}"
+        else:
+            detail = stderr or f"rc={code}"
+        if time.monotonic() >= deadline:
+            return False, detail
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+
+async def run_rollout(
+    task_id: str,
+    req: RolloutRequest,
+    template: Template,
+    targets: list[tuple[str, str]],
+) -> None:
+    """Deployt ein Template auf viele Hosts: erst Canary, dann im Fenster.
+
+    Die Canary-Hosts müssen alle erfolgreich sein. Danach laufen bis zu
+    max_parallel Hosts gleichzeitig; sobald mehr als max_failures Hosts
+    fehlschlagen, werden keine weiteren gestartet (laufende laufen zu Ende).
+    """
+    results: dict[str, str] = {}  # host -> ok, fehler, übersprungen
+    halted = False
+
+    async def push(host: str, line: str) -> None:
+        await task_manager.push_output(task_id, f"[{host}] {line}")
+
+    async def deploy_one(host: str, ip: str) -> None:
+        nonlocal halted
+
+        async def emit(line: str) -> None:
+            await push(host, line)
+
+        try:
+            await push(host, f"Deploye {template.name} ({ip})...")
+            _, hashes, _ = await deploy_host(host, ip, template, host_values(req, host), req.auth, emit)
+            if req.health_timeout > 0:
+                await push(host, "Warte auf gesunde Container...")
+                healthy, detail = await wait_healthy(ip, template, list(hashes), req.health_timeout)
+                if not healthy:
+                    raise RuntimeError(f"nicht gesund nach {req.health_timeout}s: {detail}")
+            results[host] = "ok"
+            await push(host, "OK")
+        except Exception as e:
+            results[host] = "fehler"
+            await push(host, f"FEHLER: {e}")
+            failures = sum(1 for r in results.values() if r == "fehler")
+            if not halted and failures > req.max_failures:
+                halted = True
+                await task_manager.push_output(
+                    task_id, f"Rollout angehalten: {failures} Fehler (erlaubt: {req.max_failures})"
+                )
+        finally:
+            deployment_cache.invalidate(host)
+            docker_state.refresh(host)
+
+    canary = targets[:req.canary]
+    rest = targets[req.canary:]
+    await task_manager.push_output(
+        task_id,
+        f"Rollout {template.name} auf {len(targets)} Host(s): "
+        f"{len(canary)} Canary, danach max. {req.max_parallel} parallel",
+    )
+
+    semaphore = asyncio.Semaphore(req.max_parallel)
+
+    async def limited(host: str, ip: str) -> None:
+        async with semaphore:
+            # Nach dem Anhalten starten keine weiteren Hosts
+            if not halted:
+                await deploy_one(host, ip)
+
+    if canary:
+        await task_manager.push_output(task_id, f"Canary: {', '.join(h for h, _ in canary)}")
+        await asyncio.gather(*(limited(h, ip) for h, ip in canary))
+        if any(results.get(h) != "ok" for h, _ in canary) and not halted:
+            halted = True
+            await task_manager.push_output(task_id, "Rollout angehalten: Canary fehlgeschlagen")
+
+    if rest and not halted:
+        await task_manager.push_output(task_id, f"Weitere {len(rest)} Host(s)...")
+        await asyncio.gather(*(limited(h, ip) for h, ip in rest))
+
+    for host, _ in targets:
+        results.setdefault(host, "übersprungen")
+    ok = sum(1 for r in results.values() if r == "ok")
+    failed = sum(1 for r in results.values() if r == "fehler")
+    skipped = sum(1 for r in results.values() if r == "übersprungen")
+    await task_manager.push_output(
+        task_id, f"Fertig: {ok} erfolgreich, {failed} fehlgeschlagen, {skipped} übersprungen."
+    )
+    if failed or skipped:
+        raise RuntimeError(f"Rollout unvollständig ({failed} fehlgeschlagen, {skipped} übersprungen)")
@@ -1,10 +1,21 @@
 import asyncio
+import bisect
 import functools
+import itertools
 import logging
 import shlex
-from typing import AsyncIterator
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from enum import Enum, IntEnum
+from typing import AsyncIterator, Iterator
+
+import asyncssh
 
 from ..config import settings
+from .ssh_pool import RECONNECT_ERRORS, SSHConnectError, ssh_pool
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +53,266 @@ def resolve_ssh_target(host: str) -> str:
     return host
 
 
+class SSHPriority(IntEnum):
+    """Prioritätsklassen: kleinere Werte werden zuerst bedient."""
+    interactive = 0  # API-Anfragen, auf die ein Benutzer wartet
+    background = 1  # Tasks, Scans, periodische Aktualisierungen
+
+
+_current_priority: ContextVar[SSHPriority] = ContextVar(
+    "ssh_priority", default=SSHPriority.interactive
+)
+
+
+@contextmanager
+def ssh_priority(priority: SSHPriority) -> Iterator[None]:
+    """Setzt die SSH-Priorität für alle Aufrufe im aktuellen Kontext."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SSHScheduler:
+    """Begrenzt gleichzeitige SSH-Befehle global und pro Host.
+
+    Wartende Aufrufe landen in einer Warteschlange, sortiert nach Priorität
+    und Ankunft. Wird ein Slot frei, erhält der erste Wartende den Slot,
+    dessen Host noch unter seinem Limit liegt.
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._active_per_host: dict[str, int] = {}
+        self._waiters: list[tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _has_capacity(self, host: str) -> bool:
+        return (
+            self._active < settings.ssh_max_inflight
+            and self._active_per_host.get(host, 0) < settings.ssh_max_inflight_per_host
+        )
+
+    def _grant(self, host: str) -> None:
+        self._active += 1
+        self._active_per_host[host] = self._active_per_host.get(host, 0) + 1
+
+    def _dispatch(self) -> None:
+        for entry in list(self._waiters):
+            if self._active >= settings.ssh_max_inflight:
+                break
+            _, _, host, future = entry
+            if future.done():
+                self._waiters.remove(entry)
+            elif self._has_capacity(host):
+                self._waiters.remove(entry)
+                self._grant(host)
+                future.set_result(None)
+
+    async def acquire(self, host: str, priority: SSHPriority) -> None:
+        # Verbleibende Wartende sind immer durch ein Limit blockiert;
+        # ist für diesen Host Platz, darf der Aufruf direkt starten.
+        if self._has_capacity(host):
+            self._grant(host)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._seq), host, future)
+        bisect.insort(self._waiters, entry, key=lambda e: (e[0], e[1]))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(host)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+            raise
+
+    def release(self, host: str) -> None:
+        self._active -= 1
+        remaining = self._active_per_host.get(host, 1) - 1
+        if remaining > 0:
+            self._active_per_host[host] = remaining
+        else:
+            self._active_per_host.pop(host, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, host: str, priority: SSHPriority | None = None) -> AsyncIterator[None]:
+        """Hält einen Slot für die Dauer eines SSH-Befehls."""
+        await self.acquire(host, _current_priority.get() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self) -> dict:
+        """Aktive Befehle und Warteschlangenlänge (gesamt, pro Priorität, pro Host)."""
+        queued_by_priority = {p.name: 0 for p in SSHPriority}
+        queued_by_host: dict[str, int] = {}
+        for priority, _, host, future in self._waiters:
+            if future.done():
+                continue
+            queued_by_priority[SSHPriority(priority).name] += 1
+            queued_by_host[host] = queued_by_host.get(host, 0) + 1
+        return {
+            "active": self._active,
+            "max_inflight": settings.ssh_max_inflight,
+            "max_inflight_per_host": settings.ssh_max_inflight_per_host,
+            "active_per_host": dict(self._active_per_host),
+            "queued": sum(queued_by_priority.values()),
+            "queued_by_priority": queued_by_priority,
+            "queued_by_host": queued_by_host,
+        }
+
+
+# Globale Instanz
+ssh_scheduler = SSHScheduler()
+
+
+class BreakerState(str, Enum):
+    closed = "closed"  # Host erreichbar, Aufrufe laufen normal
+    open = "open"  # Host gilt als offline, Aufrufe werden sofort beantwortet
+    half_open = "half_open"  # Ein Probe-Aufruf darf testen, ob der Host wieder da ist
+
+
+def _iso(ts: float | None) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else ""
+
+
+# Token für Aufrufe bei geschlossenem Breaker (keine Probe)
+_NO_PROBE = object()
+
+
+class CircuitBreaker:
+    """Circuit Breaker für einen SSH-Host.
+
+    Nach ssh_breaker_threshold aufeinanderfolgenden Verbindungsfehlern wird der
+    Breaker geöffnet. Nach einer Wartezeit (exponentiell bis ssh_breaker_backoff_max)
+    darf genau ein Aufruf als Probe durch; Erfolg schließt den Breaker wieder.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = BreakerState.closed
+        self.failures = 0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.last_success: float | None = None
+        self.last_failure: float | None = None
+        self.last_error = ""
+        self.transitions: deque[dict] = deque(maxlen=20)
+        self._probe: object | None = None  # Token des Aufrufs, der gerade probt
+
+    def _transition(self, state: BreakerState, reason: str) -> None:
+        if state == self.state:
+            return
+        self.transitions.append({
+            "from": self.state.value,
+            "to": state.value,
+            "at": _iso(time.time()),
+            "reason": reason,
+        })
+        logger.info("SSH-Breaker %s: %s → %s (%s)", self.host, self.state.value, state.value, reason)
+        self.state = state
+
+    def allow(self) -> object | None:
+        """Prüft, ob ein Aufruf durchgelassen wird; None, wenn nicht.
+
+        Sonst ein Token für release_probe: nur der Aufruf, der als Probe
+        durchgelassen wurde, gibt damit den Probe-Slot wieder frei.
+        """
+        if self.state == BreakerState.closed:
+            return _NO_PROBE
+        if self.state == BreakerState.open and time.time() >= self.retry_at:
+            self._transition(BreakerState.half_open, "Wartezeit abgelaufen, Probe")
+        if self.state == BreakerState.half_open and self._probe is None:
+            self._probe = object()
+            return self._probe
+        return None
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.backoff = 0.0
+        self.last_success = time.time()
+        self._probe = None
+        self._transition(BreakerState.closed, "Host erreichbar")
+
+    def record_failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_failure = time.time()
+        self.last_error = error
+        if self.state == BreakerState.half_open:
+            self._probe = None
+            self.backoff = min(self.backoff * 2, settings.ssh_breaker_backoff_max)
+            self.retry_at = self.last_failure + self.backoff
+            self._transition(BreakerState.open, f"Probe fehlgeschlagen: {error}")
+        elif self.state == BreakerState.closed and self.failures >= settings.ssh_breaker_threshold:
+            self.backoff = float(settings.ssh_breaker_backoff)
+            self.retry_at = self.last_failure + self.backoff
+            self._transition(BreakerState.open, f"{self.failures} Fehler in Folge: {error}")
+
+    def release_probe(self, token: object) -> None:
+        """Gibt den Probe-Slot frei, wenn die Probe ohne Ergebnis endete (z.B. Timeout).
+
+        Andere Aufrufe (Token aus dem geschlossenen Zustand) ändern nichts.
+        """
+        if token is self._probe:
+            self._probe = None
+
+    def offline_message(self) -> str:
+        if self.last_success:
+            return f"offline (zuletzt gesehen {_iso(self.last_success)})"
+        return "offline (noch nie erreicht)"
+
+    def reset(self) -> None:
+        self.failures = 0
+        self.backoff = 0.0
+        self._probe = None
+        self._transition(BreakerState.closed, "manuell zurückgesetzt")
+
+    def info(self) -> dict:
+        return {
+            "host": self.host,
+            "state": self.state.value,
+            "failures": self.failures,
+            "last_success": _iso(self.last_success),
+            "last_failure": _iso(self.last_failure),
+            "last_error": self.last_error,
+            "retry_at": _iso(self.retry_at) if self.state != BreakerState.closed else "",
+            "transitions": list(self.transitions),
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit Breaker pro SSH-Ziel."""
+
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, target: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            breaker = self._breakers[target] = CircuitBreaker(target)
+        return breaker
+
+    def find(self, target: str) -> CircuitBreaker | None:
+        return self._breakers.get(target)
+
+    def all(self) -> list[CircuitBreaker]:
+        return list(self._breakers.values())
+
+
+# Globale Instanz
+ssh_breakers = CircuitBreakerRegistry()
+
+
+def _ssh_error(exc: BaseException) -> str:
+    """Formatiert eine Verbindungs-Exception wie die ssh-CLI."""
+    return str(exc) or exc.__class__.__name__
+
+
 async def run_ssh(
     host: str,
     command: str,
@@ -51,36 +322,48 @@ async def run_ssh(
 
     Gibt (exit_code, stdout, stderr) zurück.
     Alle Befehle werden per SSH ausgeführt (auch Proxy-Befehle),
-    da das Backend in einem Container läuft.
+    da das Backend in einem Container läuft. Die Verbindung kommt aus
+    dem Pool, der Slot vom Scheduler; Verbindungsfehler liefern wie bei
+    der ssh-CLI rc=255.
     """
     effective_timeout = timeout or settings.ssh_timeout
 
     target = resolve_ssh_target(host)
-
-    ssh_cmd = (
-        f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR "
-        f"-o ConnectTimeout={effective_timeout} "
-        f"-o BatchMode=yes -i {settings.ssh_key_path} "
-        f"{settings.ssh_user}@{target} {shlex.quote(command)}"
-    )
-    proc = await asyncio.create_subprocess_shell(
-        ssh_cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+    breaker = ssh_breakers.get(target)
+    probe = breaker.allow()
+    if probe is None:
+        return 255, "", breaker.offline_message()
 
     try:
-        stdout, stderr = await asyncio.wait_for(
-            proc.communicate(), timeout=effective_timeout + 5
-        )
+        async with ssh_scheduler.slot(target):
+            result = await asyncio.wait_for(
+                ssh_pool.run(
+                    target,
+                    command,
+                    connect_timeout=effective_timeout,
+                    encoding="utf-8",
+                    errors="replace",
+                ),
+                timeout=effective_timeout + 5,
+            )
     except asyncio.TimeoutError:
-        proc.kill()
         logger.warning("SSH timeout: %s", host)
         return -1, "", "Timeout"
-
-    rc = proc.returncode or 0
-    out = stdout.decode("utf-8", errors="replace").strip()
-    err = stderr.decode("utf-8", errors="replace").strip()
+    except (SSHConnectError, *RECONNECT_ERRORS) as e:
+        breaker.record_failure(_ssh_error(e))
+        logger.warning("SSH failed (host=%s, rc=255): %s", host, _ssh_error(e))
+        return 255, "", _ssh_error(e)
+    except (OSError, asyncssh.Error) as e:
+        logger.warning("SSH failed (host=%s, rc=255): %s", host, _ssh_error(e))
+        return 255, "", _ssh_error(e)
+    finally:
+        # Timeout/Abbruch sagen nichts über die Erreichbarkeit aus
+        breaker.release_probe(probe)
+
+    breaker.record_success()
+    rc = result.returncode if result.returncode is not None else -1
+    out = (result.stdout or "").strip()
+    err = (result.stderr or "").strip()
 
     if rc != 0:
         logger.warning("SSH failed (host=%s, rc=%d): %s", host, rc, err)
@@ -94,67 +377,146 @@ async def run_ssh_stream(
 ) -> AsyncIterator[str]:
     """Führt einen SSH-Befehl aus und streamt die Ausgabe zeilenweise."""
     target = resolve_ssh_target(host)
+    breaker = ssh_breakers.get(target)
+    probe = breaker.allow()
+    if probe is None:
+        yield f"ssh: {target}: {breaker.offline_message()}"
+        return
 
-    ssh_cmd = (
-        f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR "
-        f"-o ConnectTimeout={settings.ssh_timeout} "
-        f"-o BatchMode=yes -i {settings.ssh_key_path} "
-        f"{settings.ssh_user}@{target} {shlex.quote(command)}"
-    )
-    proc = await asyncio.create_subprocess_shell(
-        ssh_cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-
-    async for line in proc.stdout:
-        yield line.decode("utf-8", errors="replace").rstrip("\n")
+    try:
+        async with ssh_scheduler.slot(target), ssh_pool.process(
+            target,
+            command,
+            stderr=asyncssh.STDOUT,
+            encoding="utf-8",
+            errors="replace",
+        ) as proc:
+            breaker.record_success()
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                yield line.rstrip("\n")
+    except (SSHConnectError, *RECONNECT_ERRORS) as e:
+        breaker.record_failure(_ssh_error(e))
+        logger.warning("SSH stream failed (host=%s): %s", host, _ssh_error(e))
+        yield f"ssh: {target}: {_ssh_error(e)}"
+    except (OSError, asyncssh.Error, asyncio.TimeoutError) as e:
+        logger.warning("SSH stream failed (host=%s): %s", host, _ssh_error(e))
+        yield f"ssh: {target}: {_ssh_error(e)}"
+    finally:
+        breaker.release_probe(probe)
+
+
+@asynccontextmanager
+async def ssh_watch(host: str, command: str, **kwargs) -> AsyncIterator[asyncssh.SSHClientProcess]:
+    """Startet einen langlebigen Befehl (z.B. docker events) am Scheduler vorbei.
+
+    Solche Streams laufen dauerhaft und würden Scheduler-Slots sonst nie
+    freigeben; sie belegen nur einen Channel einer gepoolten Verbindung.
+    Verbindungsfehler werden als Exception weitergereicht, damit der
+    Aufrufer selbst neu verbinden kann.
+    """
+    target = resolve_ssh_target(host)
+    breaker = ssh_breakers.get(target)
+    probe = breaker.allow()
+    if probe is None:
+        raise SSHConnectError(breaker.offline_message())
+
+    # Text per Default; encoding=None für Binärdaten (z.B. Image-Archive)
+    kwargs.setdefault("encoding", "utf-8")
+    if kwargs["encoding"]:
+        kwargs.setdefault("errors", "replace")
+    try:
+        async with ssh_pool.process(target, command, **kwargs) as proc:
+            breaker.record_success()
+            yield proc
+    except (SSHConnectError, *RECONNECT_ERRORS) as e:
+        breaker.record_failure(_ssh_error(e))
+        raise
+    finally:
+        breaker.release_probe(probe)
+
+
+@asynccontextmanager
+async def ssh_session(host: str, command: str, **kwargs) -> AsyncIterator[asyncssh.SSHClientProcess]:
+    """Startet einen Befehl mit Scheduler-Slot für eigene Ein-/Ausgabe.
+
+    Für Befehle, die Daten über stdin bekommen (z.B. Archive) oder einen
+    Dialog mit dem Host führen. Mit encoding=None arbeitet der Prozess
+    mit bytes. Verbindungsfehler werden als Exception weitergereicht.
+    """
+    target = resolve_ssh_target(host)
+    breaker = ssh_breakers.get(target)
+    probe = breaker.allow()
+    if probe is None:
+        raise SSHConnectError(breaker.offline_message())
 
-    await proc.wait()
+    try:
+        async with ssh_scheduler.slot(target), ssh_pool.process(target, command, **kwargs) as proc:
+            breaker.record_success()
+            yield proc
+    except (SSHConnectError, *RECONNECT_ERRORS) as e:
+        breaker.record_failure(_ssh_error(e))
+        raise
+    finally:
+        breaker.release_probe(probe)
 
 
-async def scp_upload(
+async def _scp(
     host: str,
     local_path: str,
     remote_path: str,
-    timeout: int | None = None,
+    upload: bool,
+    timeout: int,
 ) -> tuple[int, str]:
-    """Lädt eine lokale Datei per SCP auf einen Host hoch.
-
-    Gibt (exit_code, stderr) zurück.
-    """
-    effective_timeout = timeout or 120
+    """Kopiert eine Datei per SCP über eine gepoolte Verbindung."""
+    label = "SCP" if upload else "SCP download"
     target = resolve_ssh_target(host)
-
-    scp_cmd = (
-        f"scp -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR "
-        f"-o ConnectTimeout={settings.ssh_timeout} "
-        f"-o BatchMode=yes -i {settings.ssh_key_path} "
-        f"{shlex.quote(local_path)} "
-        f"{settings.ssh_user}@{target}:{shlex.quote(remote_path)}"
-    )
-    proc = await asyncio.create_subprocess_shell(
-        scp_cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+    breaker = ssh_breakers.get(target)
+    probe = breaker.allow()
+    if probe is None:
+        return 255, breaker.offline_message()
+
+    async def _copy():
+        async with ssh_pool.connection(target) as pc:
+            breaker.record_success()
+            remote = (pc.conn, shlex.quote(remote_path))
+            if upload:
+                await asyncssh.scp(local_path, remote)
+            else:
+                await asyncssh.scp(remote, local_path)
 
     try:
-        _, stderr = await asyncio.wait_for(
-            proc.communicate(), timeout=effective_timeout
-        )
+        async with ssh_scheduler.slot(target):
+            await asyncio.wait_for(_copy(), timeout=timeout)
     except asyncio.TimeoutError:
-        proc.kill()
-        logger.warning("SCP timeout: %s", host)
+        logger.warning("%s timeout: %s", label, host)
         return -1, "Timeout"
+    except SSHConnectError as e:
+        breaker.record_failure(_ssh_error(e))
+        logger.warning("%s failed (host=%s): %s", label, host, _ssh_error(e))
+        return 255, _ssh_error(e)
+    except (OSError, asyncssh.Error) as e:
+        logger.warning("%s failed (host=%s): %s", label, host, _ssh_error(e))
+        return 1, _ssh_error(e)
+    finally:
+        breaker.release_probe(probe)
 
-    rc = proc.returncode or 0
-    err = stderr.decode("utf-8", errors="replace").strip()
+    return 0, ""
 
-    if rc != 0:
-        logger.warning("SCP failed (host=%s, rc=%d): %s", host, rc, err)
 
-    return rc, err
+async def scp_upload(
+    host: str,
+    local_path: str,
+    remote_path: str,
+    timeout: int | None = None,
+) -> tuple[int, str]:
+    """Lädt eine lokale Datei per SCP auf einen Host hoch.
+
+    Gibt (exit_code, stderr) zurück.
+    """
+    return await _scp(host, local_path, remote_path, True, timeout or 120)
 
 
 async def scp_download(
@@ -167,38 +529,7 @@ async def scp_download(
 
     Gibt (exit_code, stderr) zurück.
     """
-    effective_timeout = timeout or 120
-    target = resolve_ssh_target(host)
-
-    scp_cmd = (
-        f"scp -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR "
-        f"-o ConnectTimeout={settings.ssh_timeout} "
-        f"-o BatchMode=yes -i {settings.ssh_key_path} "
-        f"{settings.ssh_user}@{target}:{shlex.quote(remote_path)} "
-        f"{shlex.quote(local_path)}"
-    )
-    proc = await asyncio.create_subprocess_shell(
-        scp_cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-
-    try:
-        _, stderr = await asyncio.wait_for(
-            proc.communicate(), timeout=effective_timeout
-        )
-    except asyncio.TimeoutError:
-        proc.kill()
-        logger.warning("SCP download timeout: %s", host)
-        return -1, "Timeout"
-
-    rc = proc.returncode or 0
-    err = stderr.decode("utf-8", errors="replace").strip()
-
-    if rc != 0:
-        logger.warning("SCP download failed (host=%s, rc=%d): %s", host, rc, err)
-
-    return rc, err
+    return await _scp(host, local_path, remote_path, False, timeout or 120)
 
 
 async def check_host_online(host: str) -> bool:
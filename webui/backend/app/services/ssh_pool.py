@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import asyncssh
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Fehler, bei denen die Verbindung verworfen und einmal neu aufgebaut wird
+RECONNECT_ERRORS = (
+    asyncssh.ConnectionLost,
+    asyncssh.ChannelOpenError,
+    asyncssh.DisconnectError,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class SSHConnectError(OSError):
+    """Verbindungsaufbau zum Host fehlgeschlagen (nicht erreichbar, Auth, Timeout)."""
+
+
+class _PooledConnection:
+    """Eine SSH-Verbindung im Pool mit Zähler für offene Channels."""
+
+    def __init__(self, conn: asyncssh.SSHClientConnection):
+        self.conn = conn
+        self.channels = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    @property
+    def closed(self) -> bool:
+        return self.conn.is_closed()
+
+
+class SSHConnectionPool:
+    """Hält persistente asyncssh-Verbindungen pro Host.
+
+    Mehrere Befehle teilen sich eine Verbindung (ein Channel pro Befehl),
+    bis max_channels erreicht ist; dann wird eine weitere Verbindung geöffnet.
+    Unbenutzte Verbindungen werden nach idle_timeout geschlossen.
+    """
+
+    def __init__(self):
+        self._connections: dict[str, list[_PooledConnection]] = {}
+        self._connect_locks: dict[str, asyncio.Lock] = {}
+        self._reaper: asyncio.Task | None = None
+
+    def _connect_options(self, connect_timeout: int | None = None) -> dict:
+        return {
+            "username": settings.ssh_user,
+            "client_keys": [settings.ssh_key_path],
+            "known_hosts": None,
+            "connect_timeout": connect_timeout or settings.ssh_timeout,
+            "keepalive_interval": settings.ssh_keepalive_interval,
+            "keepalive_count_max": settings.ssh_keepalive_count_max,
+        }
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self) -> None:
+        """Schließt Verbindungen, die länger als idle_timeout unbenutzt sind."""
+        while True:
+            await asyncio.sleep(max(1, settings.ssh_pool_idle_timeout // 4))
+            now = time.monotonic()
+            for host, pooled in list(self._connections.items()):
+                for pc in list(pooled):
+                    if pc.closed:
+                        pooled.remove(pc)
+                    elif pc.channels == 0 and now - pc.last_used > settings.ssh_pool_idle_timeout:
+                        pooled.remove(pc)
+                        pc.conn.close()
+                        logger.debug("SSH-Verbindung wegen Inaktivität geschlossen: %s", host)
+                if not pooled:
+                    self._connections.pop(host, None)
+
+    def _pick(self, target: str) -> _PooledConnection | None:
+        """Wählt die Verbindung mit den wenigsten Channels unterhalb des Limits."""
+        pooled = self._connections.get(target, [])
+        pooled[:] = [pc for pc in pooled if not pc.closed]
+        candidates = [pc for pc in pooled if pc.channels < settings.ssh_pool_max_channels]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda pc: pc.channels)
+
+    async def _checkout(self, target: str, connect_timeout: int | None) -> _PooledConnection:
+        pc = self._pick(target)
+        if pc is None:
+            lock = self._connect_locks.setdefault(target, asyncio.Lock())
+            async with lock:
+                # Ein anderer Aufrufer hat evtl. schon eine Verbindung geöffnet
+                pc = self._pick(target)
+                if pc is None:
+                    try:
+                        conn = await asyncssh.connect(target, **self._connect_options(connect_timeout))
+                    except asyncio.TimeoutError as e:
+                        raise SSHConnectError(f"connect to host {target}: Connection timed out") from e
+                    except (OSError, asyncssh.Error) as e:
+                        raise SSHConnectError(str(e) or e.__class__.__name__) from e
+                    pc = _PooledConnection(conn)
+                    self._connections.setdefault(target, []).append(pc)
+                    logger.debug("SSH-Verbindung geöffnet: %s", target)
+        pc.channels += 1
+        pc.last_used = time.monotonic()
+        return pc
+
+    def _checkin(self, pc: _PooledConnection) -> None:
+        pc.channels -= 1
+        pc.last_used = time.monotonic()
+
+    def discard(self, target: str, pc: _PooledConnection) -> None:
+        """Entfernt eine defekte Verbindung aus dem Pool."""
+        pooled = self._connections.get(target, [])
+        if pc in pooled:
+            pooled.remove(pc)
+        pc.conn.close()
+
+    @asynccontextmanager
+    async def connection(
+        self,
+        target: str,
+        connect_timeout: int | None = None,
+    ) -> AsyncIterator[_PooledConnection]:
+        """Leiht eine Verbindung für einen Channel aus."""
+        self._ensure_reaper()
+        pc = await self._checkout(target, connect_timeout)
+        try:
+            yield pc
+        finally:
+            self._checkin(pc)
+
+    @asynccontextmanager
+    async def process(
+        self,
+        target: str,
+        command: str,
+        connect_timeout: int | None = None,
+        **kwargs,
+    ) -> AsyncIterator[asyncssh.SSHClientProcess]:
+        """Startet einen Befehl über eine gepoolte Verbindung.
+
+        Schlägt das Öffnen des Channels fehl, weil die Verbindung weggebrochen
+        ist, wird sie verworfen und einmal über eine neue Verbindung versucht.
+        Beim Verlassen wird der Channel geschlossen (auch bei Timeout/Abbruch).
+        """
+        for attempt in (1, 2):
+            async with self.connection(target, connect_timeout) as pc:
+                try:
+                    process = await pc.conn.create_process(command, **kwargs)
+                except RECONNECT_ERRORS:
+                    self.discard(target, pc)
+                    if attempt == 2:
+                        raise
+                    logger.info("SSH-Verbindung zu %s verloren, verbinde neu", target)
+                    continue
+                async with process:
+                    yield process
+                return
+
+    async def run(
+        self,
+        target: str,
+        command: str,
+        connect_timeout: int | None = None,
+        **kwargs,
+    ) -> asyncssh.SSHCompletedProcess:
+        """Führt einen Befehl aus und wartet auf dessen Ende."""
+        async with self.process(target, command, connect_timeout, **kwargs) as process:
+            return await process.wait()
+
+    def stats(self) -> dict[str, dict]:
+        """Verbindungs- und Channel-Anzahl pro Host."""
+        return {
+            host: {
+                "connections": len(pooled),
+                "channels": sum(pc.channels for pc in pooled),
+            }
+            for host, pooled in self._connections.items()
+            if pooled
+        }
+
+    async def close_all(self) -> None:
+        """Schließt alle Verbindungen (beim Herunterfahren)."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for pooled in self._connections.values():
+            for pc in pooled:
+                pc.conn.close()
+        for pooled in self._connections.values():
+            for pc in pooled:
+                try:
+                    await asyncio.wait_for(pc.conn.wait_closed(), timeout=3)
+                except (asyncio.TimeoutError, Exception):
+                    pass
+        self._connections.clear()
+
+
+# Globale Instanz
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+# Verhalten bei vollem Puffer
+DROP_OLDEST = "drop-oldest"  # älteste Zeile verwerfen, der Zuschauer bleibt aktuell
+DROP_NEWEST = "drop-newest"  # neue Zeilen verwerfen, bis der Zuschauer aufholt
+DISCONNECT = "disconnect"  # Zuschauer trennen, er setzt per Cursor neu an
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+
+class BoundedSubscriber(Generic[T]):
+    """Begrenzter Puffer eines Live-Zuschauers (Task-Output, Container-Logs).
+
+    push() blockiert nie, der Erzeuger wird also nicht von langsamen
+    Clients gebremst. Ist der Puffer voll, greift die Policy; verworfene
+    Zeilen werden gezählt und mit dem nächsten Batch gemeldet.
+    """
+
+    def __init__(self, max_lines: int, policy: str = DROP_OLDEST, position: int = 0):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unbekannte Overflow-Policy '{policy}', erlaubt: {', '.join(OVERFLOW_POLICIES)}")
+        self.position = position  # Nummer der ersten Zeile im Puffer
+        self.max_lines = max_lines
+        self.policy = policy
+        self.dropped = 0
+        self.finished = False
+        self.overflowed = False
+        self._items: deque[T] = deque()
+        self._event = asyncio.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self.finished or self.overflowed
+
+    @property
+    def pending(self) -> int:
+        return len(self._items)
+
+    def push(self, item: T) -> None:
+        if self.closed:
+            return
+        if len(self._items) >= self.max_lines:
+            if self.policy == DISCONNECT:
+                self.overflowed = True
+                self._items.clear()
+                self._event.set()
+                return
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                self._event.set()
+                return
+            self._items.popleft()
+            self.position += 1
+        self._items.append(item)
+        self._event.set()
+
+    def finish(self) -> None:
+        self.finished = True
+        self._event.set()
+
+    async def next_batch(
+        self, max_lines: int | None = None, interval: float = 0.0
+    ) -> tuple[int, list[T], int]:
+        """Wartet auf Zeilen und sammelt bis zu interval Sekunden nach.
+
+        Gibt (Nummer der ersten Zeile, Zeilen, seit dem letzten Batch
+        verworfen) zurück; max_lines=None holt alles ab.
+        """
+        await self._event.wait()
+        if not self.closed and interval > 0 and (max_lines is None or len(self._items) < max_lines):
+            await asyncio.sleep(interval)
+        self._event.clear()
+        start = self.position
+        count = len(self._items) if max_lines is None else min(len(self._items), max_lines)
+        items = [self._items.popleft() for _ in range(count)]
+        self.position += count
+        if self._items or self.closed:
+            self._event.set()  # Rest bzw. Ende im nächsten Batch
+        dropped, self.dropped = self.dropped, 0
+        return start, items, dropped
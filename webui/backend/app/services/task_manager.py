@@ -1,19 +1,227 @@
 import asyncio
+import gzip
+import logging
+import os
+import time
 import uuid
+import zlib
+from collections import deque
 from datetime import datetime, timezone
-from typing import Callable, Coroutine
+from itertools import islice
+from typing import Callable, Coroutine, Iterator
 
+from ..config import settings
 from ..models.task import TaskInfo, TaskStatus
+from .hosts import resolve_host
+from .ssh import SSHPriority, ssh_priority
+from .subscriber import BoundedSubscriber
+from .task_store import task_store
+
+logger = logging.getLogger(__name__)
+
+_READ_CHUNK = 64 * 1024
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def output_dir() -> str:
+    return os.path.join(settings.data_dir, "tasks")
+
+
+def output_path(task_id: str) -> str:
+    return os.path.join(output_dir(), f"{task_id}.log.gz")
+
+
+def _read_log(path: str) -> Iterator[str]:
+    """Liest eine gzip-Logdatei zeilenweise, auch während noch geschrieben wird.
+
+    Ein laufender Task hat einen noch offenen gzip-Stream (nur per Sync-Flush
+    abgeschlossen), den gzip.open nicht liest; decompressobj verarbeitet ihn
+    bis zum letzten vollständigen Block. Mehrere Member (nach erneutem
+    Öffnen) werden nacheinander gelesen; bricht ein Member ab (Backend wurde
+    beim Schreiben beendet), geht es am nächsten gzip-Header weiter.
+    """
+    decomp = zlib.decompressobj(wbits=31)
+    fresh = True  # decomp hat noch keine Daten gesehen
+    pending = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                break
+            while chunk:
+                backup = decomp.copy()
+                try:
+                    data = decomp.decompress(chunk)
+                except zlib.error:
+                    # Lesbaren Rest des Members bis zum nächsten Header retten
+                    start = chunk.find(_GZIP_MAGIC, 1 if fresh else 0)
+                    try:
+                        pending += backup.decompress(chunk[:start] if start >= 0 else chunk)
+                    except zlib.error:
+                        pass
+                    # Angefangene letzte Zeile des Members nicht mit dem nächsten verketten
+                    *lines, pending = pending.split(b"\n")
+                    for line in lines + ([pending] if pending else []):
+                        yield line.decode("utf-8", "replace")
+                    pending = b""
+                    if start < 0:
+                        return
+                    chunk = chunk[start:]
+                    decomp = zlib.decompressobj(wbits=31)
+                    fresh = True
+                    continue
+                fresh = False
+                pending += data
+                chunk = b""
+                if decomp.eof:
+                    chunk = decomp.unused_data
+                    decomp = zlib.decompressobj(wbits=31)
+                    fresh = True
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", "replace")
+
+
+def read_lines(path: str, offset: int, limit: int | None) -> list[str]:
+    stop = None if limit is None else offset + limit
+    return list(islice(_read_log(path), offset, stop))
+
+
+class TaskOutput:
+    """Output eines Tasks: begrenzter Ring im Speicher, vollständig als gzip-Log.
+
+    Der Ring hält die letzten Zeilen für Live-Zuschauer und kurze Abfragen;
+    ältere Zeilen werden bei Bedarf aus der Datei gelesen. Geflusht wird ab
+    task_log_flush_bytes und zusätzlich periodisch vom TaskManager. Ist
+    data_dir nicht beschreibbar, bleibt nur der Ring (ältere Zeilen gehen
+    dann verloren).
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.total = 0
+        self._ring: deque[tuple[str, int]] = deque()  # (zeile, bytes)
+        self._ring_bytes = 0
+        self._file: gzip.GzipFile | None = None
+        self._unflushed = 0  # Bytes seit dem letzten Flush
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._file = gzip.open(path, "ab")
+            except OSError as e:
+                logger.warning("Task-Log %s nicht beschreibbar (%s), nur Speicher-Puffer", path, e)
+                self.path = None
+
+    @property
+    def first_buffered(self) -> int:
+        """Index der ältesten Zeile, die noch im Speicher liegt."""
+        return self.total - len(self._ring)
+
+    def append(self, line: str) -> None:
+        data = line.encode("utf-8", "replace")
+        if self._file is not None:
+            try:
+                self._file.write(data + b"\n")
+                self._unflushed += len(data) + 1
+            except OSError as e:
+                logger.warning("Task-Log %s nicht beschreibbar (%s), nur Speicher-Puffer", self.path, e)
+                self.close()
+                self.path = None
+            if self._unflushed >= settings.task_log_flush_bytes:
+                self.sync()
+        self._ring.append((line, len(data)))
+        self._ring_bytes += len(data)
+        self.total += 1
+        while len(self._ring) > 1 and (
+            len(self._ring) > settings.task_output_ring_lines
+            or self._ring_bytes > settings.task_output_ring_bytes
+        ):
+            self._ring_bytes -= self._ring.popleft()[1]
+
+    @property
+    def dirty(self) -> bool:
+        """Ob Zeilen noch nicht im gzip-Log auf der Platte stehen."""
+        return self._file is not None and self._unflushed > 0
+
+    def sync(self) -> None:
+        """Schreibt gepufferte Zeilen, damit _read_log sie sieht."""
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError as e:
+                logger.warning("Task-Log %s nicht beschreibbar (%s), nur Speicher-Puffer", self.path, e)
+                self.close()
+                self.path = None
+            self._unflushed = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def buffered(self, offset: int, limit: int | None) -> list[str]:
+        start = max(offset - self.first_buffered, 0)
+        stop = None if limit is None else start + limit
+        return [line for line, _ in islice(self._ring, start, stop)]
+
+    def read(self, offset: int, limit: int | None) -> list[str]:
+        """Zeilen ab offset; liest aus der Datei, wenn sie nicht mehr im Ring liegen."""
+        if offset >= self.first_buffered or not self.path:
+            return self.buffered(offset, limit)
+        try:
+            return read_lines(self.path, offset, limit)
+        except (OSError, zlib.error) as e:
+            logger.warning("Task-Log %s nicht lesbar: %s", self.path, e)
+            return self.buffered(offset, limit)
+
+
+class QueuedTask:
+    """Wartender Task mit allem, was der Scheduler zum Starten braucht."""
+
+    def __init__(
+        self,
+        task_id: str,
+        task_type: str,
+        priority: int,
+        seq: int,
+        locks: set[str],
+        coro_factory: Callable[[str], Coroutine],
+    ):
+        self.task_id = task_id
+        self.type = task_type
+        self.priority = priority
+        self.seq = seq
+        self.locks = locks  # Hosts, die der Task exklusiv braucht
+        self.coro_factory = coro_factory
 
 
 class TaskManager:
-    """Verwaltet Background-Tasks mit Output-Buffering und WebSocket-Push."""
+    """Verwaltet Background-Tasks mit Output-Buffering und WebSocket-Push.
+
+    Im Speicher liegen nur laufende Tasks; Metadaten aller Tasks stehen im
+    task_store, der Output im gzip-Log pro Task.
+
+    Neue Tasks kommen in eine Warteschlange (kleinere Priorität zuerst,
+    sonst in Ankunftsreihenfolge). Gestartet wird, solange das globale
+    Limit (task_max_workers) und das Limit des Typs (task_type_limits)
+    frei sind und kein anderer exklusiver Task (task_exclusive_types) einen
+    der Hosts belegt. Blockierte Tasks halten nachfolgende nicht auf.
+    """
 
     def __init__(self):
         self._tasks: dict[str, TaskInfo] = {}
-        self._output: dict[str, list[str]] = {}
-        self._subscribers: dict[str, list[asyncio.Queue]] = {}
+        self._output: dict[str, TaskOutput] = {}
+        self._subscribers: dict[str, list[BoundedSubscriber[str]]] = {}
         self._asyncio_tasks: dict[str, asyncio.Task] = {}
+        self._sweep_task: asyncio.Task | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._queue: list[QueuedTask] = []
+        self._running: dict[str, QueuedTask] = {}
+        self._host_locks: dict[str, str] = {}  # host -> task_id
+        self._seq = 0
 
     def create_task(
         self,
@@ -21,10 +229,16 @@ class TaskManager:
         description: str,
         host: str = "",
         coro_factory: Callable[[str], Coroutine] | None = None,
+        hosts: list[str] | None = None,
+        priority: int | None = None,
     ) -> str:
-        """Erstellt einen neuen Background-Task und gibt die task_id zurück."""
+        """Erstellt einen neuen Background-Task und gibt die task_id zurück.
+
+        hosts nennt bei Tasks über mehrere Hosts (z.B. Rollout) alle
+        betroffenen Hosts für die Sperre; sonst gilt host.
+        """
         task_id = str(uuid.uuid4())[:8]
-        self._tasks[task_id] = TaskInfo(
+        task = TaskInfo(
             task_id=task_id,
             type=task_type,
             description=description,
@@ -32,85 +246,274 @@ class TaskManager:
             host=host,
             started_at=datetime.now(timezone.utc).isoformat(),
         )
-        self._output[task_id] = []
+        self._tasks[task_id] = task
+        self._output[task_id] = TaskOutput(output_path(task_id))
         self._subscribers[task_id] = []
+        task_store.save(task)
 
         if coro_factory:
-            self._asyncio_tasks[task_id] = asyncio.create_task(
-                self._run_task(task_id, coro_factory)
-            )
+            locks: set[str] = set()
+            if task_type in settings.task_exclusive_types:
+                # Sperren über die IP, damit Name und IP desselben Hosts kollidieren
+                locks = {resolve_host(h) or h for h in (hosts or [host]) if h}
+            if priority is None:
+                priority = settings.task_priorities.get(task_type, settings.task_default_priority)
+            self._seq += 1
+            self._queue.append(QueuedTask(task_id, task_type, priority, self._seq, locks, coro_factory))
+            self._queue.sort(key=lambda q: (q.priority, q.seq))
+            self._dispatch()
+            if task_id not in self._running:
+                self._emit(task_id, f"In Warteschlange (Position {task.queue_position}).")
 
         return task_id
 
+    def _blocked(self, queued: QueuedTask) -> bool:
+        if len(self._running) >= settings.task_max_workers:
+            return True
+        limit = settings.task_type_limits.get(queued.type)
+        if limit is not None and sum(1 for r in self._running.values() if r.type == queued.type) >= limit:
+            return True
+        return any(host in self._host_locks for host in queued.locks)
+
+    def _dispatch(self) -> None:
+        """Startet alle Tasks der Warteschlange, die gerade laufen dürfen."""
+        waiting = []
+        for queued in self._queue:
+            if self._blocked(queued):
+                waiting.append(queued)
+                continue
+            self._running[queued.task_id] = queued
+            for host in queued.locks:
+                self._host_locks[host] = queued.task_id
+            self._tasks[queued.task_id].queue_position = None
+            self._asyncio_tasks[queued.task_id] = asyncio.create_task(
+                self._run_task(queued.task_id, queued.coro_factory)
+            )
+        self._queue = waiting
+        for position, queued in enumerate(waiting, 1):
+            self._tasks[queued.task_id].queue_position = position
+
+    def _release(self, task_id: str) -> None:
+        queued = self._running.pop(task_id, None)
+        if queued is None:
+            return
+        for host in queued.locks:
+            if self._host_locks.get(host) == task_id:
+                del self._host_locks[host]
+        self._dispatch()
+
     async def _run_task(
         self,
         task_id: str,
         coro_factory: Callable[[str], Coroutine],
     ):
         """Führt einen Task aus und aktualisiert den Status."""
-        self._tasks[task_id].status = TaskStatus.running
+        task = self._tasks[task_id]
+        task.status = TaskStatus.running
+        task_store.save(task)
         try:
-            await coro_factory(task_id)
-            self._tasks[task_id].status = TaskStatus.completed
-            self._tasks[task_id].exit_code = 0
+            # SSH-Aufrufe von Tasks werden hinter interaktiven Anfragen eingereiht
+            with ssh_priority(SSHPriority.background):
+                await coro_factory(task_id)
+            task.status = TaskStatus.completed
+            task.exit_code = 0
         except Exception as e:
-            self._tasks[task_id].status = TaskStatus.failed
-            self._tasks[task_id].exit_code = 1
+            task.status = TaskStatus.failed
+            task.exit_code = 1
             await self.push_output(task_id, f"FEHLER: {e}")
         finally:
-            self._tasks[task_id].finished_at = datetime.now(timezone.utc).isoformat()
-            # Schließe alle Subscriber-Queues
-            for queue in self._subscribers.get(task_id, []):
-                await queue.put(None)
+            task.finished_at = datetime.now(timezone.utc).isoformat()
+            task_store.save(task)
+            self._release(task_id)
+            # Abgeschlossene Tasks werden ab jetzt aus DB und Log gelesen
+            self._asyncio_tasks.pop(task_id, None)
+            self._tasks.pop(task_id, None)
+            output = self._output.pop(task_id, None)
+            if output is not None:
+                output.close()
+            # Zuschauer bekommen den Rest ihres Puffers, dann das Ende
+            for subscriber in self._subscribers.pop(task_id, []):
+                subscriber.finish()
 
     async def push_output(self, task_id: str, line: str):
         """Fügt eine Zeile zum Output-Buffer hinzu und benachrichtigt Subscriber."""
-        if task_id in self._output:
-            self._output[task_id].append(line)
-            self._tasks[task_id].output_lines = len(self._output[task_id])
-
-        for queue in self._subscribers.get(task_id, []):
-            await queue.put(line)
-
-    def subscribe(self, task_id: str) -> asyncio.Queue:
-        """Erstellt eine Queue für Live-Output eines Tasks."""
-        queue: asyncio.Queue = asyncio.Queue()
-        if task_id not in self._subscribers:
-            self._subscribers[task_id] = []
-        self._subscribers[task_id].append(queue)
-        return queue
-
-    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
-        """Entfernt eine Subscriber-Queue."""
+        self._emit(task_id, line)
+
+    def _emit(self, task_id: str, line: str) -> None:
+        # Mehrzeilige Meldungen einzeln speichern, damit Zeilen-Offsets stimmen
+        lines = line.split("\n")
+        output = self._output.get(task_id)
+        if output is not None:
+            for part in lines:
+                output.append(part)
+            self._tasks[task_id].output_lines = output.total
+
+        for subscriber in self._subscribers.get(task_id, []):
+            for part in lines:
+                subscriber.push(part)
+
+    def subscribe(self, task_id: str, policy: str | None = None) -> BoundedSubscriber[str]:
+        """Erstellt einen Puffer für Live-Output eines Tasks.
+
+        subscriber.position ist die erste Zeile, die über den Puffer kommt;
+        alles davor liefert get_output. Beides passiert ohne await
+        dazwischen, so dass beim Übergang keine Zeile fehlt.
+        """
+        output = self._output.get(task_id)
+        if output is None:
+            # Bereits abgeschlossen: sofort beenden statt ewig zu warten
+            task = task_store.get(task_id)
+            subscriber = BoundedSubscriber(0, position=task.output_lines if task else 0)
+            subscriber.finish()
+            return subscriber
+        subscriber = BoundedSubscriber(
+            settings.task_subscriber_buffer,
+            policy or settings.task_subscriber_overflow,
+            position=output.total,
+        )
+        self._subscribers.setdefault(task_id, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, task_id: str, subscriber: BoundedSubscriber[str]):
+        """Entfernt einen Zuschauer."""
         if task_id in self._subscribers:
             try:
-                self._subscribers[task_id].remove(queue)
+                self._subscribers[task_id].remove(subscriber)
             except ValueError:
                 pass
 
     def get_task(self, task_id: str) -> TaskInfo | None:
-        return self._tasks.get(task_id)
+        return self._tasks.get(task_id) or task_store.get(task_id)
 
-    def get_output(self, task_id: str) -> list[str]:
-        return self._output.get(task_id, [])
+    async def get_output(self, task_id: str, offset: int = 0, limit: int | None = None) -> list[str]:
+        """Output-Zeilen ab offset; ältere Zeilen kommen aus dem gzip-Log."""
+        output = self._output.get(task_id)
+        if output is None:
+            # Abgeschlossener Task: nur noch das Log
+            try:
+                return await asyncio.to_thread(read_lines, output_path(task_id), offset, limit)
+            except (OSError, zlib.error):
+                return []
+        if offset >= output.first_buffered:
+            return output.buffered(offset, limit)
+        # Flush im Event-Loop (dort wird geschrieben), Lesen im Thread
+        output.sync()
+        return await asyncio.to_thread(output.read, offset, limit)
 
-    def list_tasks(self) -> list[TaskInfo]:
-        return list(self._tasks.values())
+    def list_tasks(
+        self,
+        host: str | None = None,
+        task_type: str | None = None,
+        status: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> tuple[list[TaskInfo], int]:
+        """Tasks nach Filtern, neueste zuerst; gibt (seite, gesamtanzahl) zurück."""
+        tasks, total = task_store.query(host, task_type, status, since, until, limit, offset)
+        # Laufende Tasks mit aktuellem Zeilenzähler aus dem Speicher
+        return [self._tasks.get(t.task_id, t) for t in tasks], total
 
-    def cleanup_old_tasks(self, max_age_hours: int = 24):
-        """Entfernt abgeschlossene Tasks älter als max_age_hours."""
+    @staticmethod
+    def _rewrite_log(path: str, last_line: str) -> int:
+        """Schreibt den lesbaren Teil eines Logs als vollständiges gzip neu.
+
+        Das letzte Member eines abgebrochenen Tasks ist nicht abgeschlossen;
+        statt ein weiteres anzuhängen, wird alles Lesbare plus last_line in
+        eine neue Datei geschrieben. Gibt die Zeilenzahl zurück.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        count = 0
+        with gzip.open(tmp, "wb") as out:
+            if os.path.exists(path):
+                for line in _read_log(path):
+                    out.write(line.encode("utf-8", "replace") + b"\n")
+                    count += 1
+            out.write(last_line.encode() + b"\n")
+        os.replace(tmp, path)
+        return count + 1
+
+    def _recover_interrupted(self) -> None:
+        """Markiert Tasks, die ein Neustart unterbrochen hat, und schließt ihr Log ab."""
         now = datetime.now(timezone.utc)
-        to_remove = []
-        for task_id, task in self._tasks.items():
-            if task.status in (TaskStatus.completed, TaskStatus.failed):
-                if task.finished_at:
-                    finished = datetime.fromisoformat(task.finished_at)
-                    if (now - finished).total_seconds() > max_age_hours * 3600:
-                        to_remove.append(task_id)
-        for task_id in to_remove:
-            self._tasks.pop(task_id, None)
-            self._output.pop(task_id, None)
-            self._subscribers.pop(task_id, None)
+        task_ids = task_store.mark_interrupted(now.timestamp())
+        for task_id in task_ids:
+            path = output_path(task_id)
+            try:
+                lines = self._rewrite_log(
+                    path, f"ABGEBROCHEN: Backend wurde neu gestartet ({now.isoformat()})"
+                )
+                task_store.set_output_lines(task_id, lines)
+            except OSError as e:
+                logger.warning("Task-Log %s nicht abschließbar: %s", path, e)
+        if task_ids:
+            logger.info("%d Tasks durch Neustart unterbrochen", len(task_ids))
+
+    def cleanup_old_tasks(self, max_age_hours: int = 24):
+        """Entfernt abgeschlossene Tasks älter als max_age_hours samt Log-Datei."""
+        cutoff = time.time() - max_age_hours * 3600
+        removed = task_store.delete_finished_before(cutoff)
+        for task_id in removed:
+            try:
+                os.remove(output_path(task_id))
+            except OSError:
+                pass
+
+        # Logs ohne Eintrag in der DB
+        try:
+            entries = list(os.scandir(output_dir()))
+        except OSError:
+            entries = []
+        for entry in entries:
+            task_id = entry.name.split(".", 1)[0]
+            try:
+                if (
+                    task_id not in self._tasks
+                    and entry.stat().st_mtime < cutoff
+                    and task_store.get(task_id) is None
+                ):
+                    os.remove(entry.path)
+            except OSError:
+                pass
+        if removed:
+            logger.info("%d abgeschlossene Tasks entfernt", len(removed))
+
+    async def _sweep(self) -> None:
+        while True:
+            try:
+                self.cleanup_old_tasks(settings.task_retention_hours)
+            except Exception as e:
+                logger.warning("Aufräumen der Tasks fehlgeschlagen: %s", e)
+            await asyncio.sleep(settings.task_sweep_interval)
+
+    async def _flush_logs(self) -> None:
+        """Flusht die Logs laufender Tasks, damit die Datei höchstens
+        task_log_flush_interval hinterherhinkt (auch wenn ein Task still ist)."""
+        while True:
+            await asyncio.sleep(settings.task_log_flush_interval)
+            for output in list(self._output.values()):
+                if output.dirty:
+                    output.sync()
+
+    def start(self) -> None:
+        self._recover_interrupted()
+        if settings.task_sweep_interval > 0 and self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep())
+        if settings.task_log_flush_interval > 0 and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_logs())
+
+    def stop(self) -> None:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for output in self._output.values():
+            output.close()
+        task_store.close()
 
 
 # Globale Instanz
@@ -0,0 +1,176 @@
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+from ..config import settings
+from ..models.task import TaskInfo, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    host TEXT NOT NULL DEFAULT '',
+    started REAL NOT NULL,
+    finished REAL,
+    exit_code INTEGER,
+    output_lines INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_started ON tasks(started);
+CREATE INDEX IF NOT EXISTS idx_tasks_host_started ON tasks(host, started);
+CREATE INDEX IF NOT EXISTS idx_tasks_type_started ON tasks(type, started);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_started ON tasks(status, started);
+CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks(finished);
+"""
+
+ACTIVE_STATUSES = (TaskStatus.pending.value, TaskStatus.running.value)
+
+
+def _ts(iso: str) -> float | None:
+    return datetime.fromisoformat(iso).timestamp() if iso else None
+
+
+def _iso(ts: float | None) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else ""
+
+
+class TaskStore:
+    """SQLite-Datenbank für Task-Metadaten (tasks.db in data_dir).
+
+    Der Output liegt als gzip-Log daneben (siehe task_manager); hier
+    stehen nur Status, Zeiten und Zeilenzahl, damit die Task-Liste einen
+    Neustart des Backends übersteht und gefiltert abgefragt werden kann.
+    """
+
+    def __init__(self):
+        self._db: sqlite3.Connection | None = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        path = os.path.join(settings.data_dir, "tasks.db")
+        try:
+            os.makedirs(settings.data_dir, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Task-DB %s nicht nutzbar (%s), verwende In-Memory-DB", path, e)
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.executescript(SCHEMA)
+        return db
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    @staticmethod
+    def _row_to_task(row: sqlite3.Row) -> TaskInfo:
+        return TaskInfo(
+            task_id=row["task_id"],
+            type=row["type"],
+            description=row["description"],
+            status=row["status"],
+            host=row["host"],
+            started_at=_iso(row["started"]),
+            finished_at=_iso(row["finished"]),
+            exit_code=row["exit_code"],
+            output_lines=row["output_lines"],
+        )
+
+    def save(self, task: TaskInfo) -> None:
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, type, description, status, host, "
+                "started, finished, exit_code, output_lines) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task.task_id,
+                    task.type,
+                    task.description,
+                    task.status.value,
+                    task.host,
+                    _ts(task.started_at),
+                    _ts(task.finished_at),
+                    task.exit_code,
+                    task.output_lines,
+                ),
+            )
+
+    def get(self, task_id: str) -> TaskInfo | None:
+        row = self.db.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def query(
+        self,
+        host: str | None = None,
+        task_type: str | None = None,
+        status: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> tuple[list[TaskInfo], int]:
+        """Tasks nach Filtern, neueste zuerst; gibt (seite, gesamtanzahl) zurück."""
+        clauses, params = [], []
+        for column, value in (("host", host), ("type", task_type), ("status", status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("started >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("started < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        total = self.db.execute(f"SELECT COUNT(*) FROM tasks{where}", params).fetchone()[0]
+        rows = self.db.execute(
+            f"SELECT * FROM tasks{where} ORDER BY started DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        return [self._row_to_task(row) for row in rows], total
+
+    def mark_interrupted(self, now: float) -> list[str]:
+        """Setzt Tasks, die beim letzten Beenden noch liefen, auf interrupted."""
+        with self.db:
+            ids = [
+                row[0] for row in self.db.execute(
+                    f"SELECT task_id FROM tasks WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                    ACTIVE_STATUSES,
+                )
+            ]
+            self.db.executemany(
+                "UPDATE tasks SET status = ?, finished = ? WHERE task_id = ?",
+                [(TaskStatus.interrupted.value, now, task_id) for task_id in ids],
+            )
+        return ids
+
+    def set_output_lines(self, task_id: str, lines: int) -> None:
+        with self.db:
+            self.db.execute("UPDATE tasks SET output_lines = ? WHERE task_id = ?", (lines, task_id))
+
+    def delete_finished_before(self, cutoff: float) -> list[str]:
+        """Entfernt abgeschlossene Tasks, die vor cutoff endeten; gibt ihre IDs zurück."""
+        with self.db:
+            ids = [
+                row[0] for row in self.db.execute(
+                    "SELECT task_id FROM tasks WHERE finished IS NOT NULL AND finished < ?",
+                    (cutoff,),
+                )
+            ]
+            self.db.execute("DELETE FROM tasks WHERE finished IS NOT NULL AND finished < ?", (cutoff,))
+        return ids
+
+
+# Globale Instanz
+task_store = TaskStore()
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import re
+import secrets
+import string
+from collections import OrderedDict
+
+from ..models.deploy import Template
+
+# Wie deploy_files in vps-cli.sh: diese Dateien bleiben auf dem Proxy
+EXCLUDED_FILES = {"template.conf", "authelia.conf", ".gitkeep"}
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}")
+
+# Wie `openssl rand -base64 32 | tr -d '/+=' | head -c 32` in vps-cli.sh
+_GENERATE_ALPHABET = string.ascii_letters + string.digits
+_GENERATE_LENGTH = 32
+
+
+class TemplateError(ValueError):
+    """Template kann nicht vollständig gerendert werden."""
+
+
+class CompiledFile:
+    """Einmal zerlegte Datei: Text-Stücke im Wechsel mit Platzhalter-Namen."""
+
+    __slots__ = ("parts", "names")
+
+    def __init__(self, content: str):
+        # re.split mit Gruppe: [text, name, text, name, ..., text]
+        self.parts = PLACEHOLDER_RE.split(content)
+        self.names = frozenset(self.parts[1::2])
+
+    def render(self, values: dict[str, str]) -> str:
+        parts = list(self.parts)
+        parts[1::2] = [values[name] for name in self.parts[1::2]]
+        return "".join(parts)
+
+
+class RenderedTemplate:
+    """Ergebnis eines Render-Durchlaufs, bereit zum Übertragen."""
+
+    def __init__(
+        self,
+        files: list[tuple[str, bytes, int]],
+        values: dict[str, str],
+        profiles: list[str],
+        generated: list[str],
+    ):
+        self.files = files  # (relativer Pfad, Inhalt, Dateirechte)
+        self.values = values
+        self.profiles = profiles
+        self.generated = generated
+
+    def env_file(self) -> bytes:
+        """Inhalt der .env; aktive Profile gelten so auch für spätere compose-Aufrufe."""
+        lines = [f"{k}={v}\n" for k, v in self.values.items()]
+        if self.profiles:
+            lines.append(f"COMPOSE_PROFILES={','.join(self.profiles)}\n")
+        return "".join(lines).encode("utf-8")
+
+
+def template_files(template_dir: str) -> list[str]:
+    """Relative Pfade aller zu übertragenden Dateien, sortiert."""
+    files = []
+    for root, dirs, names in os.walk(template_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name in EXCLUDED_FILES:
+                continue
+            files.append(os.path.relpath(os.path.join(root, name), template_dir))
+    return files
+
+
+def _condition_met(condition: str, values: dict[str, str]) -> bool:
+    """Bedingung im Format VARIABLE=wert1,wert2."""
+    if not condition:
+        return True
+    var, _, allowed = condition.partition("=")
+    return values.get(var, "") in allowed.split(",")
+
+
+def generate_secret() -> str:
+    return "".join(secrets.choice(_GENERATE_ALPHABET) for _ in range(_GENERATE_LENGTH))
+
+
+class TemplateEngine:
+    """Rendert Template-Verzeichnisse in einem Durchlauf pro Datei.
+
+    Jede Datei wird nur einmal in Text und Platzhalter zerlegt; das
+    Ergebnis wird über den SHA-256 des Inhalts gecacht, so dass
+    wiederholte Deploys nur noch die Werte einsetzen. Fehlende Werte und
+    unbekannte Platzhalter werden gesammelt gemeldet, bevor etwas auf
+    einen Host geht.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._cache: OrderedDict[str, CompiledFile | None] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, data: bytes) -> CompiledFile | None:
+        """Zerlegt einen Dateiinhalt; None für Binärdateien (werden unverändert übertragen)."""
+        key = hashlib.sha256(data).hexdigest()
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self.misses += 1
+        try:
+            compiled = CompiledFile(data.decode("utf-8"))
+        except UnicodeDecodeError:
+            compiled = None
+        self._cache[key] = compiled
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return compiled
+
+    def resolve(
+        self,
+        template: Template,
+        given: dict[str, str],
+        host_ip: str,
+        auth: bool = False,
+    ) -> tuple[dict[str, str], set[str], list[str], list[str]]:
+        """Ermittelt alle Werte in der Reihenfolge von vps-cli.sh.
+
+        Gibt (werte, inaktive variablen, fehlende variablen, generierte variablen)
+        zurück. Übergebene Werte ohne Template-Variable werden übernommen.
+        """
+        declared = {v.name for v in template.variables}
+        values = {k: v for k, v in given.items() if k not in declared}
+        inactive: set[str] = set()
+        missing: list[str] = []
+        generated: list[str] = []
+
+        for var in template.variables:
+            if not _condition_met(var.condition, values):
+                inactive.add(var.name)
+                continue
+            value = given.get(var.name, "")
+            if not value and var.type == "generate":
+                value = generate_secret()
+                generated.append(var.name)
+            elif not value and var.default:
+                value = var.default
+            elif not value and var.type in ("required", "secret"):
+                missing.append(var.name)
+                continue
+            values[var.name] = value
+
+        values["HOST_IP"] = host_ip
+        values.update(template.defaults)
+        if auth:
+            values.update(template.authelia_vars)
+        return values, inactive, missing, generated
+
+    def render(
+        self,
+        template_dir: str,
+        template: Template,
+        given: dict[str, str],
+        host_ip: str,
+        auth: bool = False,
+    ) -> RenderedTemplate:
+        """Rendert alle Dateien eines Templates; TemplateError bei Lücken."""
+        values, inactive, missing, generated = self.resolve(template, given, host_ip, auth)
+        # Platzhalter inaktiver Variablen werden leer ersetzt
+        substitutions = {name: "" for name in inactive}
+        substitutions.update(values)
+
+        files = []
+        unresolved: dict[str, list[str]] = {}
+        for rel_path in template_files(template_dir):
+            path = os.path.join(template_dir, rel_path)
+            with open(path, "rb") as f:
+                data = f.read()
+            mode = os.stat(path).st_mode & 0o777
+            compiled = self.compile(data)
+            if compiled is not None:
+                # Fehlende Pflichtwerte werden unten einmal gemeldet
+                unknown = compiled.names - substitutions.keys() - set(missing)
+                if unknown:
+                    unresolved[rel_path] = sorted(unknown)
+                if unknown or missing:
+                    continue
+                data = compiled.render(substitutions).encode("utf-8")
+            files.append((rel_path, data, mode))
+
+        errors = []
+        if missing:
+            errors.append(f"Fehlende Werte: {', '.join(missing)}")
+        for rel_path, names in unresolved.items():
+            errors.append(f"Unbekannte Platzhalter in {rel_path}: {', '.join(names)}")
+        if errors:
+            raise TemplateError("; ".join(errors))
+
+        profiles = sorted({
+            rule.profile for rule in template.profile_rules if values.get(rule.variable) == rule.value
+        })
+        return RenderedTemplate(files, values, profiles, generated)
+
+    def stats(self) -> dict:
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+# Globale Instanz
+template_engine = TemplateEngine()
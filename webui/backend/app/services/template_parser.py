@@ -1,8 +1,12 @@
+import logging
 import os
 import re
+import time
 
 from ..config import settings
-from ..models.deploy import Template, TemplateVariable
+from ..models.deploy import Template, TemplateProfile, TemplateRoute, TemplateVariable
+
+logger = logging.getLogger(__name__)
 
 
 def parse_template_conf(template_dir: str) -> Template | None:
@@ -27,8 +31,10 @@ def parse_template_conf(template_dir: str) -> Template | None:
     with open(conf_path, "r") as f:
         content = f.read()
 
-    name = _extract_value(content, "TEMPLATE_NAME") or os.path.basename(template_dir)
+    directory = os.path.basename(os.path.normpath(template_dir))
+    name = _extract_value(content, "TEMPLATE_NAME") or directory
     description = _extract_value(content, "TEMPLATE_DESCRIPTION") or ""
+    route_port = _extract_value(content, "TEMPLATE_ROUTE_PORT") or ""
 
     # Variablen parsen
     variables = []
@@ -47,48 +53,164 @@ def parse_template_conf(template_dir: str) -> Template | None:
 
     # Compose-Profile parsen
     profiles = []
+    profile_rules = []
     profiles_block = _extract_array(content, "TEMPLATE_COMPOSE_PROFILES")
     for profile_line in profiles_block:
         parts = profile_line.split("|")
         if len(parts) >= 3:
             profiles.append(parts[2])
+            profile_rules.append(TemplateProfile(variable=parts[0], value=parts[1], profile=parts[2]))
     profiles = list(set(profiles))
 
+    # Weitere Routen (z.B. Paperless-AI)
+    additional_routes = []
+    for route_line in _extract_array(content, "TEMPLATE_ADDITIONAL_ROUTES"):
+        domain_var, _, port = route_line.partition("|")
+        if domain_var and port.isdigit():
+            additional_routes.append(TemplateRoute(domain_var=domain_var, port=int(port)))
+
+    # Interne Variablen ohne Abfrage
+    defaults = _extract_assignments(_extract_array(content, "TEMPLATE_DEFAULTS"))
+
     # Authelia-Integration prüfen
     authelia_conf = os.path.join(template_dir, "authelia.conf")
     has_authelia = os.path.exists(authelia_conf)
+    authelia_vars = {}
+    if has_authelia:
+        with open(authelia_conf, "r") as f:
+            authelia_vars = _extract_assignments(_extract_array(f.read(), "AUTHELIA_TEMPLATE_VARS"))
 
     return Template(
         name=name,
+        directory=directory,
         description=description,
+        deploy_dir=_extract_value(content, "TEMPLATE_DEPLOY_DIR") or f"/opt/{directory}",
+        requires_docker=_extract_value(content, "TEMPLATE_REQUIRES_DOCKER") == "true",
+        requires_route=_extract_value(content, "TEMPLATE_REQUIRES_ROUTE") == "true",
+        route_port=int(route_port) if route_port.isdigit() else None,
+        additional_routes=additional_routes,
         variables=variables,
         has_authelia=has_authelia,
         profiles=profiles,
+        profile_rules=profile_rules,
+        defaults=defaults,
+        authelia_vars=authelia_vars,
     )
 
 
-def list_templates() -> list[Template]:
-    """Listet alle verfügbaren Templates."""
-    templates = []
-    templates_dir = settings.templates_dir
+class TemplateCatalog:
+    """Alle Templates, einmal geparst und nach Namen indiziert.
 
-    if not os.path.exists(templates_dir):
-        return templates
+    Nachgeschlagen wird nach Verzeichnisname und (case-insensitiv) nach
+    Verzeichnis- oder Anzeigename. Höchstens alle templates_check_interval
+    Sekunden wird ein Fingerabdruck aus den mtimes von templates_dir und den
+    Konfigurationsdateien geprüft; nur wenn er sich ändert, wird neu
+    geparst. Dazwischen sind Zugriffe reine Dict-Lookups, invalidate()
+    erzwingt die Prüfung sofort.
+    """
 
-    for entry in sorted(os.listdir(templates_dir)):
-        template_dir = os.path.join(templates_dir, entry)
-        if os.path.isdir(template_dir):
-            template = parse_template_conf(template_dir)
-            if template:
-                templates.append(template)
+    CONF_FILES = ("template.conf", "authelia.conf")
+
+    def __init__(self):
+        self._templates: dict[str, Template] = {}
+        self._index: dict[str, str] = {}  # casefold(Name) -> Verzeichnis
+        self._fingerprint: tuple | None = None
+        self._checked_at = 0.0
+
+    def _current_fingerprint(self) -> tuple:
+        root = settings.templates_dir
+        try:
+            entries = sorted(os.scandir(root), key=lambda e: e.name)
+            stamps = [os.stat(root).st_mtime_ns]
+        except FileNotFoundError:
+            return ()
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            stamps.append(entry.name)
+            for conf in self.CONF_FILES:
+                try:
+                    stamps.append(os.stat(os.path.join(entry.path, conf)).st_mtime_ns)
+                except FileNotFoundError:
+                    stamps.append(0)
+        return tuple(stamps)
+
+    def _load(self, fingerprint: tuple) -> None:
+        templates: dict[str, Template] = {}
+        index: dict[str, str] = {}
+        root = settings.templates_dir
+        if os.path.isdir(root):
+            for entry in sorted(os.listdir(root)):
+                template_dir = os.path.join(root, entry)
+                if not os.path.isdir(template_dir):
+                    continue
+                try:
+                    template = parse_template_conf(template_dir)
+                except (OSError, ValueError) as e:
+                    logger.warning("Template %s nicht lesbar: %s", entry, e)
+                    continue
+                if template:
+                    templates[entry] = template
+        # Anzeigenamen zuerst, Verzeichnisnamen haben Vorrang
+        for entry, template in templates.items():
+            index.setdefault(template.name.casefold(), entry)
+        for entry in templates:
+            index[entry.casefold()] = entry
+        self._templates = templates
+        self._index = index
+        self._fingerprint = fingerprint
+        logger.info("Template-Katalog geladen: %d Templates", len(templates))
+
+    def _ensure_current(self) -> None:
+        now = time.monotonic()
+        if self._fingerprint is not None and now - self._checked_at < settings.templates_check_interval:
+            return
+        self._checked_at = now
+        fingerprint = self._current_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._load(fingerprint)
+
+    def load(self) -> None:
+        """Lädt den Katalog (beim Start)."""
+        self._checked_at = time.monotonic()
+        self._load(self._current_fingerprint())
+
+    def invalidate(self) -> None:
+        """Erzwingt ein Neuladen beim nächsten Zugriff (z.B. nach git pull)."""
+        self._fingerprint = None
+
+    def list(self) -> list[Template]:
+        self._ensure_current()
+        return list(self._templates.values())
+
+    def find(self, name: str) -> Template | None:
+        """Sucht nach Verzeichnisname, sonst case-insensitiv nach Verzeichnis- oder Anzeigename."""
+        self._ensure_current()
+        template = self._templates.get(name)
+        if template is None:
+            entry = self._index.get(name.casefold())
+            template = self._templates.get(entry) if entry else None
+        return template
+
+    def path(self, template: Template) -> str:
+        return os.path.join(settings.templates_dir, template.directory)
+
+
+# Globale Instanz
+template_catalog = TemplateCatalog()
 
-    return templates
+
+def list_templates() -> list[Template]:
+    """Listet alle verfügbaren Templates."""
+    return template_catalog.list()
 
 
 def _extract_value(content: str, key: str) -> str | None:
-    """Extrahiert einen einfachen Wert: KEY="value"."""
-    match = re.search(rf'^{key}="([^"]*)"', content, re.MULTILINE)
-    return match.group(1) if match else None
+    """Extrahiert einen einfachen Wert: KEY="value" oder KEY=value."""
+    match = re.search(rf'^{key}=(?:"([^"]*)"|([^\s#]*))', content, re.MULTILINE)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
 
 
 def _extract_array(content: str, key: str) -> list[str]:
@@ -102,3 +224,13 @@ def _extract_array(content: str, key: str) -> list[str]:
     block = match.group(1)
     items = re.findall(r'"([^"]*)"', block)
     return items
+
+
+def _extract_assignments(items: list[str]) -> dict[str, str]:
+    """Wandelt "KEY=VALUE"-Einträge in ein Dict um."""
+    result = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if sep:
+            result[key] = value
+    return result
@@ -17,11 +17,10 @@ export function useTaskStream() {
 
     const ws = useWebSocket(`/api/v1/tasks/ws/${id}`)
     ws.connect()
+    // Gleiches reaktives Array: Zeilen-Batches erscheinen ohne Kopie
+    output.value = ws.messages.value
 
     const interval = setInterval(() => {
-      if (ws.messages.value.length > output.value.length) {
-        output.value = [...ws.messages.value]
-      }
       if (ws.finished.value) {
         taskStatus.value = ws.status.value
         running.value = false
@@ -1,15 +1,23 @@
 import { ref, onUnmounted } from 'vue'
 
-export function useWebSocket(url: string) {
+const RECONNECT_DELAY = 1000
+
+export function useWebSocket(url: string, options: { since?: number } = {}) {
   const messages = ref<string[]>([])
   const connected = ref(false)
   const finished = ref(false)
   const status = ref<string>('')
   let ws: WebSocket | null = null
+  // Anzahl bereits empfangener Zeilen; beim Reconnect als ?since= gesendet
+  let cursor = options.since ?? 0
+  let closedByUser = false
+  let reconnectTimer: number | null = null
 
   function connect() {
+    closedByUser = false
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-    const wsUrl = `${protocol}//${window.location.host}${url}`
+    const separator = url.includes('?') ? '&' : '?'
+    const wsUrl = `${protocol}//${window.location.host}${url}${separator}since=${cursor}`
     ws = new WebSocket(wsUrl)
 
     ws.onopen = () => {
@@ -19,8 +27,20 @@ export function useWebSocket(url: string) {
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data)
-        if (data.type === 'output') {
+        if (data.type === 'lines') {
+          // Schon empfangene Zeilen überspringen (z.B. nach Reconnect)
+          const skip = Math.max(cursor - data.from, 0)
+          for (const line of data.data.slice(skip)) {
+            messages.value.push(line)
+          }
+          cursor = Math.max(cursor, data.from + data.data.length)
+        } else if (data.type === 'dropped') {
+          // Server hat für diesen Client Zeilen verworfen (Client zu langsam)
+          messages.value.push(`… ${data.count} Zeilen übersprungen …`)
+          cursor = Math.max(cursor, data.from)
+        } else if (data.type === 'output') {
           messages.value.push(data.data)
+          cursor++
         } else if (data.type === 'status') {
           status.value = data.status
           finished.value = true
@@ -35,6 +55,11 @@ export function useWebSocket(url: string) {
 
     ws.onclose = () => {
       connected.value = false
+      // Verbindung verloren (oder vom Server wegen Überlauf getrennt),
+      // Task läuft noch: ab dem Cursor fortsetzen
+      if (!finished.value && !closedByUser) {
+        reconnectTimer = window.setTimeout(connect, RECONNECT_DELAY)
+      }
     }
 
     ws.onerror = () => {
@@ -43,6 +68,11 @@ export function useWebSocket(url: string) {
   }
 
   function disconnect() {
+    closedByUser = true
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer)
+      reconnectTimer = null
+    }
     if (ws) {
       ws.close()
       ws = null
@@ -12,6 +12,7 @@ export interface TaskInfo {
   finished_at: string
   exit_code: number | null
   output_lines: number
+  queue_position: number | null
 }
 
 export const useTasksStore = defineStore('tasks', () => {